@@ -0,0 +1,349 @@
+"""
+Admission control — bounded HTTP workers and per-identity limits.
+
+ThreadingHTTPServer starts a thread per connection with no upper bound, so
+a reconnect storm or a runaway script can exhaust threads, file
+descriptors, PTYs and the Sprites API quota.  This module provides:
+
+  * BoundedHTTPServer — a fixed pool of worker threads fed from a bounded
+    queue of accepted connections.  When the queue is full the connection
+    gets an immediate raw 503 instead of a thread.
+  * AdmissionController — per-identity token buckets for API calls (and a
+    tighter one for calls that reach the upstream Sprites API) plus
+    per-identity and global caps on concurrent terminals.
+
+Identities are the strings returned by auth.check_auth().  Refusals are
+429 (this identity is over its limit) or 503 (the server as a whole is
+full), both with Retry-After, and are counted for /api/metrics/admission.
+
+With DASHBOARD_WORKERS > 1 (see prefork.py) the configured API rates are
+split evenly between worker processes, and terminal counts are kept in a
+shared file so the terminal caps hold across all of them.
+"""
+
+import fcntl
+import json
+import math
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from http.server import HTTPServer
+from pathlib import Path
+
+HTTP_WORKERS = int(os.environ.get("DASHBOARD_HTTP_WORKERS", 16))
+HTTP_QUEUE = int(os.environ.get("DASHBOARD_HTTP_QUEUE", 64))
+REQUEST_TIMEOUT = float(os.environ.get("DASHBOARD_REQUEST_TIMEOUT", 30))
+
+API_RATE = float(os.environ.get("DASHBOARD_API_RATE", 20))           # requests/s
+API_BURST = float(os.environ.get("DASHBOARD_API_BURST", 100))
+UPSTREAM_RATE = float(os.environ.get("DASHBOARD_UPSTREAM_RATE", 1))  # requests/s
+UPSTREAM_BURST = float(os.environ.get("DASHBOARD_UPSTREAM_BURST", 20))
+
+MAX_TERMINALS = int(os.environ.get("TERMINAL_MAX_SESSIONS", 32))
+MAX_TERMINALS_PER_IDENTITY = int(os.environ.get("TERMINAL_MAX_PER_IDENTITY", 8))
+
+MAX_TRACKED_IDENTITIES = 1024
+
+# Token buckets are per process; each worker gets its share of the rate
+_WORKER_SHARE = max(1, int(os.environ.get("DASHBOARD_WORKERS", 1)))
+
+
+# ---------------------------------------------------------------------------
+# Token bucket
+# ---------------------------------------------------------------------------
+
+class TokenBucket:
+    """Classic token bucket; not thread-safe (callers hold a lock)."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, n=1):
+        """Take *n* tokens.  Returns 0 if admitted, else seconds until they would be."""
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= n:
+            self.tokens -= n
+            return 0.0
+        if self.rate <= 0:
+            return 60.0
+        return (n - self.tokens) / self.rate
+
+    def full(self):
+        self._refill(time.monotonic())
+        return self.tokens >= self.burst
+
+
+# ---------------------------------------------------------------------------
+# Per-identity limits
+# ---------------------------------------------------------------------------
+
+class Refusal:
+    """Why a request was not admitted, ready to be sent as an HTTP error."""
+
+    __slots__ = ("status", "reason", "retry_after")
+
+    def __init__(self, status, reason, retry_after):
+        self.status = status
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+    @property
+    def message(self):
+        if self.status == 429:
+            return f"Too many requests ({self.reason}); retry in {self.retry_after}s"
+        return f"Server busy ({self.reason}); retry in {self.retry_after}s"
+
+
+class AdmissionController:
+    """Token buckets and terminal counts per identity, plus shed-load counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}          # (kind, identity) -> TokenBucket
+        self._terminals = {}        # identity -> terminals open in this process
+        self._shared_path = None
+        self.admitted = {"api": 0, "upstream": 0, "terminal": 0}
+        self.shed = {"api_rate": 0, "upstream_rate": 0, "terminal_identity": 0,
+                     "terminal_global": 0, "queue_full": 0}
+        self.shed_by_identity = {}
+
+    def _bucket(self, kind, identity):
+        key = (kind, identity)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= MAX_TRACKED_IDENTITIES:
+                # Forget identities whose buckets have refilled; they lose nothing
+                for k in [k for k, b in self._buckets.items() if b.full()]:
+                    del self._buckets[k]
+            if kind == "upstream":
+                bucket = TokenBucket(UPSTREAM_RATE / _WORKER_SHARE, UPSTREAM_BURST / _WORKER_SHARE)
+            else:
+                bucket = TokenBucket(API_RATE / _WORKER_SHARE, API_BURST / _WORKER_SHARE)
+            self._buckets[key] = bucket
+        return bucket
+
+    def _refuse(self, counter, identity, status, retry_after):
+        self.shed[counter] += 1
+        if identity is not None and (identity in self.shed_by_identity
+                                     or len(self.shed_by_identity) < MAX_TRACKED_IDENTITIES):
+            self.shed_by_identity[identity] = self.shed_by_identity.get(identity, 0) + 1
+        return Refusal(status, counter, retry_after)
+
+    def admit_api(self, identity, upstream=False):
+        """Charge one API call to *identity*.  Returns None or a Refusal (429)."""
+        with self._lock:
+            wait = self._bucket("api", identity).take()
+            if wait:
+                return self._refuse("api_rate", identity, 429, wait)
+            if upstream:
+                wait = self._bucket("upstream", identity).take()
+                if wait:
+                    return self._refuse("upstream_rate", identity, 429, wait)
+                self.admitted["upstream"] += 1
+            self.admitted["api"] += 1
+            return None
+
+    def share_terminals(self, path):
+        """Keep terminal counts in *path* so the caps apply across worker processes."""
+        self._shared_path = Path(path)
+        self._shared_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, self._terminal_counts():
+            pass  # publish this process and prune dead ones
+
+    @contextmanager
+    def _terminal_counts(self):
+        """
+        Yield {pid: {identity: count}} for every process; callers hold self._lock.
+
+        This process's entry is self._terminals itself, so changes to it are
+        kept (and, when shared, written back for the other workers).
+        """
+        me = str(os.getpid())
+        if self._shared_path is None:
+            yield {me: self._terminals}
+            return
+        with open(self._shared_path.with_name(self._shared_path.name + ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self._shared_path) as f:
+                        counts = json.load(f)
+                except (OSError, ValueError):
+                    counts = {}
+                for pid in list(counts):
+                    if pid != me and not _pid_alive(int(pid)):
+                        del counts[pid]
+                counts[me] = self._terminals
+                yield counts
+                tmp = self._shared_path.with_name(f".{self._shared_path.name}.{me}.tmp")
+                with open(tmp, "w") as f:
+                    json.dump({pid: c for pid, c in counts.items() if c}, f)
+                os.replace(tmp, self._shared_path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def acquire_terminal(self, identity):
+        """Reserve a terminal (PTY) slot.  Returns None or a Refusal (429/503)."""
+        with self._lock, self._terminal_counts() as counts:
+            total = sum(sum(c.values()) for c in counts.values())
+            if total >= MAX_TERMINALS:
+                return self._refuse("terminal_global", identity, 503, 5)
+            mine = sum(c.get(identity, 0) for c in counts.values())
+            if mine >= MAX_TERMINALS_PER_IDENTITY:
+                return self._refuse("terminal_identity", identity, 429, 5)
+            self._terminals[identity] = self._terminals.get(identity, 0) + 1
+            self.admitted["terminal"] += 1
+            return None
+
+    def release_terminal(self, identity):
+        with self._lock, self._terminal_counts():
+            count = self._terminals.get(identity, 0)
+            if count <= 0:
+                return
+            if count == 1:
+                del self._terminals[identity]
+            else:
+                self._terminals[identity] = count - 1
+
+    def note_queue_full(self):
+        with self._lock:
+            self.shed["queue_full"] += 1
+
+    def metrics(self):
+        with self._lock, self._terminal_counts() as counts:
+            by_identity = {}
+            for c in counts.values():
+                for identity, n in c.items():
+                    by_identity[identity] = by_identity.get(identity, 0) + n
+            return {
+                "admitted": dict(self.admitted),
+                "shed": dict(self.shed),
+                "shed_by_identity": dict(self.shed_by_identity),
+                "terminals": {
+                    "open": sum(by_identity.values()),
+                    "open_here": sum(self._terminals.values()),
+                    "by_identity": by_identity,
+                },
+                "config": {
+                    "api_rate": API_RATE,
+                    "api_burst": API_BURST,
+                    "upstream_rate": UPSTREAM_RATE,
+                    "upstream_burst": UPSTREAM_BURST,
+                    "max_terminals": MAX_TERMINALS,
+                    "max_terminals_per_identity": MAX_TERMINALS_PER_IDENTITY,
+                    "http_workers": HTTP_WORKERS,
+                    "http_queue": HTTP_QUEUE,
+                    "worker_processes": _WORKER_SHARE,
+                },
+            }
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+controller = AdmissionController()
+
+
+# ---------------------------------------------------------------------------
+# Bounded worker-pool HTTP server
+# ---------------------------------------------------------------------------
+
+def _busy_response(retry_after=1):
+    body = json.dumps({"error": "Server busy; retry shortly"}).encode()
+    return (
+        "HTTP/1.1 503 Service Unavailable\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Retry-After: {retry_after}\r\n"
+        "Connection: close\r\n\r\n"
+    ).encode() + body
+
+
+class BoundedHTTPServer(HTTPServer):
+    """
+    HTTPServer with a fixed pool of worker threads.
+
+    Terminal WebSockets hold a worker for their whole life, so the pool is
+    sized for *workers* short requests plus every terminal allowed by
+    TERMINAL_MAX_SESSIONS.  Connections beyond *backlog* waiting for a
+    worker are answered with 503 from the accept thread.  Handlers must
+    set a socket timeout (DashboardHandler.timeout = REQUEST_TIMEOUT) so
+    a client that connects and sends nothing gives its worker back.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, server_address, handler_class, workers=None, backlog=None,
+                 bind_and_activate=True):
+        super().__init__(server_address, handler_class, bind_and_activate)
+        self.workers = (workers or HTTP_WORKERS) + MAX_TERMINALS
+        self._queue = queue.Queue(maxsize=backlog or HTTP_QUEUE)
+        self._busy = 0
+        self._busy_lock = threading.Lock()
+        self._threads = []
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"http-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def process_request(self, request, client_address):
+        try:
+            self._queue.put_nowait((request, client_address))
+        except queue.Full:
+            controller.note_queue_full()
+            try:
+                request.settimeout(1)
+                request.sendall(_busy_response())
+            except OSError:
+                pass
+            self.shutdown_request(request)
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            request, client_address = item
+            with self._busy_lock:
+                self._busy += 1
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                with self._busy_lock:
+                    self._busy -= 1
+
+    def stats(self):
+        with self._busy_lock:
+            busy = self._busy
+        return {"workers": self.workers, "busy": busy, "queued": self._queue.qsize(),
+                "queue_limit": self._queue.maxsize}
+
+    def server_close(self):
+        super().server_close()
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
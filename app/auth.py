@@ -4,17 +4,34 @@ Dashboard authentication — defense-in-depth.
 
 Three auth modes checked in order:
 1. Localhost bypass — requests from 127.0.0.1 / ::1 always allowed
-2. Cloudflare Access JWT — validates exp + aud claims from Cf-Access-Jwt-Assertion header
+2. Cloudflare Access JWT — verifies the RS256 signature against the team's
+   JWKS (CF_JWKS_FILE or CF_TEAM_DOMAIN), then exp/nbf/aud/iss claims from
+   the Cf-Access-Jwt-Assertion header.  Without a JWKS source only the
+   claims are checked and the signature is left to the edge.
 3. Bearer token fallback — checks Authorization: Bearer <token> against DASHBOARD_TOKEN env var
 4. No auth configured — if neither CF_POLICY_AUD nor DASHBOARD_TOKEN is set, allow all (backward compat)
 
 /health is always exempt.
+
+Verified tokens are remembered (by SHA-256 digest) in a bounded LRU until
+their exp, so the dashboard's 10 s polling costs one hash lookup per request.
 """
 
 import base64
+import hashlib
+import hmac
 import json
 import os
+import threading
 import time
+from collections import OrderedDict
+
+JWKS_REFRESH_SECONDS = 3600
+JWKS_MIN_REFETCH_SECONDS = 60   # on unknown kid or a failed load, refetch at most this often
+VERIFIED_CACHE_SIZE = 1024
+
+# DER prefix of DigestInfo for SHA-256 (RFC 8017 Section 9.2, note 1)
+_SHA256_DIGEST_INFO = bytes.fromhex("3031300d060960864801650304020105000420")
 
 
 def _get_client_ip(handler):
@@ -30,29 +47,217 @@ def _is_localhost(ip):
     return ip in ("127.0.0.1", "::1", "::ffff:127.0.0.1")
 
 
+def _b64url_decode(data):
+    """Base64url decode, adding padding as needed."""
+    padding = 4 - len(data) % 4
+    if padding != 4:
+        data += "=" * padding
+    return base64.urlsafe_b64decode(data)
+
+
+# ---------------------------------------------------------------------------
+# JWKS
+# ---------------------------------------------------------------------------
+
+def _team_issuer():
+    """Return https://<team>.cloudflareaccess.com from CF_TEAM_DOMAIN, or None."""
+    team = os.environ.get("CF_TEAM_DOMAIN", "").strip().rstrip("/")
+    if not team:
+        return None
+    if team.startswith("https://"):
+        team = team[len("https://"):]
+    if "." not in team:
+        team += ".cloudflareaccess.com"
+    return f"https://{team}"
+
+
+class JWKSCache:
+    """
+    RSA public keys by kid, loaded from a local JWKS file or fetched from
+    the Cloudflare Access certs endpoint and refreshed periodically.
+    """
+
+    def __init__(self):
+        self._keys = {}
+        self._source = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._fetched = threading.Condition(self._lock)
+        self._fetching = False
+        self._failure = None    # (source, monotonic time, message) of a failed first load
+
+    @staticmethod
+    def source():
+        """Return the configured JWKS file path or certs URL, or None."""
+        jwks_file = os.environ.get("CF_JWKS_FILE", "")
+        if jwks_file:
+            return jwks_file
+        issuer = _team_issuer()
+        if issuer:
+            return f"{issuer}/cdn-cgi/access/certs"
+        return None
+
+    def get(self, kid):
+        """Return (n, e) for *kid*, refreshing the key set when stale or kid is unknown."""
+        source = self.source()
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                failure = self._failure
+                if (source != self._source and failure and failure[0] == source
+                        and now - failure[1] < JWKS_MIN_REFETCH_SECONDS):
+                    # Nothing loaded and the last attempt failed: back off
+                    raise ValueError(failure[2])
+                stale = (source != self._source
+                         or now - self._loaded_at > JWKS_REFRESH_SECONDS
+                         or (kid not in self._keys and now - self._loaded_at > JWKS_MIN_REFETCH_SECONDS))
+                if not stale:
+                    return self._keys.get(kid)
+                if not self._fetching:
+                    break
+                if source == self._source:
+                    # Another thread is refreshing; the current keys are still good
+                    return self._keys.get(kid)
+                # No usable key set yet: wait for the fetch in flight
+                self._fetched.wait()
+            self._fetching = True
+
+        # Fetch without the lock so requests with cached keys never wait on it
+        keys, error = None, None
+        try:
+            keys = self._load(source)
+        except (OSError, ValueError) as e:
+            error = e
+        with self._lock:
+            self._fetching = False
+            self._fetched.notify_all()
+            if keys is not None:
+                self._keys = keys
+                self._source = source
+                self._failure = None
+            elif source != self._source:
+                message = f"cannot load JWKS from {source}: {error}"
+                self._failure = (source, time.monotonic(), message)
+                raise ValueError(message)
+            # Keep serving the last good key set if a refresh fails
+            self._loaded_at = time.monotonic()
+            return self._keys.get(kid)
+
+    @staticmethod
+    def _load(source):
+        if source.startswith("https://"):
+            import urllib.request
+            with urllib.request.urlopen(source, timeout=10) as resp:
+                jwks = json.loads(resp.read().decode())
+        else:
+            with open(source) as f:
+                jwks = json.load(f)
+        keys = {}
+        for jwk in jwks.get("keys", []):
+            if jwk.get("kty") != "RSA" or "n" not in jwk or "e" not in jwk:
+                continue
+            keys[jwk.get("kid")] = (
+                int.from_bytes(_b64url_decode(jwk["n"]), "big"),
+                int.from_bytes(_b64url_decode(jwk["e"]), "big"),
+            )
+        if not keys:
+            raise ValueError("no RSA keys in JWKS")
+        return keys
+
+
+_jwks = JWKSCache()
+
+
+def _rs256_verify(signing_input, signature, key):
+    """Verify an RSASSA-PKCS1-v1_5 SHA-256 signature (RFC 8017 Section 8.2.2)."""
+    n, e = key
+    k = (n.bit_length() + 7) // 8
+    if len(signature) != k:
+        return False
+    s = int.from_bytes(signature, "big")
+    if s >= n:
+        return False
+    em = pow(s, e, n).to_bytes(k, "big")
+    t = _SHA256_DIGEST_INFO + hashlib.sha256(signing_input).digest()
+    if k < len(t) + 11:
+        return False
+    expected = b"\x00\x01" + b"\xff" * (k - len(t) - 3) + b"\x00" + t
+    return hmac.compare_digest(em, expected)
+
+
+# ---------------------------------------------------------------------------
+# Verified-token cache
+# ---------------------------------------------------------------------------
+
+_verified = OrderedDict()   # sha256(token + aud) -> (expires, identity)
+_verified_lock = threading.Lock()
+
+
+def _cache_get(digest):
+    with _verified_lock:
+        entry = _verified.get(digest)
+        if entry is None:
+            return None
+        if time.time() > entry[0]:
+            del _verified[digest]
+            return None
+        _verified.move_to_end(digest)
+        return entry[1]
+
+
+def _cache_put(digest, exp, identity):
+    # Re-verify at least every JWKS_REFRESH_SECONDS, even without an exp claim
+    expires = time.time() + JWKS_REFRESH_SECONDS
+    if exp is not None:
+        expires = min(exp, expires)
+    with _verified_lock:
+        _verified[digest] = (expires, identity)
+        _verified.move_to_end(digest)
+        while len(_verified) > VERIFIED_CACHE_SIZE:
+            _verified.popitem(last=False)
+
+
 def _check_cf_jwt(handler, audience):
-    """Validate Cloudflare Access JWT (payload only — signature verified at edge)."""
+    """Validate a Cloudflare Access JWT: RS256 signature (when a JWKS is configured) and claims."""
     token = handler.headers.get("Cf-Access-Jwt-Assertion", "")
     if not token:
         return False, "missing Cf-Access-Jwt-Assertion header"
 
+    digest = hashlib.sha256(f"{audience}\n{token}".encode()).digest()
+    identity = _cache_get(digest)
+    if identity is not None:
+        return True, identity
+
     try:
-        # JWT is header.payload.signature — we only need the payload
         parts = token.split(".")
         if len(parts) != 3:
             return False, "malformed JWT"
 
-        # Base64url decode the payload (add padding as needed)
-        payload_b64 = parts[1]
-        padding = 4 - len(payload_b64) % 4
-        if padding != 4:
-            payload_b64 += "=" * padding
-        payload = json.loads(base64.urlsafe_b64decode(payload_b64))
+        if JWKSCache.source():
+            header = json.loads(_b64url_decode(parts[0]))
+            if not isinstance(header, dict):
+                return False, "malformed JWT"
+            if header.get("alg") != "RS256":
+                return False, "unsupported JWT alg"
+            key = _jwks.get(header.get("kid"))
+            if key is None:
+                return False, "unknown JWT signing key"
+            signing_input = f"{parts[0]}.{parts[1]}".encode()
+            if not _rs256_verify(signing_input, _b64url_decode(parts[2]), key):
+                return False, "invalid JWT signature"
+
+        payload = json.loads(_b64url_decode(parts[1]))
+        if not isinstance(payload, dict):
+            return False, "malformed JWT"
+        now = time.time()
 
-        # Check expiration
+        # Check expiration / not-before
         exp = payload.get("exp")
-        if exp is not None and time.time() > exp:
+        if exp is not None and now > exp:
             return False, "token expired"
+        nbf = payload.get("nbf")
+        if nbf is not None and now < nbf:
+            return False, "token not yet valid"
 
         # Check audience
         token_aud = payload.get("aud", [])
@@ -61,20 +266,26 @@ def _check_cf_jwt(handler, audience):
         if audience not in token_aud:
             return False, "audience mismatch"
 
+        # Check issuer when the team domain is known
+        issuer = _team_issuer()
+        if issuer and payload.get("iss") != issuer:
+            return False, "issuer mismatch"
+
         identity = payload.get("email", payload.get("sub", "cf-user"))
+        _cache_put(digest, exp, identity)
         return True, identity
-    except (ValueError, KeyError, json.JSONDecodeError) as e:
+    except (ValueError, KeyError, TypeError, json.JSONDecodeError) as e:
         return False, f"JWT decode error: {e}"
 
 
 def _check_bearer_token(handler, expected_token):
-    """Check Authorization: Bearer <token> header."""
+    """Check Authorization: Bearer <token> header (constant-time compare)."""
     auth_header = handler.headers.get("Authorization", "")
     if not auth_header.startswith("Bearer "):
         return False, "missing or invalid Authorization header"
 
     token = auth_header[7:]
-    if token == expected_token:
+    if hmac.compare_digest(token.encode(), expected_token.encode()):
         return True, "bearer-token"
     return False, "invalid token"
 
@@ -0,0 +1,428 @@
+"""
+tmux checkpoints — survive sprite sleep with windows, panes and scrollback.
+
+A checkpoint records every tmux session: its windows (name, layout, which
+one is active) and their panes (working directory, running command,
+scrollback with colours).  It is taken every CHECKPOINT_INTERVAL seconds,
+on SIGTERM before the dashboard exits, and on POST /api/checkpoint (for a
+pre-sleep hook).  When the dashboard starts on a new boot (the sprite has
+woken since the checkpoint was taken) the checkpoint is restored once
+(CHECKPOINT_RESTORE=true); POST /api/checkpoint/restore does it by hand.
+
+Snapshots are cheap enough to run on a timer:
+
+  * the layout comes from one `tmux list-panes -a` call;
+  * panes whose history size, cursor and window activity have not changed
+    since the last checkpoint are not captured again;
+  * all changed panes are captured by a single tmux invocation
+    (capture-pane commands separated by marker lines);
+  * scrollback is gzipped and stored by content hash under
+    data/checkpoints/blobs/, so unchanged output is never rewritten;
+  * the manifest (data/checkpoints/latest.json) is replaced atomically
+    and blobs it no longer references are removed.
+
+Restore builds every missing session with one tmux command sequence:
+new-session / new-window / split-window in the saved order, each pane
+starting in its saved directory by printing its scrollback and then
+exec'ing the login shell, followed by select-layout and the saved active
+window and pane.  Sessions that already exist are left alone.  Programs
+other than the shell are not restarted; they are listed in the result.
+Window numbers are compacted (gaps are not kept).
+
+Snapshot and restore times are reported by GET /api/checkpoint.  In
+multi-worker mode a lock file makes sure only one worker checkpoints at a
+time.
+"""
+
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import shlex
+import subprocess
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+CHECKPOINT_INTERVAL = float(os.environ.get("CHECKPOINT_INTERVAL", 300))   # 0 disables the timer
+CHECKPOINT_RESTORE = os.environ.get("CHECKPOINT_RESTORE", "true").lower() in ("1", "true", "yes")
+TMUX_TIMEOUT = 30
+
+_PANE_FIELDS = (
+    "session_name", "window_index", "window_name", "window_layout", "window_active",
+    "window_width", "window_height", "pane_id", "pane_index", "pane_active",
+    "history_size", "history_bytes", "cursor_x", "cursor_y", "window_activity",
+    "pane_current_command", "pane_current_path",
+)
+_SHELLS = {"bash", "zsh", "sh", "fish", "dash", "ksh", "tcsh", "csh"}
+
+
+def _tmux(args, timeout=TMUX_TIMEOUT):
+    """Run tmux; (returncode, stdout bytes)."""
+    try:
+        proc = subprocess.run(["tmux", *args], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              stdin=subprocess.DEVNULL, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired):
+        return -1, b""
+    return proc.returncode, proc.stdout
+
+
+def _list_panes():
+    """One dict per pane (ordered by session, window, pane), or [] without a tmux server."""
+    fmt = "\t".join(f"#{{{f}}}" for f in _PANE_FIELDS)
+    rc, out = _tmux(["list-panes", "-a", "-F", fmt])
+    if rc != 0:
+        return []
+    panes = []
+    for line in out.decode(errors="replace").splitlines():
+        values = line.split("\t", len(_PANE_FIELDS) - 1)
+        if len(values) == len(_PANE_FIELDS):
+            panes.append(dict(zip(_PANE_FIELDS, values)))
+    return panes
+
+
+def _boot_id():
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _signature(pane):
+    return "/".join(pane[f] for f in (
+        "history_size", "history_bytes", "cursor_x", "cursor_y", "window_activity"))
+
+
+def _capture(pane_ids):
+    """{pane_id: scrollback bytes} for *pane_ids*, captured in one tmux invocation."""
+    if not pane_ids:
+        return {}
+    marker = f"checkpoint-{uuid.uuid4().hex}"
+    args = []
+    for pane_id in pane_ids:
+        if args:
+            args.append(";")
+        args += ["capture-pane", "-p", "-e", "-J", "-S", "-", "-t", pane_id,
+                 ";", "display-message", "-p", marker]
+    rc, out = _tmux(args)
+    if rc != 0:
+        return {}
+    parts = out.split(marker.encode() + b"\n")
+    # Trailing blank lines are the empty part of the screen below the cursor
+    return {pane_id: parts[i].rstrip(b"\n") + b"\n"
+            for i, pane_id in enumerate(pane_ids) if i < len(parts)}
+
+
+class Checkpointer:
+    def __init__(self, directory):
+        self.dir = Path(directory)
+        self.blob_dir = self.dir / "blobs"
+        self.manifest_path = self.dir / "latest.json"
+        self._lock_path = self.dir / ".lock"
+        self._restored_path = self.dir / "restored-boot"
+        self._lock = threading.Lock()
+        self._thread = None
+        self._known = {}           # pane_id -> (signature, blob)
+        self.last_snapshot = None
+        self.last_restore = None
+
+    # -- storage -------------------------------------------------------------
+
+    def _blob_path(self, digest):
+        return self.blob_dir / f"{digest}.gz"
+
+    def _store_blob(self, data):
+        """Write *data* compressed under its hash unless already present; (digest, bytes written)."""
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        path = self._blob_path(digest)
+        if path.exists():
+            return digest, 0
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(gzip.compress(data, compresslevel=6, mtime=0))
+        os.replace(tmp, path)
+        return digest, path.stat().st_size
+
+    def load(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_manifest(self, manifest):
+        tmp = self.manifest_path.with_name(f".{self.manifest_path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=1)
+            f.write("\n")
+        os.replace(tmp, self.manifest_path)
+
+    def _prune(self, keep):
+        for path in self.blob_dir.glob("*.gz"):
+            if path.name[:-3] not in keep:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    def _known_from_manifest(self):
+        """Pane signatures from a checkpoint taken this boot (possibly by another worker)."""
+        manifest = self.load()
+        if not manifest or manifest.get("boot_id") != _boot_id():
+            return {}
+        return {
+            pane["id"]: (pane["signature"], pane["scrollback"])
+            for session in manifest["sessions"]
+            for window in session["windows"]
+            for pane in window["panes"]
+            if pane.get("id") and pane.get("scrollback")
+        }
+
+    def _exclusive(self):
+        """Non-blocking cross-process lock file handle, or None if another worker holds it."""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        lock = open(self._lock_path, "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return None
+        return lock
+
+    # -- snapshot ------------------------------------------------------------
+
+    def snapshot(self, reason="manual"):
+        """Checkpoint all tmux sessions; returns a summary (or why nothing was written)."""
+        with self._lock:
+            lock = self._exclusive()
+            if lock is None:
+                return {"skipped": "another worker is checkpointing"}
+            try:
+                return self._snapshot(reason)
+            finally:
+                lock.close()
+
+    def _snapshot(self, reason):
+        started = time.monotonic()
+        panes = _list_panes()
+        if not panes:
+            # Right after a wake there is nothing to save; keep the last checkpoint
+            return {"skipped": "no tmux sessions"}
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+
+        if not self._known:
+            self._known = self._known_from_manifest()
+        changed = [p["pane_id"] for p in panes
+                   if self._known.get(p["pane_id"], (None, None))[0] != _signature(p)
+                   or not self._blob_path(self._known[p["pane_id"]][1]).exists()]
+        captured = _capture(changed)
+        captured_ms = (time.monotonic() - started) * 1000
+
+        known, written, sessions = {}, 0, {}
+        for p in panes:
+            pane_id = p["pane_id"]
+            if pane_id in captured:
+                blob, size = self._store_blob(captured[pane_id])
+                written += size
+            elif pane_id in self._known:
+                blob = self._known[pane_id][1]
+            else:
+                blob = None     # pane appeared between list and capture
+            known[pane_id] = (_signature(p), blob)
+
+            session = sessions.setdefault(p["session_name"], {"name": p["session_name"], "windows": []})
+            windows = session["windows"]
+            if not windows or windows[-1]["index"] != int(p["window_index"]):
+                windows.append({
+                    "index": int(p["window_index"]),
+                    "name": p["window_name"],
+                    "layout": p["window_layout"],
+                    "active": p["window_active"] == "1",
+                    "size": [int(p["window_width"]), int(p["window_height"])],
+                    "panes": [],
+                })
+            windows[-1]["panes"].append({
+                "id": pane_id,
+                "signature": known[pane_id][0],
+                "index": int(p["pane_index"]),
+                "active": p["pane_active"] == "1",
+                "cwd": p["pane_current_path"],
+                "command": p["pane_current_command"],
+                "scrollback": blob,
+            })
+        self._known = known
+
+        manifest = {
+            "version": 1,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "reason": reason,
+            "boot_id": _boot_id(),
+            "sessions": list(sessions.values()),
+        }
+        self._write_manifest(manifest)
+        self._prune({blob for _, blob in known.values() if blob})
+        self.last_snapshot = {
+            "at": manifest["created_at"],
+            "reason": reason,
+            "took_ms": round((time.monotonic() - started) * 1000, 1),
+            "capture_ms": round(captured_ms, 1),
+            "sessions": len(sessions),
+            "panes": len(panes),
+            "captured": len(captured),
+            "reused": len(panes) - len(captured),
+            "bytes_written": written,
+        }
+        return self.last_snapshot
+
+    # -- restore -------------------------------------------------------------
+
+    def _pane_command(self, pane):
+        """Shell command that replays a pane's scrollback and becomes a login shell."""
+        shell = 'exec "${SHELL:-/bin/sh}" -l'
+        if not pane.get("scrollback"):
+            return shell
+        path = self._blob_path(pane["scrollback"])
+        if not path.exists():
+            return shell
+        return f"gzip -dc {shlex.quote(str(path))} 2>/dev/null; {shell}"
+
+    def restore_commands(self, manifest, existing=()):
+        """(tmux argv, restored session names, not-restarted commands) for *manifest*."""
+        args, restored, not_restarted = [], [], []
+
+        def add(*cmd):
+            if args:
+                args.append(";")
+            args.extend(cmd)
+
+        for session in manifest.get("sessions", []):
+            name = session["name"]
+            if name in existing or not session["windows"]:
+                continue
+            target = f"={name}:"
+            windows = session["windows"]
+            for w, window in enumerate(windows):
+                for p, pane in enumerate(window["panes"]):
+                    cwd = pane["cwd"] if os.path.isdir(pane["cwd"]) else os.path.expanduser("~")
+                    command = self._pane_command(pane)
+                    if w == 0 and p == 0:
+                        width, height = window["size"]
+                        add("new-session", "-d", "-s", name, "-n", window["name"],
+                            "-x", str(width), "-y", str(height), "-c", cwd, command)
+                    elif p == 0:
+                        add("new-window", "-t", target, "-n", window["name"], "-c", cwd, command)
+                    else:
+                        add("split-window", "-t", target, "-c", cwd, command)
+                    if pane["command"] and pane["command"] not in _SHELLS:
+                        not_restarted.append({"session": name, "window": window["name"],
+                                              "command": pane["command"]})
+                # New windows and panes become current, so relative targets work
+                # whatever base-index and pane-base-index are.
+                add("select-layout", "-t", target, window["layout"])
+                active_pane = next((i for i, p in enumerate(window["panes"]) if p["active"]), 0)
+                back = len(window["panes"]) - 1 - active_pane
+                if back:
+                    add("select-pane", "-t", f"{target}.-{back}")
+            active_window = next((i for i, w in enumerate(windows) if w["active"]), 0)
+            back = len(windows) - 1 - active_window
+            if back:
+                add("select-window", "-t", f"{target}-{back}")
+            restored.append(name)
+        return args, restored, not_restarted
+
+    def restore(self):
+        """Recreate every checkpointed session that is not running; returns a summary."""
+        with self._lock:
+            started = time.monotonic()
+            manifest = self.load()
+            if manifest is None:
+                return {"restored": [], "skipped": "no checkpoint"}
+            existing = {p["session_name"] for p in _list_panes()}
+            args, restored, not_restarted = self.restore_commands(manifest, existing)
+            rc = 0
+            if args:
+                rc, _ = _tmux(args)
+            self.last_restore = {
+                "at": datetime.now(timezone.utc).isoformat(),
+                "checkpoint": manifest.get("created_at"),
+                "took_ms": round((time.monotonic() - started) * 1000, 1),
+                "restored": restored if rc == 0 else [],
+                "already_running": sorted(existing & {s["name"] for s in manifest.get("sessions", [])}),
+                "not_restarted": not_restarted,
+            }
+            if rc != 0:
+                self.last_restore["error"] = f"tmux exited with status {rc}"
+            return self.last_restore
+
+    # -- timer ---------------------------------------------------------------
+
+    def start(self):
+        """Restore after a wake if tmux is empty, then checkpoint every CHECKPOINT_INTERVAL."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="tmux-checkpoint", daemon=True)
+        self._thread.start()
+
+    def _woke_up(self):
+        """True once per boot if the checkpoint was taken before this boot."""
+        manifest = self.load()
+        if manifest is None:
+            return False
+        boot = _boot_id()
+        if boot is None:
+            return not _list_panes()
+        try:
+            restored = self._restored_path.read_text().strip()
+        except OSError:
+            restored = None
+        return manifest.get("boot_id") != boot and restored != boot
+
+    def _loop(self):
+        if CHECKPOINT_RESTORE:
+            lock = self._exclusive()
+            if lock is not None:
+                try:
+                    if self._woke_up():
+                        self.restore()
+                        self._restored_path.write_text(f"{_boot_id()}\n")
+                finally:
+                    lock.close()
+        while CHECKPOINT_INTERVAL > 0:
+            time.sleep(CHECKPOINT_INTERVAL)
+            try:
+                self.snapshot("timer")
+            except Exception:
+                import traceback
+                traceback.print_exc()
+
+    def status(self):
+        manifest = self.load()
+        return {
+            "checkpoint": {
+                "created_at": manifest.get("created_at"),
+                "reason": manifest.get("reason"),
+                "sessions": [
+                    {"name": s["name"], "windows": len(s["windows"]),
+                     "panes": sum(len(w["panes"]) for w in s["windows"])}
+                    for s in manifest.get("sessions", [])
+                ],
+            } if manifest else None,
+            "last_snapshot": self.last_snapshot,
+            "last_restore": self.last_restore,
+            "config": {"interval": CHECKPOINT_INTERVAL, "restore_on_start": CHECKPOINT_RESTORE},
+        }
+
+
+_checkpointers = {}
+
+
+def get_checkpointer(directory):
+    """The process-wide Checkpointer for *directory*."""
+    key = str(directory)
+    if key not in _checkpointers:
+        _checkpointers[key] = Checkpointer(directory)
+    return _checkpointers[key]
@@ -0,0 +1,205 @@
+"""
+Fast dashboard startup — listen first, import later.
+
+A woken sprite is not usable until the dashboard answers, so server.py
+calls start() before its heavy imports.  start() takes the listening
+socket straight away:
+
+  * systemd socket activation (LISTEN_FDS / LISTEN_PID, first fd only),
+  * a pre-bound fd from a launcher or the prefork master (DASHBOARD_LISTEN_FD),
+  * otherwise it binds WEBAPP_PORT itself (SO_REUSEPORT per worker when
+    DASHBOARD_REUSEPORT is set),
+
+and, unless DASHBOARD_FAST_START=0, runs a tiny responder thread that
+answers `GET /health` while the rest of the server is still importing.
+Every other connection is held, unread, and handed to the real server by
+handoff() once it exists, so nothing is refused during startup.
+
+Only stdlib modules that are cheap to import are used here.  lazy_module()
+defers the import of heavier subsystems (terminals, recording, urllib)
+until first attribute access.
+"""
+
+import os
+import select
+import socket
+import sys
+import threading
+
+FAST_START = os.environ.get("DASHBOARD_FAST_START", "1").lower() not in ("0", "false", "no")
+REUSEPORT = os.environ.get("DASHBOARD_REUSEPORT", "").lower() in ("1", "true", "yes")
+
+_SD_LISTEN_FDS_START = 3
+_PEEK_BYTES = 2048
+_HEALTH_REQUEST = b"GET /health HTTP/"
+_HEALTH_RESPONSE = (
+    b"HTTP/1.0 200 OK\r\n"
+    b"Content-Type: application/json\r\n"
+    b"Content-Length: 16\r\n"
+    b"Cache-Control: no-cache\r\n"
+    b"\r\n"
+    b'{"status": "ok"}'
+)
+
+listener = None
+_responder = None
+
+
+def is_master():
+    """True in the supervising process of multi-worker mode (see prefork.py)."""
+    return int(os.environ.get("DASHBOARD_WORKERS", 1)) > 1 and not os.environ.get("DASHBOARD_WORKER_ID")
+
+
+def listen_socket(port, reuseport=False):
+    """Bind a listening TCP socket on all interfaces."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuseport:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(("0.0.0.0", port))
+    sock.listen(128)
+    return sock
+
+
+def inherited_socket():
+    """The listening socket passed in by systemd or a launcher, or None."""
+    if os.environ.get("LISTEN_PID") == str(os.getpid()) and int(os.environ.get("LISTEN_FDS", 0)) >= 1:
+        fd = _SD_LISTEN_FDS_START
+        for name in ("LISTEN_PID", "LISTEN_FDS", "LISTEN_FDNAMES"):
+            os.environ.pop(name, None)
+        return socket.socket(fileno=fd)
+    if os.environ.get("DASHBOARD_LISTEN_FD"):
+        return socket.socket(fileno=int(os.environ["DASHBOARD_LISTEN_FD"]))
+    return None
+
+
+def start(port):
+    """Acquire the listening socket and, in a serving process, start answering /health."""
+    global listener, _responder
+    sock = inherited_socket()
+    if sock is None:
+        reuseport = REUSEPORT and bool(os.environ.get("DASHBOARD_WORKER_ID"))
+        if not (REUSEPORT and is_master()):
+            sock = listen_socket(port, reuseport=reuseport)
+    if sock is not None:
+        # Workers sharing one socket all select on it; losers must not block in accept()
+        sock.setblocking(False)
+    listener = sock
+    if sock is not None and FAST_START and not is_master():
+        _responder = _HealthResponder(sock)
+        _responder.start()
+    return sock
+
+
+def handoff(server):
+    """Stop the startup responder and pass the connections it held to *server*."""
+    global _responder
+    if _responder is None:
+        return
+    responder, _responder = _responder, None
+    for conn, addr in responder.stop():
+        server.process_request(conn, addr)
+
+
+class _HealthResponder(threading.Thread):
+    def __init__(self, sock):
+        super().__init__(name="startup-health", daemon=True)
+        self.sock = sock
+        self.pending = {}     # socket -> address, request not yet classified
+        self.held = []        # (socket, address) for the real server
+        self.answered = 0
+        self._stopping = False
+        self._wake_r, self._wake_w = os.pipe()
+
+    def stop(self):
+        self._stopping = True
+        os.write(self._wake_w, b"\0")
+        self.join()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+        return self.held + list(self.pending.items())
+
+    def run(self):
+        while not self._stopping:
+            readable, _, _ = select.select([self.sock, self._wake_r, *self.pending], [], [])
+            for s in readable:
+                if s is self._wake_r:
+                    continue
+                if s is self.sock:
+                    self._accept()
+                else:
+                    self._classify(s)
+
+    def _accept(self):
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            self.pending[conn] = addr
+
+    def _classify(self, conn):
+        addr = self.pending.pop(conn)
+        try:
+            head = conn.recv(_PEEK_BYTES, socket.MSG_PEEK)
+        except OSError:
+            head = b""
+        if not head:
+            conn.close()
+            return
+        end = head.find(b"\r\n\r\n")
+        if head.startswith(_HEALTH_REQUEST) and end != -1:
+            try:
+                conn.recv(end + 4)
+                conn.sendall(_HEALTH_RESPONSE)
+            except OSError:
+                pass
+            conn.close()
+            self.answered += 1
+            return
+        # Anything else (or a request still arriving) waits for the real server
+        self.held.append((conn, addr))
+
+
+_lazy_lock = threading.RLock()
+_loading = set()
+
+
+class _LazyModule(type(sys)):
+    """Module that executes itself on first attribute access.
+
+    Unlike importlib.util.LazyLoader (before Python 3.12), the load runs
+    under a lock and the module only turns into a plain module once it
+    has fully executed: a second request thread touching it meanwhile
+    waits instead of seeing it half-empty.
+    """
+
+    def __getattribute__(self, attr):
+        module_getattr = type(sys).__getattribute__
+        with _lazy_lock:
+            if type(self) is _LazyModule and id(self) not in _loading:
+                _loading.add(id(self))      # the module's own code may touch it while executing
+                try:
+                    module_getattr(self, "__spec__").loader.exec_module(self)
+                    self.__class__ = type(sys)
+                finally:
+                    _loading.discard(id(self))
+        return module_getattr(self, attr)
+
+
+def lazy_module(name):
+    """Return module *name*, imported on first attribute access."""
+    import importlib.util
+
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    module = importlib.util.module_from_spec(spec)
+    module.__class__ = _LazyModule
+    sys.modules[name] = module
+    parent, _, child = name.rpartition(".")
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
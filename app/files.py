@@ -0,0 +1,265 @@
+"""
+File transfer endpoints — /api/files/<path> under FILES_ROOT.
+
+    GET /api/files/<dir>?offset=&limit=   paginated directory listing (JSON)
+    GET /api/files/<file>                 download; Range / If-Range aware
+    PUT /api/files/<file>                 streaming upload; resumable with
+                                          Content-Range
+
+Downloads go through socket.sendfile(), which uses os.sendfile() so file
+data is copied by the kernel straight from the page cache to the socket.
+A single byte range (`bytes=a-b`, `a-`, `-n`) is answered with 206 and an
+unsatisfiable one with 416; If-Range with a stale ETag or date falls back
+to the full file.  Multi-range requests get the full file (allowed by
+RFC 9110).
+
+Uploads are read from the socket into one reusable buffer and written to
+`.<name>.part` next to the target, which is renamed into place once the
+last byte arrives, so memory use does not depend on file size and a
+half-written upload never replaces a good file.  A PUT with
+`Content-Range: bytes <start>-<end>/<total>` continues an interrupted
+upload: <start> must equal the bytes already received, which a PUT with
+`Content-Range: bytes */<total>` and an empty body reports.
+
+Every path is resolved (symlinks included) and must stay inside
+FILES_ROOT.
+"""
+
+import mimetypes
+import os
+import re
+import urllib.parse
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+
+FILES_ROOT = Path(
+    os.environ.get("DASHBOARD_FILES_ROOT")
+    or os.environ.get("WORKSPACE_DIR")
+    or os.path.expanduser("~/workspace")
+)
+
+LIST_LIMIT = 200
+LIST_LIMIT_MAX = 1000
+UPLOAD_CHUNK = 1024 * 1024
+SENDFILE_CHUNK = 64 * 1024 * 1024
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_CONTENT_RANGE = re.compile(r"^bytes (?:(\d+)-(\d+)|\*)/(\d+)$")
+
+
+class FileError(Exception):
+    def __init__(self, status, message, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def resolve(rel_path, must_exist=True):
+    """Map a URL path below /api/files/ to a real path inside FILES_ROOT."""
+    root = FILES_ROOT.resolve()
+    rel = urllib.parse.unquote(rel_path).lstrip("/")
+    target = (root / rel).resolve()
+    if target != root and root not in target.parents:
+        raise FileError(403, "Path outside the files root")
+    if must_exist and not target.exists():
+        raise FileError(404, "Not found")
+    return target
+
+
+def _relative(path):
+    rel = path.relative_to(FILES_ROOT.resolve()).as_posix()
+    return "" if rel == "." else rel
+
+
+def etag(st):
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+# ---------------------------------------------------------------------------
+# Listing
+# ---------------------------------------------------------------------------
+
+def list_dir(path, offset=0, limit=LIST_LIMIT):
+    """One page of *path*'s entries: directories first, then by name."""
+    limit = max(1, min(limit, LIST_LIMIT_MAX))
+    entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                st = entry.stat()
+                is_dir = entry.is_dir()
+            except OSError:
+                continue    # dangling symlink or vanished entry
+            entries.append((not is_dir, entry.name, st, is_dir))
+    entries.sort(key=lambda e: (e[0], e[1]))
+    page = entries[offset:offset + limit]
+    next_offset = offset + limit if offset + limit < len(entries) else None
+    return {
+        "path": _relative(path),
+        "entries": [
+            {
+                "name": name,
+                "type": "dir" if is_dir else "file",
+                "size": None if is_dir else st.st_size,
+                "mtime": int(st.st_mtime),
+            }
+            for _, name, st, is_dir in page
+        ],
+        "offset": offset,
+        "limit": limit,
+        "total": len(entries),
+        "next_offset": next_offset,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Download
+# ---------------------------------------------------------------------------
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single-range header, or None for the whole file.
+
+    Raises FileError(416) when the range cannot be satisfied.
+    """
+    if not header:
+        return None
+    m = _RANGE.match(header.strip())
+    if not m:
+        return None     # multiple or malformed ranges: send everything
+    first, last = m.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise FileError(416, "Range not satisfiable")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise FileError(416, "Range not satisfiable")
+    return start, end
+
+
+def _if_range_matches(value, st):
+    """True if If-Range *value* still describes the file (range may be honoured)."""
+    if not value:
+        return True
+    if value.startswith('"') or value.startswith("W/"):
+        return value == etag(st)
+    try:
+        return int(parsedate_to_datetime(value).timestamp()) >= int(st.st_mtime)
+    except (TypeError, ValueError):
+        return False
+
+
+def send_file(handler, path):
+    """Send *path* (or the requested range of it) with sendfile."""
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        byte_range = None
+        if _if_range_matches(handler.headers.get("If-Range"), st):
+            try:
+                byte_range = parse_range(handler.headers.get("Range"), st.st_size)
+            except FileError:
+                handler.send_response(416)
+                handler.send_header("Content-Range", f"bytes */{st.st_size}")
+                handler.send_header("Content-Length", "0")
+                handler.end_headers()
+                return
+        start, end = byte_range or (0, st.st_size - 1)
+        length = max(0, end - start + 1)
+
+        handler.send_response(206 if byte_range else 200)
+        ctype = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        handler.send_header("Content-Type", ctype)
+        handler.send_header("Content-Length", str(length))
+        handler.send_header("Accept-Ranges", "bytes")
+        handler.send_header("ETag", etag(st))
+        handler.send_header("Last-Modified", formatdate(st.st_mtime, usegmt=True))
+        handler.send_header("Content-Disposition",
+                            f"attachment; filename*=UTF-8''{urllib.parse.quote(path.name)}")
+        if byte_range:
+            handler.send_header("Content-Range", f"bytes {start}-{end}/{st.st_size}")
+        handler.end_headers()
+        handler.wfile.flush()
+
+        sent = 0
+        try:
+            while sent < length:
+                n = handler.connection.sendfile(
+                    f, offset=start + sent, count=min(SENDFILE_CHUNK, length - sent))
+                if n == 0:
+                    break   # file shrank underneath us
+                sent += n
+        except OSError:
+            pass    # client went away or timed out (socket timeout)
+        if sent < length:
+            handler.close_connection = True     # the body is short; don't reuse the connection
+
+
+# ---------------------------------------------------------------------------
+# Upload
+# ---------------------------------------------------------------------------
+
+def _part_path(path):
+    return path.with_name(f".{path.name}.part")
+
+
+def receive_file(handler, path):
+    """
+    Stream a PUT body into *path*.  Returns (status, body dict).
+
+    Raises FileError for requests that cannot be accepted.
+    """
+    if path.is_dir():
+        raise FileError(409, "Path is a directory")
+    length = handler.headers.get("Content-Length")
+    if length is None:
+        raise FileError(411, "Content-Length required")
+    try:
+        length = int(length)
+    except ValueError:
+        raise FileError(400, "Invalid Content-Length") from None
+    part = _part_path(path)
+
+    start, total = 0, length
+    content_range = handler.headers.get("Content-Range")
+    if content_range:
+        m = _CONTENT_RANGE.match(content_range.strip())
+        if not m:
+            raise FileError(400, "Malformed Content-Range")
+        first, last, total = m.groups()
+        total = int(total)
+        received = part.stat().st_size if part.exists() else 0
+        if first is None:
+            # Status query: how much of this upload has arrived?
+            return 200, {"path": _relative(path), "offset": received, "complete": False}
+        start, end = int(first), int(last)
+        if end - start + 1 != length or end >= total:
+            raise FileError(400, "Content-Range does not match Content-Length")
+        if start != received:
+            raise FileError(409, "Upload offset mismatch", offset=received)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    buf = bytearray(min(UPLOAD_CHUNK, max(length, 1)))
+    view = memoryview(buf)
+    remaining = length
+    with open(part, "r+b" if start else "wb") as out:
+        out.seek(start)
+        while remaining:
+            n = handler.rfile.readinto(view[:min(len(buf), remaining)])
+            if not n:
+                break   # client went away; keep the part file for a resume
+            out.write(view[:n])
+            remaining -= n
+        out.truncate()
+        size = out.tell()
+    if remaining:
+        raise FileError(400, "Upload body ended early", offset=size)
+    if size < total:
+        return 202, {"path": _relative(path), "offset": size, "complete": False}
+    created = not path.exists()
+    os.replace(part, path)
+    return (201 if created else 200), {"path": _relative(path), "size": size, "complete": True}
@@ -0,0 +1,124 @@
+"""
+Fleet health — one merged /api/status snapshot for every running sprite.
+
+Each running sprite's own dashboard is asked for its /api/status through
+the Sprites exec API (`curl` against localhost inside the sprite, so the
+remote dashboard sees a local caller).  Requests run concurrently on a
+small thread pool; each has FLEET_TIMEOUT seconds and the whole fan-out
+is cut off shortly after, so one hung sprite delays the snapshot by at
+most one timeout instead of adding to it.  Sprites that are not running
+are listed with their API status only — the fan-out never wakes a
+sleeping sprite.
+
+The merged snapshot is cached by the caller (a SharedCache in server.py),
+so dashboard tabs polling /api/fleet cost one fan-out per TTL.
+"""
+
+import json
+import os
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+
+FLEET_TIMEOUT = float(os.environ.get("FLEET_TIMEOUT", 5))
+FLEET_CONCURRENCY = int(os.environ.get("FLEET_CONCURRENCY", 16))
+
+
+def dashboard_get(name, path, token, api_base, port, expect):
+    """GET *path* from a sprite's own dashboard via exec; returns the parsed JSON
+    (a dict that has the key *expect* when the call worked)."""
+    query = urllib.parse.urlencode([
+        ("cmd", "curl"), ("cmd", "-fsS"), ("cmd", "-m"), ("cmd", str(max(1, int(FLEET_TIMEOUT) - 1))),
+        ("cmd", f"http://127.0.0.1:{port}{path}"),
+    ])
+    req = urllib.request.Request(
+        f"{api_base}/sprites/{urllib.parse.quote(name)}/exec?{query}",
+        data=b"",
+        headers={"Authorization": f"Bearer {token}"},
+        method="POST",
+    )
+    with urllib.request.urlopen(req, timeout=FLEET_TIMEOUT) as resp:
+        body = resp.read().decode(errors="replace")
+    data = json.loads(body)
+    # Depending on the API version the command output may come wrapped
+    if isinstance(data, dict) and expect not in data:
+        for key in ("stdout", "output"):
+            if isinstance(data.get(key), str):
+                data = json.loads(data[key])
+                break
+    return data
+
+
+def _status_via_exec(name, token, api_base, port):
+    """GET a sprite's dashboard /api/status via exec; returns the parsed status dict."""
+    data = dashboard_get(name, "/api/status", token, api_base, port, "services")
+    if not isinstance(data, dict):
+        raise ValueError("unexpected status format")
+    return data
+
+
+def _probe(sprite, token, api_base, port):
+    name = sprite.get("name") or sprite.get("id")
+    started = time.monotonic()
+    entry = {"name": name, "api_status": sprite.get("status"), "reachable": False}
+    try:
+        status = _status_via_exec(name, token, api_base, port)
+    except urllib.error.HTTPError as e:
+        entry["error"] = f"HTTP {e.code}"
+    except (urllib.error.URLError, OSError) as e:
+        entry["error"] = str(getattr(e, "reason", e))
+    except ValueError:
+        entry["error"] = "dashboard did not return JSON (not running?)"
+    else:
+        entry["reachable"] = True
+        entry["status"] = {k: status.get(k) for k in ("uptime", "hostname", "tmux", "services")}
+    entry["latency_ms"] = round((time.monotonic() - started) * 1000, 1)
+    return entry
+
+
+def collect(sprites, token, api_base, port):
+    """Probe every running sprite in *sprites* concurrently; returns the merged snapshot."""
+    started = time.monotonic()
+    running = [s for s in sprites if s.get("status") == "running"]
+    results = {}
+    if running and token:
+        workers = max(1, min(FLEET_CONCURRENCY, len(running)))
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fleet")
+        futures = {pool.submit(_probe, s, token, api_base, port): s for s in running}
+        # Queued probes start late, so allow for the number of rounds the pool needs
+        rounds = -(-len(running) // workers)
+        done, _ = wait(futures, timeout=FLEET_TIMEOUT * rounds + 1)
+        for future, sprite in futures.items():
+            name = sprite.get("name") or sprite.get("id")
+            if future in done:
+                results[name] = future.result()
+            else:
+                results[name] = {"name": name, "api_status": "running", "reachable": False,
+                                 "error": "timeout", "latency_ms": None}
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    entries, tmux_sessions, services_down = [], 0, []
+    for sprite in sprites:
+        name = sprite.get("name") or sprite.get("id")
+        entry = results.get(name) or {"name": name, "api_status": sprite.get("status"), "reachable": False}
+        status = entry.get("status") or {}
+        tmux_sessions += len(status.get("tmux") or [])
+        for service, info in (status.get("services") or {}).items():
+            if not info.get("running"):
+                services_down.append(f"{name}/{service}")
+        entries.append(entry)
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "took_ms": round((time.monotonic() - started) * 1000, 1),
+        "summary": {
+            "sprites": len(sprites),
+            "running": len(running),
+            "reachable": sum(1 for e in entries if e["reachable"]),
+            "tmux_sessions": tmux_sessions,
+            "services_down": services_down,
+        },
+        "sprites": entries,
+    }
@@ -0,0 +1,162 @@
+"""
+Terminal keepalive and idle reaper.
+
+Half-open tunnel connections otherwise keep a handler thread, a writer
+thread, a PTY and a `sprite exec` process alive until TCP gives up, which
+can take hours.  One background thread pings every live session with a
+WebSocket ping frame, measures pong round-trip time, and reaps sessions
+that miss MAX_MISSED_PONGS pongs in a row or see no input for IDLE_TIMEOUT
+seconds.  Reaping shuts the socket down, which unblocks the session's
+threads so its normal cleanup releases the PTY and process.
+
+Sessions registered here provide:
+    ping(payload) -> bool    non-blocking send of a ping frame
+    reap(reason)             tear the session down (sets reap_reason)
+    last_input               time.monotonic() of the last client input
+"""
+
+import os
+import struct
+import threading
+import time
+
+PING_INTERVAL = float(os.environ.get("TERMINAL_PING_INTERVAL", 20))
+MAX_MISSED_PONGS = int(os.environ.get("TERMINAL_MAX_MISSED_PONGS", 3))
+IDLE_TIMEOUT = float(os.environ.get("TERMINAL_IDLE_TIMEOUT", 0))  # 0 disables
+
+RTT_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class _State:
+    __slots__ = ("opened", "last_ping", "outstanding", "sent_at", "missed", "rtt_ms")
+
+    def __init__(self):
+        self.opened = time.monotonic()
+        self.last_ping = self.opened
+        self.outstanding = None
+        self.sent_at = 0.0
+        self.missed = 0
+        self.rtt_ms = None
+
+
+class Registry:
+    """Live terminal sessions plus keepalive/reaper counters."""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._seq = 0
+        self.opened_total = 0
+        self.closed_total = 0
+        self.reaped = {"missed_pong": 0, "idle": 0, "send_error": 0, "drain": 0}
+        self.rtt_counts = [0] * (len(RTT_BUCKETS_MS) + 1)
+        self.rtt_sum_ms = 0.0
+
+    def register(self, session):
+        with self._lock:
+            self._sessions[session] = _State()
+            self.opened_total += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, daemon=True)
+                self._thread.start()
+
+    def unregister(self, session):
+        """Drop *session*; counted as reaped if session.reap_reason is set."""
+        with self._lock:
+            if self._sessions.pop(session, None) is not None:
+                self.closed_total += 1
+                reason = getattr(session, "reap_reason", None)
+                if reason:
+                    self.reaped[reason] = self.reaped.get(reason, 0) + 1
+
+    def sessions(self):
+        with self._lock:
+            return list(self._sessions)
+
+    def on_pong(self, session, payload):
+        now = time.monotonic()
+        with self._lock:
+            state = self._sessions.get(session)
+            if state is None or state.outstanding != payload:
+                return
+            rtt = (now - state.sent_at) * 1000
+            state.outstanding = None
+            state.missed = 0
+            state.rtt_ms = rtt
+            self.rtt_sum_ms += rtt
+            for i, bound in enumerate(RTT_BUCKETS_MS):
+                if rtt <= bound:
+                    self.rtt_counts[i] += 1
+                    break
+            else:
+                self.rtt_counts[-1] += 1
+
+    def _loop(self):
+        tick = max(0.5, min(5.0, PING_INTERVAL / 4))
+        while True:
+            time.sleep(tick)
+            now = time.monotonic()
+            to_ping, to_reap = [], []
+            with self._lock:
+                for session, state in self._sessions.items():
+                    if IDLE_TIMEOUT and now - session.last_input > IDLE_TIMEOUT:
+                        to_reap.append((session, "idle"))
+                        continue
+                    if now - state.last_ping < PING_INTERVAL:
+                        continue
+                    if state.outstanding is not None:
+                        state.missed += 1
+                        if state.missed >= MAX_MISSED_PONGS:
+                            to_reap.append((session, "missed_pong"))
+                            continue
+                    self._seq += 1
+                    state.outstanding = struct.pack("!Q", self._seq)
+                    state.sent_at = state.last_ping = now
+                    to_ping.append((session, state.outstanding))
+
+            # A ping that cannot be sent without blocking counts as missed
+            # when the next one falls due.
+            for session, payload in to_ping:
+                session.ping(payload)
+            # The session unregisters itself (and is counted) once torn down
+            for session, reason in to_reap:
+                session.reap(reason)
+
+    def metrics(self):
+        now = time.monotonic()
+        with self._lock:
+            sessions = [
+                {
+                    "sprite": session.sprite_name or "local",
+                    "age_s": round(now - state.opened, 1),
+                    "idle_s": round(now - session.last_input, 1),
+                    "rtt_ms": round(state.rtt_ms, 1) if state.rtt_ms is not None else None,
+                    "missed_pongs": state.missed,
+                }
+                for session, state in self._sessions.items()
+            ]
+            buckets, cumulative = [], 0
+            for bound, count in zip(list(RTT_BUCKETS_MS) + ["+Inf"], self.rtt_counts):
+                cumulative += count
+                buckets.append({"le": bound, "count": cumulative})
+            return {
+                "live": len(sessions),
+                "opened_total": self.opened_total,
+                "closed_total": self.closed_total,
+                "reaped": dict(self.reaped),
+                "rtt_ms": {
+                    "buckets": buckets,
+                    "count": cumulative,
+                    "sum": round(self.rtt_sum_ms, 1),
+                },
+                "config": {
+                    "ping_interval": PING_INTERVAL,
+                    "max_missed_pongs": MAX_MISSED_PONGS,
+                    "idle_timeout": IDLE_TIMEOUT,
+                },
+                "sessions": sessions,
+            }
+
+
+registry = Registry()
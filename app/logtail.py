@@ -0,0 +1,558 @@
+"""
+Streaming log tail over WebSocket — /api/logs.
+
+    GET /api/logs                                  available sources (JSON)
+    GET /api/logs?source=<name>&lines=&q=&level=   WebSocket: follow <name>
+
+A source is a log file or a systemd journal unit.  The defaults cover the
+workspace services (a file under /var/log when they were started directly,
+otherwise their unit); LOG_SOURCES adds or overrides them as
+`name=/path/to/file` or `name=journal:<unit>`, comma separated.  Only
+named sources can be followed — clients never pass a path.
+
+Files are followed with inotify on their directory, so an idle log costs
+nothing and rotation (rename + create, or copytruncate) is picked up at
+once; without inotify the file is checked every POLL_INTERVAL seconds.
+Journal units are followed by `journalctl -f`, which applies the level
+filter itself.  Backfill reads the file backwards in BACKFILL_BLOCK chunks
+until `lines` matching lines are found, so it costs the same on a 10 GB
+log as on a small one.
+
+Filtering happens here, before anything is sent: `q` is a regular
+expression (case-insensitive) and `level` a minimum severity detected from
+the line text.  Matching lines are sent at most LOG_RATE per second
+(LOG_BURST burst); lines over the limit are dropped and counted.  The
+thread blocks while the viewer is slow to read, so nothing is buffered on
+the server — the file offset simply stops advancing.
+
+Server -> client messages are JSON text frames:
+
+    {"type": "lines", "lines": [...], "backfill": true|false}
+    {"type": "dropped", "count": N}        lines skipped by the rate limit
+    {"type": "rotated"}                    file was rotated or truncated
+    {"type": "error", "message": "..."}
+"""
+
+import ctypes
+import ctypes.util
+import json
+import os
+import re
+import select
+import shutil
+import struct
+import subprocess
+import threading
+import time
+
+from admission import TokenBucket
+from keepalive import MAX_MISSED_PONGS, PING_INTERVAL
+from terminal_ws import ws_decode_frame, ws_encode_frame
+
+LOG_RATE = float(os.environ.get("LOG_RATE", 200))      # lines/s per stream
+LOG_BURST = float(os.environ.get("LOG_BURST", 2000))
+BACKFILL_DEFAULT = 100
+BACKFILL_MAX = 5000
+BACKFILL_BLOCK = 64 * 1024
+BACKFILL_MAX_BYTES = 64 * 1024 * 1024   # stop scanning backwards after this much
+READ_CHUNK = 256 * 1024
+MAX_LINE = 16 * 1024                    # longer lines are truncated
+BATCH_LINES = 500
+POLL_INTERVAL = 1.0
+
+_DEFAULT_SOURCES = {
+    "bootstrap": ("file", "/var/log/workspace-bootstrap.log"),
+    "webapp": ("file", "/var/log/webapp.log", "webapp"),
+    "code-server": ("file", "/var/log/code-server.log", "code-server"),
+    "ttyd": ("file", "/var/log/ttyd.log", "ttyd"),
+    "cloudflared": ("file", "/var/log/cloudflared.log", "cloudflared"),
+    "preview": ("journal", "workspace-preview"),
+}
+
+LEVELS = ("debug", "info", "warning", "error")
+# journalctl -p takes the least severe priority to include
+_JOURNAL_PRIORITY = {"debug": "debug", "info": "info", "warning": "warning", "error": "err"}
+_LEVEL_WORDS = re.compile(
+    rb"\b(TRACE|DEBUG|DBG|INFO|NOTICE|WARN|WARNING|ERR|ERROR|CRIT|CRITICAL|FATAL|PANIC)\b",
+    re.IGNORECASE,
+)
+_LEVEL_RANK = {
+    b"trace": 0, b"debug": 0, b"dbg": 0,
+    b"info": 1, b"notice": 1,
+    b"warn": 2, b"warning": 2,
+    b"err": 3, b"error": 3, b"crit": 3, b"critical": 3, b"fatal": 3, b"panic": 3,
+}
+
+
+class LogError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _journal_available():
+    return bool(shutil.which("journalctl")) and os.path.isdir("/run/systemd/system")
+
+
+def sources():
+    """{name: ("file", path) | ("journal", unit)} — defaults plus LOG_SOURCES."""
+    journal = _journal_available()
+    resolved = {}
+    for name, spec in _DEFAULT_SOURCES.items():
+        kind, target, *unit = spec
+        if kind == "file" and not os.path.exists(target) and unit and journal:
+            kind, target = "journal", unit[0]
+        resolved[name] = (kind, target)
+    for item in os.environ.get("LOG_SOURCES", "").split(","):
+        name, _, target = item.strip().partition("=")
+        if not name or not target:
+            continue
+        if target.startswith("journal:"):
+            resolved[name] = ("journal", target[len("journal:"):])
+        else:
+            resolved[name] = ("file", os.path.expanduser(target))
+    return resolved
+
+
+def list_sources():
+    journal = _journal_available()
+    out = []
+    for name, (kind, target) in sorted(sources().items()):
+        available = os.path.isfile(target) if kind == "file" else journal
+        out.append({"name": name, "kind": kind, "target": target, "available": available})
+    return {"sources": out, "levels": list(LEVELS), "streams": stream_count()}
+
+
+# ---------------------------------------------------------------------------
+# Filtering
+# ---------------------------------------------------------------------------
+
+class LineFilter:
+    """Regex and minimum-level match on raw (bytes) lines."""
+
+    def __init__(self, pattern=None, level=None, detect_level=True):
+        if level and level not in LEVELS:
+            raise LogError(400, f"level must be one of {', '.join(LEVELS)}")
+        try:
+            self.regex = re.compile(pattern.encode(), re.IGNORECASE) if pattern else None
+        except re.error as e:
+            raise LogError(400, f"Invalid pattern: {e}") from None
+        self.min_rank = LEVELS.index(level) if level and detect_level else 0
+
+    def __call__(self, line):
+        if self.min_rank:
+            m = _LEVEL_WORDS.search(line, 0, 256)
+            # Lines without a level word count as info (continuations, plain output)
+            rank = _LEVEL_RANK[m.group(1).lower()] if m else 1
+            if rank < self.min_rank:
+                return False
+        return self.regex is None or self.regex.search(line) is not None
+
+
+def _decode(line):
+    return line[:MAX_LINE].decode("utf-8", errors="replace").rstrip("\r")
+
+
+# ---------------------------------------------------------------------------
+# Backfill
+# ---------------------------------------------------------------------------
+
+def read_last_lines(f, end, count, accept):
+    """
+    Last *count* lines of *f* before offset *end* for which accept(line) holds.
+
+    Reads backwards in BACKFILL_BLOCK chunks, so only the tail of the file
+    is touched.  A partial last line (no trailing newline) is skipped.
+    """
+    if count <= 0 or end <= 0:
+        return []
+    found = []
+    pos = end
+    carry = b""
+    first = True
+    while pos > 0 and len(found) < count and end - pos < BACKFILL_MAX_BYTES:
+        size = min(BACKFILL_BLOCK, pos)
+        pos -= size
+        f.seek(pos)
+        block = f.read(size) + carry
+        lines = block.split(b"\n")
+        carry = lines.pop(0)            # may continue in the previous block
+        if first:
+            if not lines:
+                carry = b""             # no newline yet: all of it is an unfinished line
+                continue
+            lines.pop()                 # text after the last newline is incomplete
+            first = False
+        for line in reversed(lines):
+            if accept(line):
+                found.append(line)
+                if len(found) == count:
+                    break
+    if pos == 0 and len(found) < count and carry and accept(carry):
+        found.append(carry)
+    found.reverse()
+    return found
+
+
+# ---------------------------------------------------------------------------
+# inotify
+# ---------------------------------------------------------------------------
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct("iIII")
+
+_libc = None
+
+
+def _inotify():
+    """libc handle with inotify functions, or None when unavailable."""
+    global _libc
+    if _libc is None:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            libc.inotify_init1.argtypes = [ctypes.c_int]
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            _libc = libc
+        except (OSError, AttributeError):
+            _libc = False
+    return _libc or None
+
+
+class DirWatch:
+    """inotify watch on a directory, reporting events for one file name in it."""
+
+    MASK = IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, path):
+        libc = _inotify()
+        if libc is None:
+            raise OSError("inotify unavailable")
+        self.name = os.path.basename(path).encode()
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        directory = os.path.dirname(os.path.abspath(path))
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, f"inotify_add_watch failed for {directory}")
+
+    def fileno(self):
+        return self.fd
+
+    def read(self):
+        """True if any pending event concerns the watched file."""
+        hit = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return hit
+            pos = 0
+            while pos + _EVENT.size <= len(data):
+                _, _, _, length = _EVENT.unpack_from(data, pos)
+                name = data[pos + _EVENT.size:pos + _EVENT.size + length].rstrip(b"\0")
+                pos += _EVENT.size + length
+                if name == self.name:
+                    hit = True
+
+    def close(self):
+        os.close(self.fd)
+
+
+# ---------------------------------------------------------------------------
+# Followers
+# ---------------------------------------------------------------------------
+
+class FileFollower:
+    """Reads complete lines appended to a file, across rotation and truncation."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.ino = None
+        self.buffer = b""
+        self.rotated = False
+        try:
+            self.watch = DirWatch(path)
+        except OSError:
+            self.watch = None
+        self._open()
+
+    def _open(self):
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return False
+        if self.file:
+            self.file.close()
+        self.file = f
+        self.ino = os.fstat(f.fileno()).st_ino
+        self.buffer = b""
+        return True
+
+    def backfill(self, count, accept):
+        if not self.file or count <= 0:
+            if self.file:
+                self.file.seek(0, os.SEEK_END)
+            return []
+        end = os.fstat(self.file.fileno()).st_size
+        lines = read_last_lines(self.file, end, count, accept)
+        self.file.seek(end)
+        return lines
+
+    def fileno(self):
+        return self.watch.fileno() if self.watch else None
+
+    def poll(self):
+        """Complete new lines since the last call."""
+        if self.watch:
+            self.watch.read()   # drain events; the file itself says what changed
+        lines = []
+        if self.file is None:
+            if not self._open():
+                return []
+            self.rotated = True
+        else:
+            lines = self._read()
+            try:
+                st = os.stat(self.path)
+            except OSError:
+                return lines    # moved away; keep the old handle until a new file appears
+            if st.st_ino != self.ino:
+                lines += self._read()   # rest of the old file first
+                if self._open():
+                    self.rotated = True
+            elif st.st_size < self.file.tell():
+                self.file.seek(0)       # copytruncate
+                self.buffer = b""
+                self.rotated = True
+        return lines + self._read()
+
+    def _read(self):
+        if self.file is None:
+            return []
+        data = self.file.read(READ_CHUNK)
+        lines = []
+        while data:
+            self.buffer += data
+            *complete, self.buffer = self.buffer.split(b"\n")
+            lines.extend(complete)
+            if len(self.buffer) > MAX_LINE:
+                lines.append(self.buffer)
+                self.buffer = b""
+            if len(lines) >= BATCH_LINES:
+                break       # the rest is read on the next round
+            data = self.file.read(READ_CHUNK)
+        return lines
+
+    def has_more(self):
+        """True if unread data is already known to be waiting (no event will announce it)."""
+        if self.file is None:
+            return False
+        try:
+            return os.fstat(self.file.fileno()).st_size > self.file.tell()
+        except OSError:
+            return False
+
+    def close(self):
+        if self.watch:
+            self.watch.close()
+        if self.file:
+            self.file.close()
+
+
+class JournalFollower:
+    """Lines from `journalctl -f -u <unit>`; backfill and level are handled by journalctl."""
+
+    def __init__(self, unit, backfill, level):
+        cmd = ["journalctl", "--follow", "--no-pager", "--quiet", "-o", "short-iso",
+               "-u", unit, "-n", str(backfill)]
+        if level:
+            cmd += ["-p", _JOURNAL_PRIORITY[level]]
+        try:
+            self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                         stdin=subprocess.DEVNULL)
+        except OSError as e:
+            raise LogError(503, f"journalctl failed: {e}") from None
+        os.set_blocking(self.proc.stdout.fileno(), False)
+        self.buffer = b""
+        self.rotated = False
+
+    def backfill(self, count, accept):
+        return []   # journalctl -n sends the backlog as its first lines
+
+    def fileno(self):
+        return self.proc.stdout.fileno()
+
+    def poll(self):
+        try:
+            data = os.read(self.fileno(), READ_CHUNK)
+        except BlockingIOError:
+            return []
+        if not data:
+            raise EOFError("journalctl exited")
+        self.buffer += data
+        *lines, self.buffer = self.buffer.split(b"\n")
+        return lines
+
+    def has_more(self):
+        return False
+
+    def close(self):
+        self.proc.kill()
+        self.proc.wait()
+        self.proc.stdout.close()
+
+
+# ---------------------------------------------------------------------------
+# WebSocket stream
+# ---------------------------------------------------------------------------
+
+_streams = set()
+_streams_lock = threading.Lock()
+
+
+def stream_count():
+    with _streams_lock:
+        return len(_streams)
+
+
+def close_all():
+    """Close every open log stream (viewers reconnect on their own)."""
+    with _streams_lock:
+        streams = list(_streams)
+    for stream in streams:
+        stream.close()
+
+
+def open_stream(query):
+    """Validate *query* and open its follower; raises LogError before any upgrade."""
+    name = query.get("source", "")
+    spec = sources().get(name)
+    if spec is None:
+        raise LogError(404, f"Unknown log source: {name}")
+    try:
+        backfill = min(int(query.get("lines", BACKFILL_DEFAULT)), BACKFILL_MAX)
+    except ValueError:
+        raise LogError(400, "lines must be an integer") from None
+    level = query.get("level") or None
+    kind, target = spec
+    accept = LineFilter(query.get("q"), level, detect_level=(kind == "file"))
+    if kind == "journal":
+        if not _journal_available():
+            raise LogError(503, "systemd journal is not available")
+        return LogStream(JournalFollower(target, max(0, backfill), level), accept, 0)
+    if not os.path.isfile(target):
+        raise LogError(404, f"Log file not found: {target}")
+    return LogStream(FileFollower(target), accept, max(0, backfill))
+
+
+class LogStream:
+    """One viewer: follower -> filter -> rate limit -> WebSocket, in a single thread."""
+
+    def __init__(self, follower, accept, backfill):
+        self.follower = follower
+        self.accept = accept
+        self.backfill = backfill
+        self.bucket = TokenBucket(LOG_RATE, LOG_BURST)
+        self.dropped = 0
+        self.sock = None
+        self._alive = True
+        self._wake_r = self._wake_w = None
+
+    def close(self):
+        self._alive = False
+        with _streams_lock:
+            if self in _streams:    # wake pipe is open only while registered
+                os.write(self._wake_w, b"\0")
+
+    def _send(self, msg):
+        self.sock.sendall(ws_encode_frame(json.dumps(msg).encode(), opcode=0x01))
+
+    def _emit(self, lines, backfill=False):
+        out = []
+        for line in lines:
+            if not self.accept(line):
+                continue
+            if self.bucket.take():
+                self.dropped += 1
+                continue
+            out.append(_decode(line))
+        for i in range(0, len(out), BATCH_LINES):
+            self._send({"type": "lines", "lines": out[i:i + BATCH_LINES], "backfill": backfill})
+        if self.dropped:
+            self._send({"type": "dropped", "count": self.dropped})
+            self.dropped = 0
+        return bool(out)
+
+    def run(self, sock):
+        self.sock = sock
+        self._wake_r, self._wake_w = os.pipe()
+        with _streams_lock:
+            _streams.add(self)
+        try:
+            self._run()
+        except (BrokenPipeError, ConnectionError, OSError):
+            pass
+        finally:
+            with _streams_lock:
+                _streams.discard(self)
+            self.follower.close()
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+            try:
+                self.sock.sendall(ws_encode_frame(b"", opcode=0x08))
+            except OSError:
+                pass
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+
+    def _run(self):
+        self._emit(self.follower.backfill(self.backfill, self.accept), backfill=True)
+        source_fd = self.follower.fileno()
+        last_sent = time.monotonic()
+        ping_outstanding, missed = None, 0
+        while self._alive:
+            timeout = 0 if self.follower.has_more() else (
+                POLL_INTERVAL if source_fd is None else PING_INTERVAL / 4)
+            rlist = [self.sock, self._wake_r] + ([source_fd] if source_fd is not None else [])
+            readable, _, _ = select.select(rlist, [], [], timeout)
+            if self.sock in readable:
+                opcode, payload = ws_decode_frame(self.sock)
+                if opcode == 0x08:
+                    return
+                if opcode == 0x09:
+                    self.sock.sendall(ws_encode_frame(payload, opcode=0x0A))
+                elif opcode == 0x0A and payload == ping_outstanding:
+                    ping_outstanding, missed = None, 0
+            if source_fd is None or source_fd in readable or self.follower.has_more():
+                try:
+                    lines = self.follower.poll()
+                except EOFError:
+                    self._send({"type": "error", "message": "log source ended"})
+                    return
+                if self.follower.rotated:
+                    self.follower.rotated = False
+                    self._send({"type": "rotated"})
+                if self._emit(lines):
+                    last_sent = time.monotonic()
+            now = time.monotonic()
+            if now - last_sent >= PING_INTERVAL:
+                # Quiet log: make sure the viewer is still there
+                if ping_outstanding is not None:
+                    missed += 1
+                    if missed >= MAX_MISSED_PONGS:
+                        return
+                ping_outstanding = struct.pack("!d", now)
+                self.sock.sendall(ws_encode_frame(ping_outstanding, opcode=0x09))
+                last_sent = now
@@ -0,0 +1,146 @@
+"""
+Supervised multi-process mode for the dashboard (DASHBOARD_WORKERS > 1).
+
+The master process holds the listening socket (bound or inherited by
+fastboot.start()) and starts N worker processes (`server.py` re-executed
+with DASHBOARD_LISTEN_FD pointing at the inherited socket), so every
+worker accepts from the same kernel queue.  With DASHBOARD_REUSEPORT=1
+each worker instead binds its own socket with SO_REUSEPORT and the kernel
+balances connections between them.
+
+The master only supervises: it restarts workers that exit (with backoff if
+they crash-loop) and on SIGHUP performs a rolling restart — a fresh worker
+is started before the old one is told to drain, so the listening socket is
+never without an acceptor.  A draining worker stops accepting, finishes
+in-flight requests and keeps its terminals open until they close or
+DASHBOARD_DRAIN_TIMEOUT passes; clients then reconnect to a new worker and
+reattach to the same tmux session.
+
+Workers re-exec the interpreter, so a rolling restart also picks up new
+code.  State shared between workers lives on disk under data/ (session and
+token stores, the sprite list cache).
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import time
+
+WORKERS = int(os.environ.get("DASHBOARD_WORKERS", 1))
+DRAIN_TIMEOUT = float(os.environ.get("DASHBOARD_DRAIN_TIMEOUT", 300))
+
+RESTART_BACKOFF_MAX = 30.0
+CRASH_WINDOW = 5.0      # a worker exiting sooner than this after start counts as a crash
+
+
+class _Worker:
+    def __init__(self, wid, proc):
+        self.id = wid
+        self.proc = proc
+        self.started = time.monotonic()
+        self.draining = False
+        self.drain_started = None
+
+
+class Master:
+    """Start, supervise and roll N worker processes."""
+
+    def __init__(self, port, workers, script, sock):
+        self.port = port
+        self.count = workers
+        self.script = script
+        self.sock = sock            # None with SO_REUSEPORT: workers bind their own
+        self.workers = {}           # slot -> _Worker
+        self.draining = []          # workers told to drain, still running
+        self.backoff = {}           # slot -> seconds before the next restart
+        self.restart_at = {}        # slot -> monotonic time a restart is due
+        self._stopping = False
+        self._reload = False
+
+    def _spawn(self, slot):
+        env = dict(os.environ, DASHBOARD_WORKER_ID=str(slot))
+        pass_fds = ()
+        if self.sock is not None:
+            env["DASHBOARD_LISTEN_FD"] = str(self.sock.fileno())
+            pass_fds = (self.sock.fileno(),)
+        proc = subprocess.Popen([sys.executable, self.script], env=env, pass_fds=pass_fds)
+        self.workers[slot] = _Worker(slot, proc)
+        print(f"Worker {slot} started (pid {proc.pid})", flush=True)
+
+    def _drain(self, worker):
+        worker.draining = True
+        worker.drain_started = time.monotonic()
+        self.draining.append(worker)
+        try:
+            worker.proc.send_signal(signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def _on_signal(self, signum, frame):
+        if signum == signal.SIGHUP:
+            self._reload = True
+        else:
+            self._stopping = True
+
+    def run(self):
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, self._on_signal)
+        mode = "shared socket" if self.sock is not None else "SO_REUSEPORT"
+        print(f"Dashboard master listening on http://0.0.0.0:{self.port} "
+              f"({self.count} workers, {mode})", flush=True)
+        for slot in range(self.count):
+            self._spawn(slot)
+        while not self._stopping:
+            if self._reload:
+                self._reload = False
+                self._rolling_restart()
+            self._supervise()
+            time.sleep(0.5)
+        self._shutdown()
+
+    def _supervise(self):
+        now = time.monotonic()
+        for slot, worker in list(self.workers.items()):
+            code = worker.proc.poll()
+            if code is None:
+                continue
+            del self.workers[slot]
+            if now - worker.started < CRASH_WINDOW:
+                self.backoff[slot] = min(RESTART_BACKOFF_MAX, self.backoff.get(slot, 0.5) * 2)
+            else:
+                self.backoff[slot] = 0.0
+            self.restart_at[slot] = now + self.backoff[slot]
+            print(f"Worker {slot} (pid {worker.proc.pid}) exited with {code}; "
+                  f"restarting in {self.backoff[slot]:.1f}s", flush=True)
+        for slot, due in list(self.restart_at.items()):
+            if due <= now and slot not in self.workers:
+                del self.restart_at[slot]
+                self._spawn(slot)
+        for worker in list(self.draining):
+            if worker.proc.poll() is not None:
+                self.draining.remove(worker)
+            elif now - worker.drain_started > DRAIN_TIMEOUT + 10:
+                worker.proc.kill()
+
+    def _rolling_restart(self):
+        print("Rolling restart", flush=True)
+        for slot, old in list(self.workers.items()):
+            self._spawn(slot)
+            # Let the replacement reach its accept loop before the old one stops
+            time.sleep(1.0)
+            self._drain(old)
+
+    def _shutdown(self):
+        print("Shutting down workers", flush=True)
+        for worker in list(self.workers.values()):
+            self._drain(worker)
+        self.workers = {}
+        deadline = time.monotonic() + DRAIN_TIMEOUT + 10
+        for worker in self.draining:
+            try:
+                worker.proc.wait(timeout=max(0.1, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                worker.proc.kill()
+        if self.sock is not None:
+            self.sock.close()
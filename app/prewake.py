@@ -0,0 +1,434 @@
+"""
+Predictive pre-wake — start sprites shortly before they are usually needed.
+
+Enabled with PREWAKE=1 on a dashboard that stays up (the scheduler can
+only wake other sprites while its own process runs).  It learns, per
+sprite, when work usually *starts*: the first use after the sprite has
+been idle for PREWAKE_IDLE_MINUTES (long enough to have gone to sleep),
+which is when a cold start is paid.  Uses come from
+
+  * this dashboard: POST /api/sprites/<name>/start and terminals opened
+    on the sprite (record_use());
+  * each sprite's own session history: while a sprite is running, its
+    /api/sessions/events (the touches its SessionStore recorded) are
+    fetched through the exec API and merged.
+
+Starts are bucketed by weekday and PREWAKE_SLOT_MINUTES time-of-day slot
+(local time, TZ).  The probability of a start in a slot is the fraction
+of that weekday's observed days (within PREWAKE_HISTORY_DAYS) that had
+one.  Once a weekday has PREWAKE_MIN_WEEKS of history, a sprite that is
+not running is woken PREWAKE_LEAD_MINUTES before every slot whose
+probability reaches PREWAKE_THRESHOLD.
+
+Each wake is scored:
+
+  hit     the sprite was used within PREWAKE_IDLE_MINUTES of the wake;
+          the minutes it sat idle before that are counted as wasted
+  miss    nobody came; it is assumed to have idled PREWAKE_IDLE_MINUTES
+          before going back to sleep, all wasted
+
+Wakes stop for the day once wasted plus expected minutes would exceed
+PREWAKE_BUDGET_MINUTES.  GET /api/prewake reports the learned windows,
+upcoming wakes, hit rate and wasted wake-minutes.  State is one JSON file
+under data/prewake/ shared by all workers; one worker runs the scheduler.
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+PREWAKE_ENABLED = os.environ.get("PREWAKE", "").strip().lower() in ("1", "true", "yes")
+PREWAKE_LEAD_MINUTES = float(os.environ.get("PREWAKE_LEAD_MINUTES", 10))
+PREWAKE_SLOT_MINUTES = int(os.environ.get("PREWAKE_SLOT_MINUTES", 30))
+PREWAKE_THRESHOLD = float(os.environ.get("PREWAKE_THRESHOLD", 0.5))
+PREWAKE_MIN_WEEKS = int(os.environ.get("PREWAKE_MIN_WEEKS", 2))
+PREWAKE_HISTORY_DAYS = int(os.environ.get("PREWAKE_HISTORY_DAYS", 42))
+PREWAKE_IDLE_MINUTES = float(os.environ.get("PREWAKE_IDLE_MINUTES", 30))
+PREWAKE_BUDGET_MINUTES = float(os.environ.get("PREWAKE_BUDGET_MINUTES", 120))
+PREWAKE_TICK = float(os.environ.get("PREWAKE_TICK", 60))
+# How often the session history of a running sprite is fetched (every tick
+# while one of its wakes is waiting to be scored)
+HARVEST_INTERVAL = 600
+DEDUPE_SECONDS = 60
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts is not None else None
+
+
+def _local_midnight(ts):
+    t = time.localtime(ts)
+    return time.mktime((t.tm_year, t.tm_mon, t.tm_mday, 0, 0, 0, 0, 0, -1))
+
+
+def slot_of(ts):
+    """(weekday, slot index) of *ts* in local time."""
+    t = time.localtime(ts)
+    return t.tm_wday, (t.tm_hour * 60 + t.tm_min) // PREWAKE_SLOT_MINUTES
+
+
+def usage_starts(uses):
+    """The uses that begin a period of work: no earlier use within PREWAKE_IDLE_MINUTES."""
+    gap = PREWAKE_IDLE_MINUTES * 60
+    starts, last = [], None
+    for ts in sorted(uses):
+        if last is None or ts - last > gap:
+            starts.append(ts)
+        last = ts
+    return starts
+
+
+def learn(uses, now):
+    """
+    Per-slot start probabilities from *uses* (unix seconds).
+
+    Returns (probabilities {(weekday, slot): p}, observed days per weekday).
+    Only weekdays with PREWAKE_MIN_WEEKS observed days get probabilities.
+    """
+    uses = [ts for ts in uses if ts >= now - PREWAKE_HISTORY_DAYS * 86400]
+    if not uses:
+        return {}, [0] * 7
+    # Every local day from the first use to yesterday counts as observed
+    observed = [0] * 7
+    day = _local_midnight(min(uses))
+    today = _local_midnight(now)
+    while day < today:
+        observed[time.localtime(day).tm_wday] += 1
+        day = _local_midnight(day + 36 * 3600)      # DST-safe step to the next midnight
+    days_with_start = {}
+    for ts in usage_starts(uses):
+        if ts >= today:
+            continue
+        days_with_start.setdefault(slot_of(ts), set()).add(_local_midnight(ts))
+    probabilities = {
+        key: len(days) / observed[key[0]]
+        for key, days in days_with_start.items()
+        if observed[key[0]] >= PREWAKE_MIN_WEEKS
+    }
+    return probabilities, observed
+
+
+def event_times(events):
+    """Unix times of session store access events ({"at": ISO 8601, ...})."""
+    out = []
+    for event in events:
+        try:
+            out.append(datetime.fromisoformat(event["at"]).timestamp())
+        except (KeyError, TypeError, ValueError):
+            continue
+    return out
+
+
+def upcoming_slots(now, horizon):
+    """Local slot start times in (now, now + horizon], with their (weekday, slot) keys."""
+    step = PREWAKE_SLOT_MINUTES * 60
+    midnight = _local_midnight(now)
+    index = int((now - midnight) // step) + 1
+    out = []
+    while True:
+        start = midnight + index * step
+        if start > now + horizon:
+            return out
+        out.append((start, slot_of(start)))
+        index += 1
+
+
+class Prewaker:
+    """
+    *list_sprites()* returns the sprite dicts from the Sprites API,
+    *wake(name)* starts one and returns True on success, and
+    *fetch_uses(name, since)* returns the use times recorded by a running
+    sprite's own session store since *since* (unix seconds).
+    """
+
+    def __init__(self, directory, list_sprites, wake, fetch_uses=None):
+        self.dir = Path(directory)
+        self._path = self.dir / "state.json"
+        self._lock_path = self.dir / "state.json.lock"
+        self._scheduler_lock_path = self.dir / "scheduler.lock"
+        self._list_sprites = list_sprites
+        self._wake = wake
+        self._fetch_uses = fetch_uses
+        self._thread = None
+        self.last_error = None
+
+    # -----------------------------------------------------------------------
+    # State
+    # -----------------------------------------------------------------------
+
+    def _read(self):
+        try:
+            with open(self._path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"version": 1, "uses": {}, "harvested": {}, "wakes": []}
+
+    def _write(self, data):
+        tmp = self._path.with_name(f".{self._path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self._path)
+
+    @contextmanager
+    def _locked(self):
+        """Read-modify-write the state under a lock shared by all workers."""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        with open(self._lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                data = self._read()
+                yield data
+                self._write(data)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _add_uses(data, sprite, times):
+        uses = data["uses"].setdefault(sprite, [])
+        known = set(int(ts) // DEDUPE_SECONDS for ts in uses)
+        for ts in times:
+            if int(ts) // DEDUPE_SECONDS not in known:
+                known.add(int(ts) // DEDUPE_SECONDS)
+                uses.append(ts)
+        uses.sort()
+
+    def record_use(self, sprite, now=None):
+        """Note that *sprite* is being used now (terminal opened, started by hand)."""
+        with self._locked() as data:
+            self._add_uses(data, sprite, [now or time.time()])
+
+    # -----------------------------------------------------------------------
+    # Scheduler
+    # -----------------------------------------------------------------------
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="prewake", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.tick()
+                self.last_error = None
+            except Exception as e:      # keep scheduling; report it in status()
+                self.last_error = f"{type(e).__name__}: {e}"
+            time.sleep(PREWAKE_TICK)
+
+    def _exclusive(self):
+        """Non-blocking cross-process lock file handle, or None if another worker holds it."""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        lock = open(self._scheduler_lock_path, "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return None
+        return lock
+
+    def tick(self, now=None):
+        """Harvest uses, score finished wakes and wake sprites due in the next lead time."""
+        lock = self._exclusive()
+        if lock is None:
+            return {"skipped": "another worker runs the scheduler"}
+        try:
+            return self._tick(now or time.time())
+        finally:
+            lock.close()
+
+    def _tick(self, now):
+        sprites = {s.get("name"): s for s in self._list_sprites() if s.get("name")}
+        state = self._read()
+        pending = {w["sprite"] for w in state["wakes"] if w["outcome"] == "pending"}
+
+        # Running sprites: merge the touches their own session store recorded
+        harvested = {}
+        if self._fetch_uses is not None:
+            for name, sprite in sprites.items():
+                last = state["harvested"].get(name, {})
+                if sprite.get("status") != "running":
+                    continue
+                if name not in pending and now - last.get("at", 0) < HARVEST_INTERVAL:
+                    continue
+                since = last.get("until", now - PREWAKE_HISTORY_DAYS * 86400)
+                try:
+                    harvested[name] = (self._fetch_uses(name, since), since)
+                except (OSError, ValueError):
+                    continue    # dashboard not up yet on a sprite that just woke
+
+        with self._locked() as data:
+            for name, (times, since) in harvested.items():
+                self._add_uses(data, name, times)
+                data["harvested"][name] = {"at": now, "until": max(times, default=since)}
+            horizon = now - PREWAKE_HISTORY_DAYS * 86400
+            for name in list(data["uses"]):
+                data["uses"][name] = [ts for ts in data["uses"][name] if ts >= horizon]
+            data["wakes"] = [w for w in data["wakes"] if w["at"] >= horizon]
+            self._score(data, now)
+            due = self._due(data, sprites, now)
+            data["wakes"].extend(due)
+            data["last_tick"] = now
+
+        woken = []
+        for wake in due:
+            ok = False
+            try:
+                ok = self._wake(wake["sprite"])
+            except OSError:
+                pass
+            if ok:
+                woken.append(wake["sprite"])
+            else:
+                with self._locked() as data:
+                    for w in data["wakes"]:
+                        if w["sprite"] == wake["sprite"] and w["slot_start"] == wake["slot_start"]:
+                            w["outcome"] = "failed"
+        return {"woken": woken, "harvested": sorted(harvested)}
+
+    @staticmethod
+    def _score(data, now):
+        idle = PREWAKE_IDLE_MINUTES * 60
+        for wake in data["wakes"]:
+            if wake["outcome"] != "pending":
+                continue
+            uses = data["uses"].get(wake["sprite"], [])
+            used = [ts for ts in uses if wake["at"] <= ts <= wake["at"] + idle]
+            if used:
+                wake["outcome"] = "hit"
+                wake["first_use"] = used[0]
+                wake["wasted_minutes"] = round((used[0] - wake["at"]) / 60, 1)
+            elif now > wake["at"] + idle + 2 * PREWAKE_TICK:
+                # Allow a couple of ticks for the sprite's own history to be fetched
+                wake["outcome"] = "miss"
+                wake["wasted_minutes"] = PREWAKE_IDLE_MINUTES
+
+    @staticmethod
+    def _spent_today(data, now):
+        midnight = _local_midnight(now)
+        spent = 0.0
+        for wake in data["wakes"]:
+            if wake["at"] < midnight:
+                continue
+            if wake["outcome"] == "pending":
+                spent += PREWAKE_LEAD_MINUTES
+            else:
+                spent += wake.get("wasted_minutes", 0)
+        return spent
+
+    def _due(self, data, sprites, now):
+        lead = PREWAKE_LEAD_MINUTES * 60
+        woken = {(w["sprite"], w["slot_start"]) for w in data["wakes"]}
+        spent = self._spent_today(data, now)
+        midnight = _local_midnight(now)
+        skipped = {(s["sprite"], s["slot_start"]) for s in data.get("skipped_budget", [])
+                   if s["slot_start"] >= midnight}
+        due = []
+        for name, uses in sorted(data["uses"].items()):
+            sprite = sprites.get(name)
+            if sprite is None or sprite.get("status") == "running":
+                continue
+            if uses and now - uses[-1] < PREWAKE_IDLE_MINUTES * 60:
+                continue    # in use; it will be running again before long
+            probabilities, _ = learn(uses, now)
+            for start, key in upcoming_slots(now, lead):
+                p = probabilities.get(key, 0)
+                if p < PREWAKE_THRESHOLD or (name, start) in woken:
+                    continue
+                if spent + PREWAKE_LEAD_MINUTES > PREWAKE_BUDGET_MINUTES:
+                    skipped.add((name, start))
+                    continue
+                spent += PREWAKE_LEAD_MINUTES
+                due.append({"sprite": name, "at": now, "slot_start": start, "p": round(p, 2),
+                            "outcome": "pending"})
+                break
+        data["skipped_budget"] = [{"sprite": n, "slot_start": start} for n, start in sorted(skipped)]
+        return due
+
+    # -----------------------------------------------------------------------
+    # Report
+    # -----------------------------------------------------------------------
+
+    def status(self, now=None):
+        now = now or time.time()
+        data = self._read()
+        wakes = data["wakes"]
+        scored = [w for w in wakes if w["outcome"] in ("hit", "miss")]
+        hits = sum(1 for w in scored if w["outcome"] == "hit")
+        sprites = {}
+        for name, uses in sorted(data["uses"].items()):
+            probabilities, observed = learn(uses, now)
+            windows = sorted((key for key, p in probabilities.items() if p >= PREWAKE_THRESHOLD))
+            lead = PREWAKE_LEAD_MINUTES * 60
+            upcoming = next((start for start, key in upcoming_slots(now + lead, 7 * 86400)
+                             if probabilities.get(key, 0) >= PREWAKE_THRESHOLD), None)
+            sprites[name] = {
+                "uses": len(uses),
+                "starts": len(usage_starts(uses)),
+                "observed_days": dict(zip(WEEKDAYS, observed)),
+                "windows": [
+                    {
+                        "weekday": WEEKDAYS[wd],
+                        "time": "%02d:%02d" % divmod(slot * PREWAKE_SLOT_MINUTES, 60),
+                        "p": round(probabilities[(wd, slot)], 2),
+                    }
+                    for wd, slot in windows
+                ],
+                "next_wake_at": _iso(upcoming - lead) if upcoming else None,
+                "last_use_at": _iso(uses[-1]) if uses else None,
+            }
+        return {
+            "enabled": PREWAKE_ENABLED,
+            "config": {
+                "lead_minutes": PREWAKE_LEAD_MINUTES,
+                "slot_minutes": PREWAKE_SLOT_MINUTES,
+                "threshold": PREWAKE_THRESHOLD,
+                "min_weeks": PREWAKE_MIN_WEEKS,
+                "history_days": PREWAKE_HISTORY_DAYS,
+                "idle_minutes": PREWAKE_IDLE_MINUTES,
+                "budget_minutes": PREWAKE_BUDGET_MINUTES,
+            },
+            "summary": {
+                "wakes": len(wakes),
+                "hits": hits,
+                "misses": len(scored) - hits,
+                "pending": sum(1 for w in wakes if w["outcome"] == "pending"),
+                "failed": sum(1 for w in wakes if w["outcome"] == "failed"),
+                "hit_rate": round(hits / len(scored), 3) if scored else None,
+                "wasted_minutes": round(sum(w.get("wasted_minutes", 0) for w in scored), 1),
+                "budget_spent_today": round(self._spent_today(data, now), 1),
+                "skipped_budget_today": len(data.get("skipped_budget", [])),
+            },
+            "sprites": sprites,
+            "recent_wakes": [
+                {
+                    "sprite": w["sprite"],
+                    "at": _iso(w["at"]),
+                    "slot_start": _iso(w["slot_start"]),
+                    "p": w.get("p"),
+                    "outcome": w["outcome"],
+                    "first_use_at": _iso(w.get("first_use")),
+                    "wasted_minutes": w.get("wasted_minutes"),
+                }
+                for w in wakes[-20:]
+            ],
+            "last_tick_at": _iso(data.get("last_tick")),
+            "last_error": self.last_error,
+        }
+
+
+_prewakers = {}
+
+
+def get_prewaker(directory, list_sprites, wake, fetch_uses=None):
+    """The process-wide Prewaker for *directory*."""
+    key = str(directory)
+    if key not in _prewakers:
+        _prewakers[key] = Prewaker(directory, list_sprites, wake, fetch_uses)
+    return _prewakers[key]
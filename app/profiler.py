@@ -0,0 +1,202 @@
+"""
+On-demand sampling profiler for the running dashboard.
+
+    GET /api/debug/profile?seconds=N&interval_ms=M   collapsed stacks
+    GET /api/debug/threads                           thread and terminal inventory
+
+profile() wakes every `interval_ms` (default 5 ms), reads the current
+frame of every thread with sys._current_frames() and counts each stack.
+Nothing is installed in the profiled threads — no settrace/setprofile —
+so the cost is paid only while a profile runs, by the profiling thread.
+Output is one line per distinct stack in the collapsed format read by
+flamegraph.pl, speedscope and inferno:
+
+    http-worker;process_request_thread (socketserver.py:691);... 42
+
+The first element is the thread name with its number dropped, so the 16
+HTTP workers (or every terminal's writer thread) fold into one tower.
+Sampling is wall-clock: a thread blocked in select() or recv() shows up
+at that call.  Per-thread CPU seconds over the same window (from
+/proc/self/task) are returned in the X-Profile-Thread-Cpu header so busy
+threads can be told from waiting ones.
+
+Only one profile runs at a time.  Both endpoints need an authenticated
+caller; they are refused when the dashboard has no auth configured.
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+
+DEFAULT_SECONDS = 10
+MAX_SECONDS = 60
+DEFAULT_INTERVAL_MS = 5
+MIN_INTERVAL_MS = 1
+MAX_DEPTH = 128
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_THREAD_NUMBER = re.compile(r"-\d+")
+
+_running = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def thread_label(name):
+    """'Thread-12 (_ws_to_pty)' -> 'Thread (_ws_to_pty)', 'http-worker-3' -> 'http-worker'."""
+    return _THREAD_NUMBER.sub("", name).replace(";", ":")
+
+
+def thread_cpu(native_id):
+    """CPU seconds used by one thread of this process, or None off Linux."""
+    try:
+        with open(f"/proc/self/task/{native_id}/stat", "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    fields = data[data.rfind(b")") + 2:].split()
+    return (int(fields[11]) + int(fields[12])) / _CLK_TCK
+
+
+def _cpu_by_thread():
+    return {t.ident: thread_cpu(t.native_id) for t in threading.enumerate()}
+
+
+def profile(seconds=DEFAULT_SECONDS, interval_ms=DEFAULT_INTERVAL_MS):
+    """
+    Sample every thread for *seconds*.
+
+    Returns (collapsed text, stats dict).  Raises ProfilerBusy if another
+    profile is running.
+    """
+    seconds = max(0.1, min(float(seconds), MAX_SECONDS))
+    interval = max(MIN_INTERVAL_MS, float(interval_ms)) / 1000
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy("a profile is already running")
+    try:
+        me = threading.get_ident()
+        labels = {}         # code object -> "func (file:line)"
+        counts = {}         # (thread label, stack tuple) -> samples
+        names = {t.ident: thread_label(t.name) for t in threading.enumerate()}
+        cpu_before = _cpu_by_thread()
+        samples = 0
+        started = time.monotonic()
+        deadline = started + seconds
+        next_tick = started
+        while True:
+            frames = sys._current_frames()
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_DEPTH:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = (
+                            f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                        ).replace(";", ":")
+                    stack.append(label)
+                    frame = frame.f_back
+                name = names.get(ident)
+                if name is None:
+                    # Thread started after the profile began
+                    names = {t.ident: thread_label(t.name) for t in threading.enumerate()}
+                    name = names.get(ident, "unknown")
+                key = (name, tuple(reversed(stack)))
+                counts[key] = counts.get(key, 0) + 1
+            del frames, frame
+            samples += 1
+            next_tick += interval
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if next_tick > now:
+                time.sleep(next_tick - now)
+            else:
+                next_tick = now     # fell behind; don't try to catch up
+        elapsed = time.monotonic() - started
+        cpu_after = _cpu_by_thread()
+    finally:
+        _running.release()
+
+    lines = [
+        ";".join((name,) + stack) + f" {count}"
+        for (name, stack), count in sorted(counts.items(), key=lambda kv: -kv[1])
+    ]
+    cpu = {}
+    for ident, after in cpu_after.items():
+        before = cpu_before.get(ident)
+        if after is not None and before is not None and after > before:
+            label = names.get(ident, str(ident))
+            cpu[label] = round(cpu.get(label, 0.0) + after - before, 3)
+    stats = {
+        "seconds": round(elapsed, 3),
+        "interval_ms": interval * 1000,
+        "samples": samples,
+        "stacks": len(lines),
+        "thread_cpu_s": dict(sorted(cpu.items(), key=lambda kv: -kv[1])),
+    }
+    return "\n".join(lines) + "\n", stats
+
+
+# ---------------------------------------------------------------------------
+# Inventory
+# ---------------------------------------------------------------------------
+
+def threads():
+    """Every thread with its CPU time and current stack (innermost last)."""
+    frames = sys._current_frames()
+    out = []
+    for t in sorted(threading.enumerate(), key=lambda t: t.name):
+        frame = frames.get(t.ident)
+        out.append({
+            "name": t.name,
+            "ident": t.ident,
+            "native_id": t.native_id,
+            "daemon": t.daemon,
+            "cpu_s": thread_cpu(t.native_id),
+            "stack": [
+                f"{fs.name} ({os.path.basename(fs.filename)}:{fs.lineno})"
+                for fs in traceback.extract_stack(frame, limit=MAX_DEPTH)
+            ] if frame is not None else [],
+        })
+    return out
+
+
+def terminal_sessions(registry):
+    """Live terminal sessions from the keepalive registry, with their PTY processes."""
+    out = []
+    now = time.monotonic()
+    for session in registry.sessions():
+        info = {
+            "type": type(session).__name__,
+            "sprite": getattr(session, "sprite_name", None) or "local",
+            "identity": getattr(session, "identity", None),
+            "idle_s": round(now - session.last_input, 1),
+            "reap_reason": session.reap_reason,
+        }
+        proc = getattr(session, "proc", None)
+        if proc is not None:
+            info["pid"] = proc.pid
+            info["input_queued"] = getattr(session, "_input_bytes", 0)
+        channels = getattr(session, "channels", None)
+        if channels is not None:
+            info["channels"] = [
+                {
+                    "id": ch.id,
+                    "sprite": ch.sprite_name or "local",
+                    "pid": ch.proc.pid if ch.proc else None,
+                    "output_queued": ch.skipper.queued_bytes() if ch.skipper else len(ch.out),
+                    "input_queued": ch.inq_bytes,
+                    "credit": ch.credit,
+                }
+                for ch in list(channels.values())
+            ]
+        out.append(info)
+    return out
@@ -14,9 +14,8 @@
 
   var term = null;
   var fitAddon = null;
-  var termWs = null;
-  var reconnectTimer = null;
-  var reconnectDelay = 1000;
+  var mux = null;          // one TerminalMux socket for every terminal channel
+  var termChannel = null;
   var terminalMode = null; // "local" or "remote"
   var selectedSprite = "";
   var autoReconnect = true;
@@ -61,9 +60,7 @@
     fitAddon.fit();
 
     term.onData(function (data) {
-      if (termWs && termWs.readyState === WebSocket.OPEN) {
-        termWs.send(new TextEncoder().encode(data));
-      }
+      if (termChannel) termChannel.write(data);
     });
 
     window.addEventListener("resize", function () {
@@ -71,19 +68,14 @@
     });
 
     term.onResize(function (size) {
-      if (termWs && termWs.readyState === WebSocket.OPEN) {
-        termWs.send(JSON.stringify({
-          type: "resize",
-          cols: size.cols,
-          rows: size.rows,
-        }));
-      }
+      if (termChannel) termChannel.resize(size.cols, size.rows);
     });
 
     var reconnectBtn = document.getElementById("btn-reconnect");
     if (reconnectBtn) {
       reconnectBtn.addEventListener("click", function () {
         autoReconnect = true;
+        if (mux) mux.connect();
         connectTerminal();
       });
     }
@@ -181,14 +173,22 @@
     dot.className = "dot" + (state === "active" ? " active" : state === "error" ? " error" : "");
   }
 
+  function ensureMux() {
+    if (mux) return mux;
+    var proto = window.location.protocol === "https:" ? "wss:" : "ws:";
+    mux = new TerminalMux(proto + "//" + window.location.host + "/api/terminal/mux");
+    mux.autoReconnect = autoReconnect;
+    mux.onstatus = function (state) {
+      setTermStatus(state === "open" ? "active" : state === "connecting" ? "warning" : "error");
+    };
+    mux.connect();
+    return mux;
+  }
+
   function connectTerminal() {
-    if (reconnectTimer) {
-      clearTimeout(reconnectTimer);
-      reconnectTimer = null;
-    }
-    if (termWs) {
-      try { termWs.close(); } catch (e) {}
-      termWs = null;
+    if (termChannel) {
+      termChannel.close();
+      termChannel = null;
     }
 
     // In remote mode, require a sprite selection
@@ -200,53 +200,32 @@
       return;
     }
 
-    var proto = window.location.protocol === "https:" ? "wss:" : "ws:";
-    var url = proto + "//" + window.location.host + "/api/terminal";
-    if (selectedSprite && terminalMode === "remote") {
-      url += "?sprite=" + encodeURIComponent(selectedSprite);
-    }
-
-    setTermStatus("warning");
-    termWs = new WebSocket(url);
-    termWs.binaryType = "arraybuffer";
-
-    termWs.onopen = function () {
-      setTermStatus("active");
-      reconnectDelay = 1000;
-      if (term) {
-        termWs.send(JSON.stringify({
-          type: "resize",
-          cols: term.cols,
-          rows: term.rows,
-        }));
-      }
-    };
+    ensureMux();
+    var chan = mux.open({
+      sprite: terminalMode === "remote" ? selectedSprite : null,
+      cols: term ? term.cols : 80,
+      rows: term ? term.rows : 24,
+    });
+    termChannel = chan;
 
-    termWs.onmessage = function (ev) {
-      if (term) {
-        term.write(new Uint8Array(ev.data));
-      }
+    chan.ondata = function (bytes) {
+      if (!term) return;
+      var n = bytes.length;
+      // Return output credit only once xterm has rendered the bytes
+      term.write(bytes, function () { chan.ack(n); });
     };
 
-    termWs.onclose = function () {
+    chan.onclose = function (reason) {
+      if (termChannel !== chan) return;
+      termChannel = null;
       setTermStatus("error");
-      if (autoReconnect) {
-        scheduleReconnect();
+      if (reason) {
+        if (term) term.write("\r\n\x1b[1;31mError:\x1b[0m " + reason + "\r\n");
+      } else if (autoReconnect) {
+        // Terminal process exited (e.g. tmux detached) — start a fresh one
+        setTimeout(function () { if (!termChannel) connectTerminal(); }, 1000);
       }
     };
-
-    termWs.onerror = function () {
-      setTermStatus("error");
-    };
-  }
-
-  function scheduleReconnect() {
-    if (reconnectTimer) return;
-    reconnectTimer = setTimeout(function () {
-      reconnectTimer = null;
-      connectTerminal();
-    }, reconnectDelay);
-    reconnectDelay = Math.min(reconnectDelay * 1.5, 10000);
   }
 
   // -----------------------------------------------------------------------
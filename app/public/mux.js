@@ -0,0 +1,164 @@
+/* ==========================================================================
+   TerminalMux — many terminals over one WebSocket (/api/terminal/mux)
+
+   Framing matches app/terminal_mux.py:  u8 type | u16 channel | payload.
+   One socket, one reconnect loop; open channels are re-opened after a
+   reconnect with fresh channel ids.
+   ========================================================================== */
+
+(function () {
+  "use strict";
+
+  var OPEN = 0x01, DATA = 0x02, RESIZE = 0x03, CLOSE = 0x04, ACK = 0x05, FLOW = 0x07;
+  var encoder = new TextEncoder();
+
+  function frame(type, id, payload) {
+    var body = payload || new Uint8Array(0);
+    var buf = new Uint8Array(3 + body.length);
+    buf[0] = type;
+    buf[1] = id >> 8;
+    buf[2] = id & 0xff;
+    buf.set(body, 3);
+    return buf;
+  }
+
+  function u16pair(a, b) {
+    var view = new DataView(new ArrayBuffer(4));
+    view.setUint16(0, a);
+    view.setUint16(2, b);
+    return new Uint8Array(view.buffer);
+  }
+
+  function TerminalMux(url) {
+    this.url = url;
+    this.ws = null;
+    this.nextId = 1;
+    this.channels = {};        // id -> Channel
+    this.autoReconnect = true;
+    this.reconnectDelay = 1000;
+    this.reconnectTimer = null;
+    this.onstatus = function () {};  // "connecting" | "open" | "closed"
+  }
+
+  TerminalMux.prototype.connect = function () {
+    var self = this;
+    if (this.reconnectTimer) {
+      clearTimeout(this.reconnectTimer);
+      this.reconnectTimer = null;
+    }
+    if (this.ws) {
+      this.ws.onclose = null;
+      try { this.ws.close(); } catch (e) {}
+    }
+    this.onstatus("connecting");
+    var ws = new WebSocket(this.url);
+    ws.binaryType = "arraybuffer";
+    this.ws = ws;
+
+    ws.onopen = function () {
+      self.reconnectDelay = 1000;
+      self.onstatus("open");
+      // Re-open every channel under a fresh id (old ids may still be closing)
+      var old = self.channels;
+      self.channels = {};
+      Object.keys(old).forEach(function (id) { self._open(old[id]); });
+    };
+    ws.onmessage = function (ev) { self._onmessage(new Uint8Array(ev.data)); };
+    ws.onclose = function () {
+      self.onstatus("closed");
+      if (self.autoReconnect) self._scheduleReconnect();
+    };
+  };
+
+  TerminalMux.prototype._scheduleReconnect = function () {
+    var self = this;
+    if (this.reconnectTimer) return;
+    this.reconnectTimer = setTimeout(function () {
+      self.reconnectTimer = null;
+      self.connect();
+    }, this.reconnectDelay);
+    this.reconnectDelay = Math.min(this.reconnectDelay * 1.5, 10000);
+  };
+
+  TerminalMux.prototype._send = function (buf) {
+    if (this.ws && this.ws.readyState === WebSocket.OPEN) this.ws.send(buf);
+  };
+
+  TerminalMux.prototype._onmessage = function (buf) {
+    if (buf.length < 3) return;
+    var id = (buf[1] << 8) | buf[2];
+    var chan = this.channels[id];
+    if (!chan) return;
+    var body = buf.subarray(3);
+    if (buf[0] === DATA) {
+      chan.ondata(body);
+    } else if (buf[0] === FLOW) {
+      chan.paused = body[0] === 1;
+      while (!chan.paused && chan.pending.length) {
+        this._send(frame(DATA, chan.id, chan.pending.shift()));
+      }
+    } else if (buf[0] === CLOSE) {
+      delete this.channels[id];
+      chan.closed = true;
+      chan.onclose(new TextDecoder().decode(body));
+    }
+  };
+
+  TerminalMux.prototype._open = function (chan) {
+    chan.id = this.nextId++;
+    if (this.nextId > 0xffff) this.nextId = 1;
+    chan.paused = false;
+    chan.pending = [];
+    this.channels[chan.id] = chan;
+    this._send(frame(OPEN, chan.id, encoder.encode(JSON.stringify(chan.opts))));
+  };
+
+  /** Open a terminal channel.  opts: {sprite, cols, rows}. */
+  TerminalMux.prototype.open = function (opts) {
+    var chan = new Channel(this, opts || {});
+    this._open(chan);
+    return chan;
+  };
+
+  function Channel(mux, opts) {
+    this.mux = mux;
+    this.opts = opts;
+    this.id = 0;
+    this.paused = false;
+    this.pending = [];
+    this.closed = false;
+    this.ondata = function () {};
+    this.onclose = function () {};
+  }
+
+  Channel.prototype.write = function (text) {
+    var bytes = encoder.encode(text);
+    if (this.paused) {
+      this.pending.push(bytes);
+      return;
+    }
+    this.mux._send(frame(DATA, this.id, bytes));
+  };
+
+  Channel.prototype.resize = function (cols, rows) {
+    this.opts.cols = cols;
+    this.opts.rows = rows;
+    this.mux._send(frame(RESIZE, this.id, u16pair(cols, rows)));
+  };
+
+  /** Return output credit once *n* bytes have been rendered. */
+  Channel.prototype.ack = function (n) {
+    var view = new DataView(new ArrayBuffer(4));
+    view.setUint32(0, n);
+    this.mux._send(frame(ACK, this.id, new Uint8Array(view.buffer)));
+  };
+
+  Channel.prototype.close = function () {
+    if (this.closed) return;
+    this.closed = true;
+    this.mux._send(frame(CLOSE, this.id));
+    delete this.mux.channels[this.id];
+  };
+
+  window.TerminalMux = TerminalMux;
+})();
@@ -0,0 +1,392 @@
+"""
+Terminal session recording — asciicast v2 output in compressed segments.
+
+Each recording lives in its own directory under data/recordings/:
+
+    header.json   asciicast v2 header (version, width, height, timestamp)
+    events.gz     append-only stream of independent gzip members; each
+                  member holds a batch of asciicast event lines
+                  ([t, "o", data] / [t, "r", "COLSxROWS"])
+    events.idx    fixed-size records (t_start, t_end, offset, length),
+                  one per gzip member, in the same order
+    keyframes.gz  screen snapshots (screen.Screen renders), one gzip
+                  member each, taken every KEYFRAME_INTERVAL seconds or
+                  KEYFRAME_BYTES of output
+    keyframes.idx fixed-size records (t, member, offset, length, cols,
+                  rows): the snapshot holds everything before events
+                  member number *member*
+
+`zcat events.gz` after header.json is a valid .cast file.  Because every
+member decompresses on its own, a seek bisects keyframes.idx for the
+nearest keyframe before it and inflates only the members from there on:
+the events in between are replayed into a Screen and sent as a single
+frame at t=0, so playback opens on what the terminal showed at that
+moment.
+
+The PTY read loop only appends (time, bytes) to an in-memory list; a
+background thread encodes, compresses and writes, so recording adds no
+latency to terminal output.  If writing fails (disk full...), the
+recorder logs once, drops what it holds and stops recording.
+
+Recordings older than TERMINAL_RECORDING_RETENTION_DAYS, and the oldest
+ones beyond TERMINAL_RECORDING_MAX_MB in total, are deleted by
+prune_recordings() when a new recording starts.
+"""
+
+import codecs
+import json
+import os
+import re
+import shutil
+import struct
+import sys
+import threading
+import time
+import zlib
+from pathlib import Path
+
+from screen import Screen
+
+RECORDING_ENABLED = os.environ.get("TERMINAL_RECORDING", "") in ("1", "true", "yes")
+RETENTION_DAYS = float(os.environ.get("TERMINAL_RECORDING_RETENTION_DAYS", 30))
+MAX_BYTES = int(float(os.environ.get("TERMINAL_RECORDING_MAX_MB", 1024)) * 1024 * 1024)
+
+# Flush a batch at least this often, or sooner once it grows past FLUSH_BYTES.
+# Output queued beyond MAX_PENDING_BYTES (the disk is not keeping up) is dropped.
+FLUSH_INTERVAL = 1.0
+FLUSH_BYTES = 256 * 1024
+MAX_PENDING_BYTES = 16 * 1024 * 1024
+
+# A seek replays at most this much recording time / output from its keyframe.
+KEYFRAME_INTERVAL = 30.0
+KEYFRAME_BYTES = 1024 * 1024
+
+# Pruning runs at most every PRUNE_INTERVAL seconds and skips recordings
+# written to in the last PRUNE_MIN_IDLE seconds.
+PRUNE_MIN_IDLE = 60
+PRUNE_INTERVAL = 600
+
+_INDEX_RECORD = struct.Struct("<ddQI")
+_KEYFRAME_RECORD = struct.Struct("<dQQIHH")
+_ID_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+class Recorder:
+    """Record one terminal session.  Fed from TerminalSession's PTY loop."""
+
+    def __init__(self, root, sprite_name=None, cols=80, rows=24):
+        label = re.sub(r"[^A-Za-z0-9_-]", "-", sprite_name or "local")
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{os.getpid()}-{id(self) & 0xFFFF:04x}"
+        self.dir = Path(root) / self.id
+        self.dir.mkdir(parents=True, exist_ok=True)
+
+        self._t0 = time.monotonic()
+        self._pending = []
+        self._pending_bytes = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._failed = False
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._screen = Screen(cols, rows)
+        self._members = 0
+        self._keyframe_t = 0.0
+        self._keyframe_bytes = 0
+
+        header = {
+            "version": 2,
+            "width": int(cols),
+            "height": int(rows),
+            "timestamp": int(time.time()),
+            "env": {"TERM": "xterm-256color"},
+            "title": sprite_name or "local",
+        }
+        with open(self.dir / "header.json", "w") as f:
+            json.dump(header, f)
+            f.write("\n")
+
+        self._events = open(self.dir / "events.gz", "ab")
+        self._index = open(self.dir / "events.idx", "ab")
+        self._keyframes = open(self.dir / "keyframes.gz", "ab")
+        self._keyframe_index = open(self.dir / "keyframes.idx", "ab")
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._thread.start()
+
+    # -- hot path ----------------------------------------------------------
+
+    def write(self, data):
+        """Queue PTY output.  Never blocks on disk."""
+        if self._failed:
+            return
+        t = time.monotonic() - self._t0
+        with self._lock:
+            if self._pending_bytes > MAX_PENDING_BYTES:
+                return
+            self._pending.append((t, "o", data))
+            self._pending_bytes += len(data)
+            big = self._pending_bytes >= FLUSH_BYTES
+        if big:
+            self._wake.set()
+
+    def resize(self, cols, rows):
+        if self._failed:
+            return
+        t = time.monotonic() - self._t0
+        with self._lock:
+            self._pending.append((t, "r", f"{int(cols)}x{int(rows)}"))
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self._thread.join(timeout=5)
+
+    # -- background flush --------------------------------------------------
+
+    def _flush_loop(self):
+        try:
+            while not self._closed:
+                self._wake.wait(FLUSH_INTERVAL)
+                self._wake.clear()
+                self._flush()
+            self._flush(final=True)
+        except OSError as e:
+            print(f"recorder: {self.id}: {e}; recording stopped", file=sys.stderr)
+            self._failed = True
+            with self._lock:
+                self._pending = []
+                self._pending_bytes = 0
+        finally:
+            for f in (self._events, self._index, self._keyframes, self._keyframe_index):
+                try:
+                    f.close()
+                except OSError:
+                    pass
+
+    def _flush(self, final=False):
+        with self._lock:
+            batch, self._pending = self._pending, []
+            self._pending_bytes = 0
+        if not batch:
+            return
+
+        lines = []
+        for t, code, data in batch:
+            if code == "o":
+                self._screen.feed(data)
+                self._keyframe_bytes += len(data)
+                text = self._decoder.decode(data, final=False)
+                if not text:
+                    continue
+                lines.append(json.dumps([round(t, 6), "o", text]))
+            else:
+                self._screen.resize(*data.split("x"))
+                lines.append(json.dumps([round(t, 6), code, data]))
+        if final:
+            tail = self._decoder.decode(b"", final=True)
+            if tail:
+                lines.append(json.dumps([round(batch[-1][0], 6), "o", tail]))
+        if not lines:
+            return
+
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        member = compressor.compress(("\n".join(lines) + "\n").encode()) + compressor.flush()
+        offset = self._events.tell()
+        self._events.write(member)
+        self._events.flush()
+        self._index.write(_INDEX_RECORD.pack(batch[0][0], batch[-1][0], offset, len(member)))
+        self._index.flush()
+        self._members += 1
+
+        t = batch[-1][0]
+        due = t - self._keyframe_t >= KEYFRAME_INTERVAL or self._keyframe_bytes >= KEYFRAME_BYTES
+        if due and not final and self._screen.ground:
+            self._write_keyframe(t)
+
+    def _write_keyframe(self, t):
+        """Snapshot the screen as it stands after every member written so far."""
+        frame, _ = self._screen.render()
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        member = compressor.compress(frame) + compressor.flush()
+        offset = self._keyframes.tell()
+        self._keyframes.write(member)
+        self._keyframes.flush()
+        self._keyframe_index.write(_KEYFRAME_RECORD.pack(
+            t, self._members, offset, len(member), self._screen.cols, self._screen.rows))
+        self._keyframe_index.flush()
+        self._keyframe_t = t
+        self._keyframe_bytes = 0
+
+
+# ---------------------------------------------------------------------------
+# Reading / replay
+# ---------------------------------------------------------------------------
+
+def recording_dir(root, rec_id):
+    """Return the directory for *rec_id*, or None if it is invalid or missing."""
+    if not rec_id or not _ID_RE.match(rec_id) or rec_id.startswith("."):
+        return None
+    path = Path(root) / rec_id
+    if not (path / "header.json").is_file():
+        return None
+    return path
+
+
+def list_recordings(root):
+    """List recordings, newest first."""
+    root = Path(root)
+    if not root.is_dir():
+        return []
+    out = []
+    for entry in sorted(root.iterdir(), reverse=True):
+        header_file = entry / "header.json"
+        if not header_file.is_file():
+            continue
+        try:
+            with open(header_file) as f:
+                header = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        duration = 0.0
+        idx = entry / "events.idx"
+        try:
+            size = idx.stat().st_size
+            if size >= _INDEX_RECORD.size:
+                with open(idx, "rb") as f:
+                    f.seek((size // _INDEX_RECORD.size - 1) * _INDEX_RECORD.size)
+                    duration = _INDEX_RECORD.unpack(f.read(_INDEX_RECORD.size))[1]
+        except OSError:
+            pass
+        out.append({
+            "id": entry.name,
+            "title": header.get("title", ""),
+            "timestamp": header.get("timestamp"),
+            "duration": round(duration, 3),
+            "bytes": (entry / "events.gz").stat().st_size if (entry / "events.gz").exists() else 0,
+        })
+    return out
+
+
+def prune_recordings(root, _last=[0.0]):
+    """Delete expired recordings, then the oldest ones while over MAX_BYTES.
+
+    Runs at most every PRUNE_INTERVAL seconds per process; recordings
+    still being written are left alone.
+    """
+    now = time.time()
+    if now - _last[0] < PRUNE_INTERVAL:
+        return
+    _last[0] = now
+    root = Path(root)
+    if not root.is_dir():
+        return
+    recordings = []
+    for entry in sorted(root.iterdir()):   # ids start with the start time: oldest first
+        if not entry.is_dir() or not (entry / "header.json").is_file():
+            continue
+        try:
+            stats = [p.stat() for p in entry.iterdir()]
+        except OSError:
+            continue
+        mtime = max((st.st_mtime for st in stats), default=0)
+        recordings.append((entry, mtime, sum(st.st_size for st in stats)))
+
+    total = sum(size for _, _, size in recordings)
+    for entry, mtime, size in recordings:
+        expired = RETENTION_DAYS > 0 and mtime < now - RETENTION_DAYS * 86400
+        over = MAX_BYTES > 0 and total > MAX_BYTES
+        if not (expired or over) or mtime > now - PRUNE_MIN_IDLE:
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+
+
+def _keyframe_before(path, start, max_member):
+    """Return (member, Screen) for the latest keyframe at or before *start*, or (0, None)."""
+    try:
+        count = (path / "keyframes.idx").stat().st_size // _KEYFRAME_RECORD.size
+    except OSError:
+        return 0, None
+    with open(path / "keyframes.idx", "rb") as f:
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            f.seek(mid * _KEYFRAME_RECORD.size)
+            t, member = _KEYFRAME_RECORD.unpack(f.read(_KEYFRAME_RECORD.size))[:2]
+            if t <= start and member <= max_member:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return 0, None
+        f.seek((lo - 1) * _KEYFRAME_RECORD.size)
+        _, member, offset, length, cols, rows = _KEYFRAME_RECORD.unpack(f.read(_KEYFRAME_RECORD.size))
+    screen = Screen(cols, rows)
+    with open(path / "keyframes.gz", "rb") as f:
+        f.seek(offset)
+        screen.feed(zlib.decompress(f.read(length), 31))
+    return member, screen
+
+
+def read_recording(path, start=0.0, end=None):
+    """
+    Yield asciicast v2 lines (bytes) for *path* from *start* seconds on.
+
+    The first line is the header; event times are rebased so playback of
+    a seek starts at 0, opening with one frame of the screen at *start*.
+    Only the members from the keyframe before *start* up to *end* are
+    decompressed.
+    """
+    path = Path(path)
+    with open(path / "header.json", "rb") as f:
+        header = json.loads(f.read())
+    if start:
+        header["seek"] = start
+    yield (json.dumps(header) + "\n").encode()
+
+    idx_path = path / "events.idx"
+    if not idx_path.exists():
+        return
+    count = idx_path.stat().st_size // _INDEX_RECORD.size
+
+    with open(idx_path, "rb") as idx_file, open(path / "events.gz", "rb") as events:
+        first, screen = 0, None
+        if start:
+            first, screen = _keyframe_before(path, start, count)
+            if screen is None:
+                screen = Screen(header.get("width", 80), header.get("height", 24))
+        idx_file.seek(first * _INDEX_RECORD.size)
+        for _ in range(first, count):
+            t_start, _, offset, length = _INDEX_RECORD.unpack(idx_file.read(_INDEX_RECORD.size))
+            if end is not None and t_start > end:
+                break
+            events.seek(offset)
+            text = zlib.decompress(events.read(length), 31)
+            for line in text.splitlines():
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                t = event[0]
+                if t < start:
+                    if event[1] == "o":
+                        screen.feed(event[2].encode())
+                    elif event[1] == "r":
+                        screen.resize(*event[2].split("x"))
+                    continue
+                if screen is not None:
+                    yield from _screen_events(screen, header)
+                    screen = None
+                if end is not None and t > end:
+                    return
+                event[0] = round(t - start, 6)
+                yield (json.dumps(event) + "\n").encode()
+        if screen is not None:
+            yield from _screen_events(screen, header)
+
+
+def _screen_events(screen, header):
+    """Events that bring a player from the header's blank screen to *screen*."""
+    if (screen.cols, screen.rows) != (header.get("width"), header.get("height")):
+        yield (json.dumps([0.0, "r", f"{screen.cols}x{screen.rows}"]) + "\n").encode()
+    frame, _ = screen.render()
+    yield (json.dumps([0.0, "o", frame.decode()]) + "\n").encode()
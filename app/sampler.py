@@ -0,0 +1,351 @@
+"""
+Per-session resource sampler with downsampled history.
+
+A background thread walks /proc once per SAMPLE_INTERVAL, maps every
+process to the tmux session whose pane it descends from (pane pids come
+from `tmux list-panes -a`, refreshed every PANE_REFRESH seconds) and
+records, per session:
+
+    cpu_pct     CPU time used, 100 = one core
+    rss_bytes   resident memory of the whole process tree
+    read_bps    storage bytes read per second (/proc/<pid>/io)
+    write_bps   storage bytes written per second
+    fds         open file descriptors
+    procs       process count
+
+plus the tmux server itself ("tmux-server") and the machine as a whole
+("_system": cpu over all cores, memory in use, fds allocated).
+
+History lives in fixed-size ring buffers at three resolutions — 1 s, 1 min
+and 1 h — so memory use does not grow with uptime.  Coarser points are
+averaged from finer ones, except rss_bytes, fds and procs, which keep the
+peak so short spikes before an OOM kill stay visible.  Served at
+/api/metrics/history.
+
+Linux only; without /proc the sampler stays idle.  In multi-worker mode
+every worker samples on its own.
+"""
+
+import os
+import subprocess
+import threading
+import time
+from array import array
+
+SAMPLE_INTERVAL = float(os.environ.get("RESOURCE_SAMPLE_INTERVAL", 1))  # 0 disables
+PANE_REFRESH = 5.0
+MAX_SERIES = 64
+
+FIELDS = ("cpu_pct", "rss_bytes", "read_bps", "write_bps", "fds", "procs")
+_PEAK_FIELDS = {"rss_bytes", "fds", "procs"}
+
+# (name, seconds per point, points kept)
+RESOLUTIONS = (("1s", 1, 300), ("1m", 60, 720), ("1h", 3600, 336))
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+# ---------------------------------------------------------------------------
+# Fixed-memory history
+# ---------------------------------------------------------------------------
+
+class Ring:
+    """Fixed-capacity ring of (timestamp, FIELDS...) points."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array("d", [0.0] * capacity)
+        self.values = {f: array("d", [0.0] * capacity) for f in FIELDS}
+        self.count = 0
+        self.head = 0
+
+    def append(self, t, point):
+        self.times[self.head] = t
+        for f in FIELDS:
+            self.values[f][self.head] = point[f]
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def points(self, since=None):
+        start = (self.head - self.count) % self.capacity
+        out = {"t": []}
+        out.update({f: [] for f in FIELDS})
+        for i in range(self.count):
+            idx = (start + i) % self.capacity
+            t = self.times[idx]
+            if since is not None and t < since:
+                continue
+            out["t"].append(t)
+            for f in FIELDS:
+                out[f].append(round(self.values[f][idx], 2))
+        return out
+
+
+class _Bucket:
+    """Accumulates finer points into one coarser point."""
+
+    __slots__ = ("start", "n", "sums", "peaks")
+
+    def __init__(self, start):
+        self.start = start
+        self.n = 0
+        self.sums = dict.fromkeys(FIELDS, 0.0)
+        self.peaks = dict.fromkeys(FIELDS, 0.0)
+
+    def add(self, point):
+        self.n += 1
+        for f in FIELDS:
+            self.sums[f] += point[f]
+            self.peaks[f] = max(self.peaks[f], point[f])
+
+    def point(self):
+        return {f: self.peaks[f] if f in _PEAK_FIELDS else self.sums[f] / self.n for f in FIELDS}
+
+
+class Series:
+    """One metric series kept at every resolution in RESOLUTIONS."""
+
+    def __init__(self):
+        self.rings = [Ring(capacity) for _, _, capacity in RESOLUTIONS]
+        self.buckets = [None] * len(RESOLUTIONS)
+        self.updated = 0.0
+
+    def add(self, t, point):
+        self.updated = t
+        self._add(0, t, point)
+
+    def _add(self, level, t, point):
+        if level == 0:
+            self.rings[0].append(t, point)
+        if level + 1 >= len(RESOLUTIONS):
+            return
+        step = RESOLUTIONS[level + 1][1]
+        start = t - t % step
+        bucket = self.buckets[level + 1]
+        if bucket is not None and bucket.start != start:
+            coarse = bucket.point()
+            self.rings[level + 1].append(bucket.start, coarse)
+            self._add(level + 1, bucket.start, coarse)
+            bucket = None
+        if bucket is None:
+            bucket = self.buckets[level + 1] = _Bucket(start)
+        bucket.add(point)
+
+
+# ---------------------------------------------------------------------------
+# /proc readers
+# ---------------------------------------------------------------------------
+
+def _read_procs():
+    """{pid: (ppid, comm, cpu_ticks, start_ticks, rss_bytes)} for every process."""
+    procs = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "rb") as f:
+                data = f.read()
+        except OSError:
+            continue
+        close = data.rfind(b")")
+        comm = data[data.find(b"(") + 1:close].decode(errors="replace")
+        fields = data[close + 2:].split()
+        # Fields after comm start at stat(5) field 3 (state)
+        procs[int(name)] = (
+            int(fields[1]),
+            comm,
+            int(fields[11]) + int(fields[12]),
+            int(fields[19]),
+            int(fields[21]) * _PAGE_SIZE,
+        )
+    return procs
+
+
+def _read_io(pid):
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            values = dict(line.split(": ", 1) for line in f.read().splitlines() if ": " in line)
+        return int(values.get("read_bytes", 0)), int(values.get("write_bytes", 0))
+    except (OSError, ValueError):
+        return 0, 0
+
+
+def _count_fds(pid):
+    try:
+        return len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        return 0
+
+
+def _tmux_panes():
+    """(tmux server pid or None, {session_name: [pane_pid, ...]})."""
+    try:
+        out = subprocess.check_output(
+            ["tmux", "list-panes", "-a", "-F", "#{pid} #{pane_pid} #{session_name}"],
+            stderr=subprocess.DEVNULL, text=True, timeout=5,
+        )
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
+        return None, {}
+    server_pid, panes = None, {}
+    for line in out.splitlines():
+        parts = line.split(" ", 2)
+        if len(parts) == 3 and parts[0].isdigit() and parts[1].isdigit():
+            server_pid = int(parts[0])
+            panes.setdefault(parts[2], []).append(int(parts[1]))
+    return server_pid, panes
+
+
+def _system_totals():
+    """(busy_ticks, total_ticks, mem_used_bytes, fds_allocated)."""
+    with open("/proc/stat") as f:
+        cpu = [int(v) for v in f.readline().split()[1:]]
+    idle = cpu[3] + (cpu[4] if len(cpu) > 4 else 0)
+    mem = {}
+    with open("/proc/meminfo") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            mem[key] = int(rest.split()[0]) * 1024
+    try:
+        with open("/proc/sys/fs/file-nr") as f:
+            fds = int(f.read().split()[0])
+    except (OSError, ValueError):
+        fds = 0
+    return sum(cpu) - idle, sum(cpu), mem.get("MemTotal", 0) - mem.get("MemAvailable", 0), fds
+
+
+# ---------------------------------------------------------------------------
+# Sampler
+# ---------------------------------------------------------------------------
+
+class Sampler:
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.series = {}                # name -> Series
+        self.latest = {}                # name -> {fields..., "top": [...]}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._panes = (None, {})
+        self._panes_at = 0.0
+        self._prev = None               # (monotonic, {pid: (cpu_ticks, read, write)}, boot_ticks)
+        self._prev_system = None
+
+    def start(self):
+        if self._thread is not None or not self.interval or not os.path.isdir("/proc"):
+            return
+        self._thread = threading.Thread(target=self._loop, name="resource-sampler", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self.sample()
+            except Exception:
+                import traceback
+                traceback.print_exc()
+            time.sleep(max(0.05, self.interval - (time.monotonic() - started)))
+
+    def sample(self):
+        now = time.monotonic()
+        wall = time.time()
+        if now - self._panes_at >= PANE_REFRESH:
+            self._panes = _tmux_panes()
+            self._panes_at = now
+        server_pid, panes = self._panes
+
+        procs = _read_procs()
+        children = {}
+        for pid, info in procs.items():
+            children.setdefault(info[0], []).append(pid)
+
+        groups = {}
+        for session, roots in panes.items():
+            members, stack = [], [pid for pid in roots if pid in procs]
+            while stack:
+                pid = stack.pop()
+                members.append(pid)
+                stack.extend(children.get(pid, ()))
+            groups[session] = members
+        if server_pid in procs:
+            groups["tmux-server"] = [server_pid]
+
+        with open("/proc/uptime") as f:
+            boot_ticks = float(f.read().split()[0]) * _CLK_TCK
+        prev_t, prev_counters, prev_boot = self._prev or (None, {}, 0.0)
+        dt = (now - prev_t) if prev_t is not None else None
+        counters, points, latest = {}, {}, {}
+        for name, members in groups.items():
+            point = dict.fromkeys(FIELDS, 0.0)
+            top = []
+            for pid in members:
+                _, comm, ticks, start_ticks, rss = procs[pid]
+                read, write = _read_io(pid)
+                counters[pid] = (ticks, read, write)
+                if pid in prev_counters:
+                    p_ticks, p_read, p_write = prev_counters[pid]
+                elif start_ticks >= prev_boot:
+                    p_ticks, p_read, p_write = 0, 0, 0    # started since the last sample
+                else:
+                    p_ticks, p_read, p_write = ticks, read, write
+                cpu = (ticks - p_ticks) / _CLK_TCK / dt * 100 if dt else 0.0
+                point["cpu_pct"] += cpu
+                point["rss_bytes"] += rss
+                if dt:
+                    point["read_bps"] += max(0, read - p_read) / dt
+                    point["write_bps"] += max(0, write - p_write) / dt
+                point["fds"] += _count_fds(pid)
+                point["procs"] += 1
+                top.append((cpu, rss, pid, comm))
+            points[name] = point
+            top.sort(reverse=True)
+            latest[name] = dict(point, top=[
+                {"pid": pid, "comm": comm, "cpu_pct": round(cpu, 1), "rss_bytes": rss}
+                for cpu, rss, pid, comm in top[:5]
+            ])
+        self._prev = (now, counters, boot_ticks)
+
+        busy, total, mem_used, fds = _system_totals()
+        system = dict.fromkeys(FIELDS, 0.0)
+        if self._prev_system and total > self._prev_system[1]:
+            cores = os.cpu_count() or 1
+            system["cpu_pct"] = (busy - self._prev_system[0]) / (total - self._prev_system[1]) * 100 * cores
+        self._prev_system = (busy, total)
+        system["rss_bytes"] = mem_used
+        system["fds"] = fds
+        system["procs"] = len(procs)
+        points["_system"] = system
+        latest["_system"] = dict(system, top=[])
+
+        with self._lock:
+            for name, point in points.items():
+                series = self.series.get(name)
+                if series is None:
+                    if len(self.series) >= MAX_SERIES:
+                        stale = min(self.series, key=lambda n: self.series[n].updated)
+                        del self.series[stale]
+                    series = self.series[name] = Series()
+                series.add(wall, point)
+            self.latest = latest
+
+    def history(self, resolution="1s", name=None, since=None):
+        """Points at *resolution* for every series (or just *name*)."""
+        level = next((i for i, r in enumerate(RESOLUTIONS) if r[0] == resolution), None)
+        if level is None:
+            raise ValueError(f"resolution must be one of {', '.join(r[0] for r in RESOLUTIONS)}")
+        with self._lock:
+            names = [name] if name else sorted(self.series)
+            return {
+                "resolution": resolution,
+                "step": RESOLUTIONS[level][1],
+                "fields": list(FIELDS),
+                "series": {
+                    n: self.series[n].rings[level].points(since)
+                    for n in names if n in self.series
+                },
+                "latest": {n: self.latest[n] for n in names if n in self.latest},
+                "running": self._thread is not None,
+            }
+
+
+sampler = Sampler()
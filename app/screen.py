@@ -0,0 +1,629 @@
+"""
+Server-side terminal screen model and frame-skipping output queue.
+
+Screen is a compact VT100/xterm emulator: enough of ECMA-48 and the DEC
+private modes used by tmux, shells, htop and friends (cursor movement,
+erase, insert/delete, scroll regions, SGR colours, the alternate screen,
+DEC line drawing, wide characters) to know what a terminal currently
+shows.  It can render that state as one escape sequence — a full snapshot
+or only the rows that changed since the previous frame.
+
+FrameSkipper sits between the PTY and a slow viewer.  Output is passed
+through raw while the viewer keeps up; once more than *threshold* bytes
+are waiting, the backlog is dropped and the viewer is sent screen frames
+instead, then switched back to raw output as soon as it has caught up.
+"""
+
+import codecs
+import re
+import threading
+import unicodedata
+
+# DEC private modes mirrored into snapshots so the client's input encoding
+# (cursor keys, mouse, bracketed paste) matches the application's.
+_TRACKED_MODES = (1, 7, 25, 1000, 1002, 1003, 1004, 1005, 1006, 2004)
+_DEFAULT_MODES = {7, 25}
+
+# DEC Special Graphics (ESC ( 0) -> Unicode box drawing
+_DEC_GRAPHICS = dict(zip(
+    "`abcdefghijklmnopqrstuvwxyz{|}~",
+    "◆▒␉␌␍␊°±␤␋┘┐┌└┼⎺⎻─⎼⎽├┤┴┬│≤≥π≠£·",
+))
+
+_ASCII_RUN = re.compile(r"[\x20-\x7e]+")
+_CSI_PARAM = re.compile(r"[0-9;:]*")
+
+# SGR attribute: (flags, fg, bg); fg/bg are SGR parameter strings or None.
+_BOLD, _DIM, _ITALIC, _UNDERLINE, _BLINK, _INVERSE, _HIDDEN, _STRIKE = (1 << i for i in range(8))
+_FLAG_CODES = ((_BOLD, "1"), (_DIM, "2"), (_ITALIC, "3"), (_UNDERLINE, "4"),
+               (_BLINK, "5"), (_INVERSE, "7"), (_HIDDEN, "8"), (_STRIKE, "9"))
+_DEFAULT_ATTR = (0, None, None)
+
+
+def _sgr(attr, _cache={}):
+    seq = _cache.get(attr)
+    if seq is None:
+        flags, fg, bg = attr
+        parts = ["0"] + [code for bit, code in _FLAG_CODES if flags & bit]
+        if fg:
+            parts.append(fg)
+        if bg:
+            parts.append(bg)
+        seq = _cache[attr] = "\x1b[" + ";".join(parts) + "m"
+    return seq
+
+
+def _char_width(ch):
+    if ch < "\u0300":
+        return 1
+    if unicodedata.combining(ch):
+        return 0
+    return 2 if unicodedata.east_asian_width(ch) in ("W", "F") else 1
+
+
+class Screen:
+    """VT100/xterm screen state fed with raw PTY output."""
+
+    def __init__(self, cols=80, rows=24):
+        self.cols = max(1, int(cols))
+        self.rows = max(1, int(rows))
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._state = "ground"
+        self._seq = ""
+        self.reset()
+
+    # -- state ---------------------------------------------------------------
+
+    def reset(self):
+        self.main = self._blank_buffer()
+        self.alt = self._blank_buffer()
+        self.buf = self.main
+        self.alt_active = False
+        self.x = self.y = 0
+        self.wrap_pending = False
+        self.attr = _DEFAULT_ATTR
+        self.top, self.bottom = 0, self.rows - 1
+        self.modes = set(_DEFAULT_MODES)
+        self.origin = False
+        self.insert = False
+        self.charsets = ["B", "B"]
+        self.shift = 0
+        self.saved = None
+        self.last_char = " "
+        self.tabs = set(range(8, self.cols, 8))
+
+    @property
+    def ground(self):
+        """True when not in the middle of an escape sequence or a UTF-8 character."""
+        return self._state == "ground" and not self._decoder.getstate()[0]
+
+    def _blank(self):
+        """Erased cell: erase operations keep the current background colour."""
+        return (" ", (0, None, self.attr[2]))
+
+    def _blank_row(self, blank=None):
+        return [blank or (" ", _DEFAULT_ATTR)] * self.cols
+
+    def _blank_buffer(self):
+        return [self._blank_row() for _ in range(self.rows)]
+
+    def resize(self, cols, rows):
+        cols, rows = max(1, int(cols)), max(1, int(rows))
+        if (cols, rows) == (self.cols, self.rows):
+            return
+        for name in ("main", "alt"):
+            buf = getattr(self, name)
+            for i, row in enumerate(buf):
+                buf[i] = (row + [(" ", _DEFAULT_ATTR)] * cols)[:cols]
+            if rows < len(buf):
+                # Keep the bottom of the screen, like xterm
+                drop = len(buf) - rows
+                del buf[:drop]
+                if name == ("alt" if self.alt_active else "main"):
+                    self.y = max(0, self.y - drop)
+            while len(buf) < rows:
+                buf.append([(" ", _DEFAULT_ATTR)] * cols)
+        self.buf = self.alt if self.alt_active else self.main
+        self.cols, self.rows = cols, rows
+        self.top, self.bottom = 0, rows - 1
+        self.x = min(self.x, cols - 1)
+        self.y = min(self.y, rows - 1)
+        self.wrap_pending = False
+        self.tabs = set(range(8, cols, 8))
+
+    # -- input -------------------------------------------------------------------
+
+    def feed(self, data):
+        text = self._decoder.decode(data)
+        i, n = 0, len(text)
+        while i < n:
+            if self._state == "ground":
+                m = _ASCII_RUN.match(text, i)
+                if m and not self.insert and self.charsets[self.shift] == "B":
+                    self._print_run(m.group())
+                    i = m.end()
+                    continue
+                self._ground(text[i])
+            else:
+                self._escape(text[i])
+            i += 1
+
+    def _ground(self, ch):
+        if ch >= " " and ch != "\x7f":
+            self._print(ch)
+        elif ch == "\x1b":
+            self._state, self._seq = "esc", ""
+        elif ch == "\r":
+            self.x = 0
+            self.wrap_pending = False
+        elif ch in "\n\x0b\x0c":
+            self._linefeed()
+        elif ch == "\b":
+            if self.x > 0:
+                self.x -= 1
+            self.wrap_pending = False
+        elif ch == "\t":
+            stops = [t for t in self.tabs if t > self.x]
+            self.x = min(stops) if stops else self.cols - 1
+            self.wrap_pending = False
+        elif ch == "\x0e":
+            self.shift = 1
+        elif ch == "\x0f":
+            self.shift = 0
+
+    def _escape(self, ch):
+        state = self._state
+        if ch == "\x18" or ch == "\x1a":          # CAN / SUB abort a sequence
+            self._state = "ground"
+            return
+        if state == "esc":
+            if ch == "[":
+                self._state, self._seq = "csi", ""
+            elif ch == "]":
+                self._state = "osc"
+            elif ch in "PX^_":
+                self._state = "string"
+            elif ch in "()*+":
+                self._state, self._seq = "charset", ch
+            elif ch == "\x1b":
+                pass
+            else:
+                self._state = "ground"
+                self._esc_final(ch)
+        elif state == "charset":
+            self._state = "ground"
+            if self._seq == "(":
+                self.charsets[0] = ch
+            elif self._seq == ")":
+                self.charsets[1] = ch
+        elif state == "csi":
+            if "\x40" <= ch <= "\x7e":
+                self._state = "ground"
+                self._csi(self._seq, ch)
+            elif ch == "\x1b":
+                self._state, self._seq = "esc", ""
+            elif len(self._seq) < 64:
+                self._seq += ch
+        elif state in ("osc", "string"):
+            if ch == "\x07":
+                self._state = "ground"
+            elif ch == "\x1b":
+                self._state = "string_esc"
+        elif state == "string_esc":
+            self._state = "ground" if ch == "\\" else "string"
+
+    def _esc_final(self, ch):
+        if ch == "D":
+            self._linefeed()
+        elif ch == "E":
+            self.x = 0
+            self._linefeed()
+        elif ch == "M":
+            if self.y == self.top:
+                self._scroll_down(1)
+            elif self.y > 0:
+                self.y -= 1
+            self.wrap_pending = False
+        elif ch == "7":
+            self._save_cursor()
+        elif ch == "8":
+            self._restore_cursor()
+        elif ch == "c":
+            self.reset()
+        elif ch == "H":
+            self.tabs.add(self.x)
+
+    # -- printing ----------------------------------------------------------------
+
+    def _print_run(self, s):
+        attr = self.attr
+        while s:
+            if self.wrap_pending:
+                self._wrap()
+            room = self.cols - self.x
+            part, s = s[:room], s[room:]
+            row = self.buf[self.y]
+            row[self.x:self.x + len(part)] = [(c, attr) for c in part]
+            self.x += len(part)
+            self.last_char = part[-1]
+            if self.x >= self.cols:
+                self.x = self.cols - 1
+                self.wrap_pending = 7 in self.modes
+
+    def _print(self, ch):
+        charset = self.charsets[self.shift]
+        if charset == "0":
+            ch = _DEC_GRAPHICS.get(ch, ch)
+        width = _char_width(ch)
+        if width == 0:
+            return  # combining marks are dropped; the base character stays
+        if self.wrap_pending or (width == 2 and self.x == self.cols - 1):
+            self._wrap()
+        row = self.buf[self.y]
+        if self.insert:
+            row[self.x:self.x] = [(" ", self.attr)] * width
+            del row[self.cols:]
+        row[self.x] = (ch, self.attr)
+        if width == 2:
+            row[self.x + 1] = ("", self.attr)
+        self.x += width
+        self.last_char = ch
+        if self.x >= self.cols:
+            self.x = self.cols - 1
+            self.wrap_pending = 7 in self.modes
+
+    def _wrap(self):
+        self.wrap_pending = False
+        self.x = 0
+        self._linefeed()
+
+    def _linefeed(self):
+        self.wrap_pending = False
+        if self.y == self.bottom:
+            self._scroll_up(1)
+        elif self.y < self.rows - 1:
+            self.y += 1
+
+    def _scroll_up(self, n):
+        n = min(n, self.bottom - self.top + 1)
+        blank = self._blank()
+        del self.buf[self.top:self.top + n]
+        for _ in range(n):
+            self.buf.insert(self.bottom - n + 1, self._blank_row(blank))
+
+    def _scroll_down(self, n):
+        n = min(n, self.bottom - self.top + 1)
+        blank = self._blank()
+        del self.buf[self.bottom - n + 1:self.bottom + 1]
+        for _ in range(n):
+            self.buf.insert(self.top, self._blank_row(blank))
+
+    def _save_cursor(self):
+        self.saved = (self.x, self.y, self.attr, self.origin, list(self.charsets), self.shift)
+
+    def _restore_cursor(self):
+        if self.saved:
+            self.x, self.y, self.attr, self.origin, charsets, self.shift = self.saved
+            self.charsets = list(charsets)
+            self.x = min(self.x, self.cols - 1)
+            self.y = min(self.y, self.rows - 1)
+        self.wrap_pending = False
+
+    # -- CSI ---------------------------------------------------------------------
+
+    def _csi(self, seq, final):
+        private = ""
+        if seq and seq[0] in "?<=>":
+            private, seq = seq[0], seq[1:]
+        if not _CSI_PARAM.fullmatch(seq):
+            return  # intermediates (e.g. DECSCUSR "CSI 2 q") don't affect the screen
+        params = [int(p.split(":")[0]) if p.split(":")[0] else 0 for p in seq.split(";")] if seq else []
+
+        def arg(i=0, default=1):
+            v = params[i] if i < len(params) else 0
+            return v or default
+
+        if private == "?":
+            if final in "hl":
+                for p in params:
+                    self._set_private(p, final == "h")
+            return
+        if private:
+            return
+
+        if final not in "mnc":
+            self.wrap_pending = False
+        if final in "Hf":
+            row = arg(0) - 1 + (self.top if self.origin else 0)
+            self.y = max(0, min(row, self.bottom if self.origin else self.rows - 1))
+            self.x = max(0, min(arg(1) - 1, self.cols - 1))
+        elif final == "A":
+            self.y = max(self.top if self.y >= self.top else 0, self.y - arg())
+        elif final in "Be":
+            self.y = min(self.bottom if self.y <= self.bottom else self.rows - 1, self.y + arg())
+        elif final in "Ca":
+            self.x = min(self.cols - 1, self.x + arg())
+        elif final == "D":
+            self.x = max(0, self.x - arg())
+        elif final == "E":
+            self.y = min(self.bottom, self.y + arg())
+            self.x = 0
+        elif final == "F":
+            self.y = max(self.top, self.y - arg())
+            self.x = 0
+        elif final in "G`":
+            self.x = max(0, min(arg() - 1, self.cols - 1))
+        elif final == "d":
+            self.y = max(0, min(arg() - 1, self.rows - 1))
+        elif final == "J":
+            self._erase_display(arg(0, 0))
+        elif final == "K":
+            self._erase_line(arg(0, 0))
+        elif final == "X":
+            row = self.buf[self.y]
+            n = min(arg(), self.cols - self.x)
+            row[self.x:self.x + n] = [self._blank()] * n
+        elif final == "@":
+            row = self.buf[self.y]
+            row[self.x:self.x] = [self._blank()] * min(arg(), self.cols - self.x)
+            del row[self.cols:]
+        elif final == "P":
+            row = self.buf[self.y]
+            n = min(arg(), self.cols - self.x)
+            del row[self.x:self.x + n]
+            row.extend([self._blank()] * n)
+        elif final in "LM":
+            if self.top <= self.y <= self.bottom:
+                saved_top, self.top = self.top, self.y
+                (self._scroll_down if final == "L" else self._scroll_up)(arg())
+                self.top = saved_top
+                self.x = 0
+        elif final == "S":
+            self._scroll_up(arg())
+        elif final == "T":
+            self._scroll_down(arg())
+        elif final == "b":
+            for _ in range(min(arg(), self.cols * self.rows)):
+                self._print(self.last_char)
+        elif final == "m":
+            self._set_sgr(params)
+        elif final == "r":
+            top, bottom = arg(0) - 1, arg(1, self.rows) - 1
+            if 0 <= top < bottom < self.rows:
+                self.top, self.bottom = top, bottom
+                self.x, self.y = 0, (top if self.origin else 0)
+        elif final == "s":
+            self._save_cursor()
+        elif final == "u":
+            self._restore_cursor()
+        elif final in "hl":
+            if 4 in params:
+                self.insert = final == "h"
+        elif final == "g":
+            if arg(0, 0) == 3:
+                self.tabs.clear()
+            else:
+                self.tabs.discard(self.x)
+
+    def _set_private(self, mode, on):
+        if mode in (47, 1047, 1049):
+            if on == self.alt_active:
+                return
+            if mode == 1049 and on:
+                self._save_cursor()
+            self.alt_active = on
+            if on:
+                self.alt = self._blank_buffer()
+                self.buf = self.alt
+            else:
+                self.buf = self.main
+                if mode == 1049:
+                    self._restore_cursor()
+            self.wrap_pending = False
+        elif mode == 6:
+            self.origin = on
+            self.x, self.y = 0, (self.top if on else 0)
+        elif mode in _TRACKED_MODES:
+            if on:
+                self.modes.add(mode)
+            else:
+                self.modes.discard(mode)
+
+    def _erase_display(self, how):
+        blank = self._blank()
+        if how == 0:
+            self._erase_line(0)
+            for y in range(self.y + 1, self.rows):
+                self.buf[y] = self._blank_row(blank)
+        elif how == 1:
+            self._erase_line(1)
+            for y in range(0, self.y):
+                self.buf[y] = self._blank_row(blank)
+        elif how in (2, 3):
+            for y in range(self.rows):
+                self.buf[y] = self._blank_row(blank)
+
+    def _erase_line(self, how):
+        row = self.buf[self.y]
+        blank = self._blank()
+        if how == 0:
+            row[self.x:] = [blank] * (self.cols - self.x)
+        elif how == 1:
+            row[:self.x + 1] = [blank] * (self.x + 1)
+        elif how == 2:
+            self.buf[self.y] = self._blank_row(blank)
+
+    def _set_sgr(self, params):
+        flags, fg, bg = self.attr
+        if not params:
+            params = [0]
+        i = 0
+        while i < len(params):
+            p = params[i]
+            if p == 0:
+                flags, fg, bg = 0, None, None
+            elif 1 <= p <= 9 and p != 6:
+                flags |= {1: _BOLD, 2: _DIM, 3: _ITALIC, 4: _UNDERLINE, 5: _BLINK,
+                          7: _INVERSE, 8: _HIDDEN, 9: _STRIKE}[p]
+            elif p == 22:
+                flags &= ~(_BOLD | _DIM)
+            elif 23 <= p <= 29 and p not in (26,):
+                flags &= ~{23: _ITALIC, 24: _UNDERLINE, 25: _BLINK, 27: _INVERSE,
+                           28: _HIDDEN, 29: _STRIKE}[p]
+            elif 30 <= p <= 37 or 90 <= p <= 97:
+                fg = str(p)
+            elif p == 39:
+                fg = None
+            elif 40 <= p <= 47 or 100 <= p <= 107:
+                bg = str(p)
+            elif p == 49:
+                bg = None
+            elif p in (38, 48) and i + 1 < len(params):
+                if params[i + 1] == 5 and i + 2 < len(params):
+                    color = f"{p};5;{params[i + 2]}"
+                    i += 2
+                elif params[i + 1] == 2 and i + 4 < len(params):
+                    color = f"{p};2;{params[i + 2]};{params[i + 3]};{params[i + 4]}"
+                    i += 4
+                else:
+                    color = None
+                    i += 1
+                if p == 38:
+                    fg = color
+                else:
+                    bg = color
+            i += 1
+        self.attr = (flags, fg, bg)
+
+    # -- rendering -----------------------------------------------------------------
+
+    def snapshot(self):
+        """Return the visible rows as an immutable value for later diffing."""
+        return (self.alt_active, self.cols, self.rows, tuple(tuple(row) for row in self.buf))
+
+    def render(self, previous=None):
+        """
+        Return (escape sequence, snapshot) that brings a terminal showing
+        *previous* (a snapshot, or None for unknown) to the current state.
+        """
+        current = self.snapshot()
+        full = previous is None or previous[:3] != current[:3]
+        out = ["\x18\x1b[0m\x1b(B\x0f"]  # abort any half-received sequence, reset SGR/charset
+        if full:
+            out.append("\x1b[?1049h" if self.alt_active else "\x1b[?1049l")
+        out.append("\x1b[r")
+        old_rows = previous[3] if not full else None
+        for y, row in enumerate(current[3]):
+            if old_rows is not None and old_rows[y] == row:
+                continue
+            out.append(f"\x1b[{y + 1};1H")
+            out.append(self._render_row(row))
+        for mode in _TRACKED_MODES:
+            out.append(f"\x1b[?{mode}{'h' if mode in self.modes else 'l'}")
+        if (self.top, self.bottom) != (0, self.rows - 1):
+            out.append(f"\x1b[{self.top + 1};{self.bottom + 1}r")
+        if self.origin:
+            out.append("\x1b[?6h")
+        y = self.y - (self.top if self.origin else 0)
+        out.append(f"\x1b[{y + 1};{self.x + 1}H")
+        out.append(_sgr(self.attr))
+        if self.charsets[0] != "B":
+            out.append(f"\x1b({self.charsets[0]}")
+        return "".join(out).encode(), current
+
+    def _render_row(self, row):
+        # Trailing default blanks become a single erase-to-end-of-line
+        end = len(row)
+        while end > 0 and row[end - 1] == (" ", _DEFAULT_ATTR):
+            end -= 1
+        parts = []
+        attr = None
+        for ch, cell_attr in row[:end]:
+            if ch == "":
+                continue  # right half of a wide character
+            if cell_attr != attr:
+                parts.append(_sgr(cell_attr))
+                attr = cell_attr
+            parts.append(ch)
+        if end < len(row):
+            parts.append("\x1b[0m\x1b[K")
+        return "".join(parts)
+
+
+class FrameSkipper:
+    """
+    Output queue for one viewer that degrades to screen frames when the
+    viewer falls behind.
+
+    push() is called with every chunk of PTY output; pull() returns the
+    next bytes to send: raw output while under *threshold*, otherwise a
+    snapshot/diff frame rendered from the screen model.
+    """
+
+    def __init__(self, cols=80, rows=24, threshold=256 * 1024):
+        self.screen = Screen(cols, rows)
+        self.threshold = threshold
+        self.frames_sent = 0
+        self.bytes_dropped = 0
+        self._queue = []
+        self._queued = 0
+        self._lagging = False
+        self._dirty = False
+        self._last = None
+        self._lock = threading.Lock()
+
+    def push(self, data):
+        with self._lock:
+            self.screen.feed(data)
+            if self._lagging:
+                self._dirty = True
+                return
+            self._queue.append(data)
+            self._queued += len(data)
+            if self._queued > self.threshold:
+                self.bytes_dropped += self._queued
+                self._queue, self._queued = [], 0
+                self._lagging = self._dirty = True
+                self._last = None
+
+    def resize(self, cols, rows):
+        with self._lock:
+            self.screen.resize(cols, rows)
+            if self._lagging:
+                self._dirty = True
+
+    def pending(self):
+        with self._lock:
+            return bool(self._queue) or (
+                self._lagging and (self._dirty or self.screen.ground))
+
+    def queued_bytes(self):
+        with self._lock:
+            return self._queued
+
+    def pull(self, limit=None):
+        """Return the next chunk to send (b"" when there is nothing)."""
+        with self._lock:
+            if self._lagging:
+                if self._dirty:
+                    frame, self._last = self.screen.render(self._last)
+                    self._dirty = False
+                    self.frames_sent += 1
+                    return frame
+                if self.screen.ground:
+                    # Caught up: the viewer shows exactly the model's state,
+                    # and no escape sequence or UTF-8 character is half
+                    # consumed, so raw output can resume from here.
+                    self._lagging = False
+                    self._last = None
+                return b""
+            if not self._queue:
+                return b""
+            data = b"".join(self._queue)
+            if limit is not None and len(data) > limit:
+                data, rest = data[:limit], data[limit:]
+                self._queue = [rest]
+                self._queued = len(rest)
+            else:
+                self._queue, self._queued = [], 0
+            return data
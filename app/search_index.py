@@ -0,0 +1,517 @@
+"""
+Full-text search over terminal output — incremental inverted index.
+
+One index per sprite/tmux session lives in data/search/<key>/.  Output fed
+from TerminalSession's PTY loop is queued raw; a background thread strips
+ANSI sequences, splits lines, tokenizes and adds them to an in-memory
+buffer that is flushed to immutable on-disk segments.  Segments of the same
+level are merged in the background (4 level-N segments -> 1 level-N+1),
+so the number of files stays logarithmic in the amount of output.
+
+Segment file layout (all integers little-endian):
+
+    magic "CSIX" | u8 version | u32 terms_len | u32 lines_len
+    u64 min_ts | u64 max_ts | u32 line_count
+    terms block (zlib): [varint len][term][varint len][postings]...
+        postings are delta-encoded varint line numbers
+    lines block (zlib): [varint ts delta][varint len][utf-8 text]...
+
+A query reads only the header and terms block of each segment in its time
+range, and inflates the lines block only when a term matches.  Segment
+writes go through tmp + rename and merges hold an flock on the index
+directory, so several dashboard processes can share one index.
+"""
+
+import fcntl
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+
+SEARCH_ENABLED = os.environ.get("TERMINAL_SEARCH", "") in ("1", "true", "yes")
+RETENTION_DAYS = float(os.environ.get("TERMINAL_SEARCH_RETENTION_DAYS", 7))
+
+FLUSH_LINES = 5000
+FLUSH_SECONDS = 60
+MERGE_FACTOR = 4
+MAINTENANCE_INTERVAL = 1.0
+DEDUPE_MS = 60_000
+MAX_LINE = 1000
+
+_MAGIC = b"CSIX\x01"
+_HEADER = struct.Struct("<5sIIQQI")
+
+# CSI sequences that move the cursor vertically act as line breaks (tmux
+# repaints with absolute positioning rather than newlines); other escape
+# sequences are removed.
+_CSI_BREAK_RE = re.compile(rb"\x1b\[[0-9;?]*[HfdABEF]")
+_ESC_RE = re.compile(
+    rb"\x1b\[[0-?]*[ -/]*[@-~]"          # CSI
+    rb"|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)"  # OSC
+    rb"|\x1b[PX^_][^\x1b]*\x1b\\"         # DCS/SOS/PM/APC
+    rb"|\x1b[()*+][0-9A-Za-z]"            # charset designation
+    rb"|\x1b[@-Z\\-_=>78]"                # two-byte escapes
+)
+_CTRL_RE = re.compile(r"[\x00-\x08\x0b-\x1f\x7f]")
+_TOKEN_RE = re.compile(r"[a-z0-9_]{2,64}")
+_KEY_RE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _varint(n, out):
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(buf, pos):
+    n = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _decode_postings(raw):
+    out, pos, last = [], 0, 0
+    while pos < len(raw):
+        delta, pos = _read_varint(raw, pos)
+        last += delta
+        out.append(last)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Segments
+# ---------------------------------------------------------------------------
+
+def _write_segment(path, lines):
+    """Write *lines* ([(ts_ms, text)], sorted by ts) as a segment at *path*."""
+    postings = {}
+    for i, (_, text) in enumerate(lines):
+        for tok in set(tokenize(text)):
+            postings.setdefault(tok, []).append(i)
+
+    terms = bytearray()
+    for tok in sorted(postings):
+        enc = tok.encode()
+        _varint(len(enc), terms)
+        terms += enc
+        plist = bytearray()
+        last = 0
+        for n in postings[tok]:
+            _varint(n - last, plist)
+            last = n
+        _varint(len(plist), terms)
+        terms += plist
+
+    body = bytearray()
+    last_ts = lines[0][0]
+    for ts, text in lines:
+        enc = text.encode()
+        _varint(ts - last_ts, body)
+        _varint(len(enc), body)
+        body += enc
+        last_ts = ts
+
+    terms_z = zlib.compress(bytes(terms), 6)
+    lines_z = zlib.compress(bytes(body), 6)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, len(terms_z), len(lines_z),
+                             lines[0][0], lines[-1][0], len(lines)))
+        f.write(terms_z)
+        f.write(lines_z)
+    os.rename(tmp, path)
+
+
+class _Segment:
+    """Read-only view of a segment file; blocks are inflated on demand."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, self._terms_len, self._lines_len, self.min_ts, self.max_ts, self.count = \
+                _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC:
+            raise ValueError(f"not a search segment: {path}")
+        self.level = int(path.name[1:path.name.index("-")])
+        self._terms = None
+        self._lines = None
+
+    def terms(self):
+        if self._terms is None:
+            with open(self.path, "rb") as f:
+                f.seek(_HEADER.size)
+                raw = zlib.decompress(f.read(self._terms_len))
+            terms, pos = {}, 0
+            while pos < len(raw):
+                n, pos = _read_varint(raw, pos)
+                tok = raw[pos:pos + n].decode()
+                pos += n
+                n, pos = _read_varint(raw, pos)
+                terms[tok] = raw[pos:pos + n]
+                pos += n
+            self._terms = terms
+        return self._terms
+
+    def postings(self, tok):
+        raw = self.terms().get(tok)
+        return _decode_postings(raw) if raw is not None else []
+
+    def lines(self):
+        if self._lines is None:
+            with open(self.path, "rb") as f:
+                f.seek(_HEADER.size + self._terms_len)
+                raw = zlib.decompress(f.read(self._lines_len))
+            lines, pos, ts = [], 0, self.min_ts
+            while pos < len(raw):
+                delta, pos = _read_varint(raw, pos)
+                n, pos = _read_varint(raw, pos)
+                ts += delta
+                lines.append((ts, raw[pos:pos + n].decode(errors="replace")))
+                pos += n
+            self._lines = lines
+        return self._lines
+
+
+_segment_cache = OrderedDict()
+_segment_cache_lock = threading.Lock()
+_SEGMENT_CACHE_SIZE = 32
+
+
+def _open_segment(path):
+    with _segment_cache_lock:
+        seg = _segment_cache.get(path)
+        if seg is not None:
+            _segment_cache.move_to_end(path)
+            return seg
+    seg = _Segment(path)
+    with _segment_cache_lock:
+        _segment_cache[path] = seg
+        while len(_segment_cache) > _SEGMENT_CACHE_SIZE:
+            _segment_cache.popitem(last=False)
+    return seg
+
+
+# ---------------------------------------------------------------------------
+# Index
+# ---------------------------------------------------------------------------
+
+class OutputIndex:
+    """Inverted index over the terminal output of one sprite/session."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._raw = []            # [(ts_ms, bytes)] not yet tokenized
+        self._carry = b""
+        self._lines = []          # in-memory buffer, [(ts_ms, text)]
+        self._postings = {}
+        self._buffer_since = time.monotonic()
+        self._recent = OrderedDict()
+        self._seq = 0
+        self._last_merge = 0.0
+        self.feeder = None
+
+    # -- ingest --------------------------------------------------------------
+
+    def feed(self, data):
+        with self._lock:
+            self._raw.append((int(time.time() * 1000), data))
+
+    def _ingest(self):
+        with self._lock:
+            raw, self._raw = self._raw, []
+        for ts, data in raw:
+            data = _CSI_BREAK_RE.sub(b"\n", self._carry + data)
+            # Keep an unterminated escape sequence for the next chunk
+            cut = data.rfind(b"\x1b")
+            if cut != -1 and len(data) - cut < 64 and not _ESC_RE.match(data, cut):
+                data, self._carry = data[:cut], data[cut:]
+            else:
+                self._carry = b""
+            text = _ESC_RE.sub(b"", data).decode("utf-8", errors="replace")
+            for line in re.split(r"[\r\n]+", text):
+                self._add_line(ts, line)
+
+    def _add_line(self, ts, line):
+        line = _CTRL_RE.sub("", line).strip()[:MAX_LINE]
+        if not line:
+            return
+        # tmux repaints the screen on attach, resize and window switches;
+        # don't index the same line again within the dedupe window.
+        seen = self._recent.get(line)
+        if seen is not None and ts - seen < DEDUPE_MS:
+            return
+        self._recent[line] = ts
+        self._recent.move_to_end(line)
+        while len(self._recent) > 4096:
+            self._recent.popitem(last=False)
+        with self._lock:
+            n = len(self._lines)
+            self._lines.append((ts, line))
+            for tok in set(tokenize(line)):
+                self._postings.setdefault(tok, []).append(n)
+
+    # -- segments --------------------------------------------------------------
+
+    def segments(self):
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        out = []
+        for name in names:
+            if not name.endswith(".seg"):
+                continue
+            try:
+                out.append(_open_segment(self.root / name))
+            except (OSError, ValueError, struct.error):
+                continue
+        return out
+
+    def _segment_path(self, level, min_ts):
+        self._seq += 1
+        return self.root / f"L{level}-{min_ts:013d}-{os.getpid()}-{self._seq}.seg"
+
+    def flush(self, force=False):
+        with self._lock:
+            due = force or len(self._lines) >= FLUSH_LINES or \
+                time.monotonic() - self._buffer_since >= FLUSH_SECONDS
+            if not due or not self._lines:
+                if not self._lines:
+                    self._buffer_since = time.monotonic()
+                return
+            lines = self._lines
+            self._lines, self._postings = [], {}
+            self._buffer_since = time.monotonic()
+        _write_segment(self._segment_path(0, lines[0][0]), lines)
+
+    def maintain(self):
+        """Ingest queued output, flush the buffer, merge and expire segments."""
+        self._ingest()
+        self.flush()
+        now = time.monotonic()
+        if now - self._last_merge < 30:
+            return
+        self._last_merge = now
+        with open(self.root / ".lock", "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # another process is maintaining this index
+            try:
+                self._expire()
+                while self._merge_once():
+                    pass
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _expire(self):
+        cutoff = (time.time() - RETENTION_DAYS * 86400) * 1000
+        for seg in self.segments():
+            if seg.max_ts < cutoff:
+                try:
+                    os.unlink(seg.path)
+                except FileNotFoundError:
+                    pass
+
+    def _merge_once(self):
+        by_level = {}
+        for seg in self.segments():
+            by_level.setdefault(seg.level, []).append(seg)
+        for level in sorted(by_level):
+            segs = sorted(by_level[level], key=lambda s: s.min_ts)
+            if len(segs) < MERGE_FACTOR:
+                continue
+            group = segs[:MERGE_FACTOR]
+            lines = []
+            for seg in group:
+                lines.extend(seg.lines())
+            lines.sort(key=lambda item: item[0])
+            _write_segment(self._segment_path(level + 1, lines[0][0]), lines)
+            for seg in group:
+                try:
+                    os.unlink(seg.path)
+                except FileNotFoundError:
+                    pass
+            return True
+        return False
+
+    # -- query -----------------------------------------------------------------
+
+    def search(self, tokens, phrase=None, limit=100, since=None, until=None):
+        """Return up to *limit* [(ts_ms, line)] matching all *tokens*, newest first."""
+        def matches(lines, candidates):
+            for n in candidates:
+                ts, line = lines[n]
+                if since is not None and ts < since:
+                    continue
+                if until is not None and ts > until:
+                    continue
+                if phrase and phrase not in line.lower():
+                    continue
+                yield ts, line
+
+        def intersect(lists):
+            if not lists:
+                return []
+            result = set(lists[0])
+            for other in lists[1:]:
+                result.intersection_update(other)
+            return sorted(result)
+
+        results = []
+        with self._lock:
+            lines = self._lines
+            candidates = intersect([self._postings.get(t, []) for t in tokens])
+            results.extend(matches(lines, candidates))
+
+        segs = sorted(self.segments(), key=lambda s: s.max_ts, reverse=True)
+        for seg in segs:
+            if since is not None and seg.max_ts < since:
+                continue
+            if until is not None and seg.min_ts > until:
+                continue
+            if len(results) >= limit and seg.max_ts < min(ts for ts, _ in results):
+                break
+            try:
+                lists = [seg.postings(t) for t in tokens]
+                if not all(lists):
+                    continue
+                candidates = intersect(lists)
+                results.extend(matches(seg.lines(), candidates))
+            except FileNotFoundError:
+                continue  # merged away mid-query; its lines are in the merged segment
+
+        results = sorted(set(results), key=lambda item: item[0], reverse=True)
+        return results[:limit]
+
+
+class IndexTap:
+    """TerminalSession tap feeding an OutputIndex.
+
+    Several tabs attached to the same tmux session receive identical
+    output; only one tap per index (the first to write) feeds it.
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def write(self, data):
+        if self.index.feeder is None:
+            self.index.feeder = self
+        if self.index.feeder is self:
+            self.index.feed(data)
+
+    def resize(self, cols, rows):
+        pass
+
+    def close(self):
+        if self.index.feeder is self:
+            self.index.feeder = None
+
+
+# ---------------------------------------------------------------------------
+# Registry + background maintenance
+# ---------------------------------------------------------------------------
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+_maintenance_thread = None
+_stop = threading.Event()
+
+
+def index_key(sprite_name, session):
+    return _KEY_RE.sub("-", f"{sprite_name or 'local'}-{session}")
+
+
+def get_index(root, key):
+    """Return the shared OutputIndex for *key*, starting maintenance if needed."""
+    global _maintenance_thread
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = OutputIndex(Path(root) / key)
+        if _maintenance_thread is None:
+            _maintenance_thread = threading.Thread(target=_maintenance_loop, daemon=True)
+            _maintenance_thread.start()
+    return index
+
+
+def _maintenance_loop():
+    while not _stop.wait(MAINTENANCE_INTERVAL):
+        with _indexes_lock:
+            indexes = list(_indexes.values())
+        for index in indexes:
+            try:
+                index.maintain()
+            except Exception:
+                import traceback
+                traceback.print_exc()
+
+
+def shutdown():
+    """Stop maintenance and write every index's buffered lines to a segment."""
+    _stop.set()
+    if _maintenance_thread is not None:
+        _maintenance_thread.join(timeout=10)
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        try:
+            index._ingest()
+            index.flush(force=True)
+        except Exception:
+            import traceback
+            traceback.print_exc()
+
+
+def search(root, query, key=None, limit=100, since=None, until=None):
+    """
+    Search terminal output under *root* (all indexes, or just *key*).
+
+    All words in *query* must appear in a line; a query wrapped in double
+    quotes must also appear verbatim.  Returns dicts with ts (ms), line
+    and source, newest first.
+    """
+    query = query.strip()
+    phrase = None
+    if len(query) > 1 and query.startswith('"') and query.endswith('"'):
+        query = query[1:-1]
+        phrase = query.lower()
+    tokens = sorted(set(tokenize(query)))
+    if not tokens:
+        return []
+
+    root = Path(root)
+    if key is not None:
+        keys = [key]
+    else:
+        keys = sorted(p.name for p in root.iterdir() if p.is_dir()) if root.is_dir() else []
+
+    results = []
+    for k in keys:
+        with _indexes_lock:
+            index = _indexes.get(k)
+        if index is None:
+            if not (root / k).is_dir():
+                continue
+            index = OutputIndex(root / k)
+        for ts, line in index.search(tokens, phrase, limit, since, until):
+            results.append({"ts": ts, "line": line, "source": k})
+    results.sort(key=lambda r: r["ts"], reverse=True)
+    return results[:limit]
@@ -5,33 +5,85 @@ Zero dependencies beyond Python 3.
 
 Serves static files from app/public/ and provides API endpoints
 for workspace status information.
+
+Startup is ordered for a freshly woken sprite: the listening socket is
+taken (or inherited) and /health answered before anything heavy is
+imported, and the terminal, recording and upstream-API modules load on
+first use (see fastboot.py).
 """
 
-import json
 import os
-import re
-import subprocess
 import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fastboot
+
+if __name__ == "__main__":
+    fastboot.start(int(os.environ.get("WEBAPP_PORT", 8888)))
+
+import json
+import re
+import signal
+import threading
+import time
 import urllib.parse
-import urllib.request
-import urllib.error
-from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from http.server import SimpleHTTPRequestHandler
 from pathlib import Path
 
-sys.path.insert(0, str(Path(__file__).parent))
-from session import SessionStore
+import session
 from tokens import TokenStore
 from auth import check_auth
-from terminal_ws import ws_handshake, TerminalSession, get_terminal_info
+import admission
+from shared_cache import SharedCache
+
+subprocess = fastboot.lazy_module("subprocess")
+fastboot.lazy_module("urllib.error")
+fastboot.lazy_module("urllib.request")
+prefork = fastboot.lazy_module("prefork")
+keepalive = fastboot.lazy_module("keepalive")
+terminal_ws = fastboot.lazy_module("terminal_ws")
+terminal_mux = fastboot.lazy_module("terminal_mux")
+recorder = fastboot.lazy_module("recorder")
+search_index = fastboot.lazy_module("search_index")
+sampler = fastboot.lazy_module("sampler")
+files = fastboot.lazy_module("files")
+logtail = fastboot.lazy_module("logtail")
+checkpoint = fastboot.lazy_module("checkpoint")
+profiler = fastboot.lazy_module("profiler")
+fleet = fastboot.lazy_module("fleet")
+prewake = fastboot.lazy_module("prewake")
 
 PORT = int(os.environ.get("WEBAPP_PORT", 8888))
 PUBLIC_DIR = Path(__file__).parent / "public"
 DATA_DIR = Path(__file__).parent.parent / "data"
+RECORDINGS_DIR = DATA_DIR / "recordings"
+SEARCH_DIR = DATA_DIR / "search"
+CHECKPOINT_DIR = DATA_DIR / "checkpoints"
+PREWAKE_DIR = DATA_DIR / "prewake"
 
 SPRITE_API_BASE = "https://api.sprites.dev/v1"
 
-store = SessionStore(DATA_DIR / "state.json")
+store = session.open_store(DATA_DIR)
 token_store = TokenStore(DATA_DIR / "tokens.json")
+# Shared by all worker processes; invalidated whenever sprites or tokens change
+sprite_cache = SharedCache(DATA_DIR / "cache" / "sprites.json",
+                           ttl=float(os.environ.get("DASHBOARD_SPRITE_CACHE_TTL", 5)))
+fleet_cache = SharedCache(DATA_DIR / "cache" / "fleet.json",
+                          ttl=float(os.environ.get("DASHBOARD_FLEET_CACHE_TTL", 15)))
+
+
+def terminal_taps(sprite_name):
+    """Build the output taps (recording, search indexing) for a new terminal."""
+    if sprite_name and prewake.PREWAKE_ENABLED:
+        get_prewaker().record_use(sprite_name)
+    taps = []
+    if recorder.RECORDING_ENABLED:
+        recorder.prune_recordings(RECORDINGS_DIR)
+        taps.append(recorder.Recorder(RECORDINGS_DIR, sprite_name))
+    if search_index.SEARCH_ENABLED:
+        key = search_index.index_key(sprite_name, terminal_ws.TMUX_SESSION)
+        taps.append(search_index.IndexTap(search_index.get_index(SEARCH_DIR, key)))
+    return taps
 
 
 def get_token(name, env_var):
@@ -176,6 +228,13 @@ def create_sprite(name):
 
 
 def list_sprites():
+    """List sprites, served from the shared cache when fresh. Returns (dict, status_code)."""
+    body, status = sprite_cache.get(lambda: list(_fetch_sprites()),
+                                    cacheable=lambda value: value[1] == 200)
+    return body, status
+
+
+def _fetch_sprites():
     """List sprites via the Sprites.dev API. Returns (dict, status_code)."""
     token = get_token("sprite_token", "SPRITE_TOKEN")
     if not token:
@@ -198,6 +257,52 @@ def list_sprites():
         return {"error": str(e.reason)}, 502
 
 
+def get_fleet(refresh=False):
+    """Merged /api/status of every running sprite (see fleet.py). Returns (dict, status_code)."""
+    def compute():
+        sprites, status = list_sprites()
+        if status != 200:
+            return [sprites, status]
+        token = get_token("sprite_token", "SPRITE_TOKEN")
+        return [fleet.collect(sprites.get("sprites", []), token, SPRITE_API_BASE, PORT), 200]
+
+    if refresh:
+        fleet_cache.invalidate()
+    body, status = fleet_cache.get(compute, cacheable=lambda value: value[1] == 200)
+    return body, status
+
+
+def get_prewaker():
+    """The pre-wake scheduler (see prewake.py), wired to the Sprites API."""
+    return prewake.get_prewaker(PREWAKE_DIR, _prewake_sprites, _prewake_wake, _prewake_uses)
+
+
+def _prewake_sprites():
+    body, status = list_sprites()
+    if status != 200:
+        raise OSError(f"listing sprites failed: HTTP {status}")
+    return body.get("sprites", [])
+
+
+def _prewake_wake(name):
+    _, status = start_sprite(name)
+    sprite_cache.invalidate()
+    fleet_cache.invalidate()
+    return status == 200
+
+
+def _prewake_uses(name, since):
+    """Access times from a running sprite's own session store (its /api/sessions/events)."""
+    token = get_token("sprite_token", "SPRITE_TOKEN")
+    if not token:
+        return []
+    data = fleet.dashboard_get(name, f"/api/sessions/events?since={since:.0f}&limit=1000",
+                               token, SPRITE_API_BASE, PORT, "events")
+    if not isinstance(data, dict):
+        raise ValueError("unexpected events format")
+    return prewake.event_times(data.get("events", []))
+
+
 def start_sprite(name):
     """Wake a sprite by exec'ing a trivial command. Sprites wake on first request."""
     token = get_token("sprite_token", "SPRITE_TOKEN")
@@ -251,6 +356,10 @@ def destroy_sprite(name):
 class DashboardHandler(SimpleHTTPRequestHandler):
     """Serve static files from public/ and handle API routes."""
 
+    # Idle or slow clients must not hold a pool worker; ws_handshake() clears
+    # the timeout once a connection is upgraded
+    timeout = admission.REQUEST_TIMEOUT
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory=str(PUBLIC_DIR), **kwargs)
 
@@ -260,36 +369,113 @@ class DashboardHandler(SimpleHTTPRequestHandler):
         if not allowed:
             self._json_error(403, f"Forbidden: {info}")
             return False
+        self.identity = info
         return True
 
+    def _admit(self):
+        """Charge an API call to the caller's rate limits; send 429 and return False if over."""
+        path = self.path.split("?")[0]
+        if not path.startswith("/api/") or path in ("/api/terminal", "/api/terminal/mux"):
+            return True  # static files; terminals are limited by concurrency instead
+        upstream = path in ("/api/sprites", "/api/fleet") or (
+            path.startswith("/api/sprites/") and path != "/api/sprites/token-status")
+        refusal = admission.controller.admit_api(self.identity, upstream=upstream)
+        if refusal:
+            self._refuse(refusal)
+            return False
+        return True
+
+    def _refuse(self, refusal):
+        self._json_response({"error": refusal.message}, status=refusal.status,
+                            headers={"Retry-After": str(refusal.retry_after)})
+
     def do_GET(self):
-        if not self._check_auth():
+        if not self._check_auth() or not self._admit():
             return
         # Parse path and query string
         path = self.path.split("?")[0]
-        query = {}
-        if "?" in self.path:
-            for pair in self.path.split("?", 1)[1].split("&"):
-                if "=" in pair:
-                    k, _, v = pair.partition("=")
-                    query[k] = urllib.parse.unquote(v)
+        query = dict(urllib.parse.parse_qsl(self.path.partition("?")[2]))
 
         if path == "/api/terminal":
             upgrade = (self.headers.get("Upgrade", "")).lower()
             if upgrade == "websocket":
                 sprite_name = query.get("sprite", "")
-                sock = ws_handshake(self)
-                if sock:
-                    try:
-                        TerminalSession(sock, sprite_name=sprite_name or None).run()
-                    except Exception:
-                        import traceback
-                        traceback.print_exc()
+                refusal = admission.controller.acquire_terminal(self.identity)
+                if refusal:
+                    self._refuse(refusal)
+                    return
+                try:
+                    sock = terminal_ws.ws_handshake(self)
+                    if sock:
+                        protocol = 2 if query.get("proto") == "2" else 1
+                        terminal_ws.TerminalSession(sock, sprite_name=sprite_name or None,
+                                                    tap_factory=terminal_taps,
+                                                    protocol=protocol).run()
+                except Exception:
+                    import traceback
+                    traceback.print_exc()
+                finally:
+                    admission.controller.release_terminal(self.identity)
                 return
             self.send_error(400, "WebSocket upgrade required")
             return
+        elif path == "/api/terminal/mux":
+            if (self.headers.get("Upgrade", "")).lower() != "websocket":
+                self.send_error(400, "WebSocket upgrade required")
+                return
+            # The socket holds a pool worker for its whole life, so it takes a
+            # terminal slot of its own; each channel takes another for its PTY
+            refusal = admission.controller.acquire_terminal(self.identity)
+            if refusal:
+                self._refuse(refusal)
+                return
+            try:
+                sock = terminal_ws.ws_handshake(self)
+                if sock:
+                    terminal_mux.MuxSession(sock, tap_factory=terminal_taps, identity=self.identity).run()
+            except Exception:
+                import traceback
+                traceback.print_exc()
+            finally:
+                admission.controller.release_terminal(self.identity)
+            return
         elif path == "/api/terminal/status":
-            self._json_response(get_terminal_info())
+            self._json_response(terminal_ws.get_terminal_info())
+        elif path == "/api/terminal/recordings":
+            self._json_response({
+                "enabled": recorder.RECORDING_ENABLED,
+                "recordings": recorder.list_recordings(RECORDINGS_DIR),
+            })
+        elif path.startswith("/api/terminal/recordings/"):
+            self._send_recording(path.rsplit("/", 1)[1], query)
+        elif path == "/api/metrics/terminals":
+            self._json_response(keepalive.registry.metrics())
+        elif path == "/api/files" or path.startswith("/api/files/"):
+            self._files_get(path[len("/api/files"):], query)
+        elif path == "/api/debug/profile":
+            self._debug_profile(query)
+        elif path == "/api/debug/threads":
+            self._debug_threads()
+        elif path == "/api/fleet":
+            result, status_code = get_fleet(refresh=query.get("refresh") == "1")
+            self._json_response(result, status=status_code)
+        elif path == "/api/prewake":
+            self._json_response(get_prewaker().status())
+        elif path == "/api/checkpoint":
+            self._json_response(checkpoint.get_checkpointer(CHECKPOINT_DIR).status())
+        elif path == "/api/logs":
+            self._logs(query)
+        elif path == "/api/metrics/history":
+            self._metrics_history(query)
+        elif path.startswith("/api/sessions/"):
+            self._session_query(path[len("/api/sessions/"):], query)
+        elif path == "/api/metrics/admission":
+            metrics = admission.controller.metrics()
+            if isinstance(self.server, admission.BoundedHTTPServer):
+                metrics["http"] = self.server.stats()
+            self._json_response(metrics)
+        elif path == "/api/terminal/search":
+            self._search_terminal(query)
         elif self.path == "/health":
             self._json_response({"status": "ok"})
         elif self.path == "/api/status":
@@ -312,7 +498,7 @@ class DashboardHandler(SimpleHTTPRequestHandler):
             super().do_GET()
 
     def do_POST(self):
-        if not self._check_auth():
+        if not self._check_auth() or not self._admit():
             return
         # POST /api/sessions/<name>/touch
         parts = self.path.strip("/").split("/")
@@ -335,7 +521,16 @@ class DashboardHandler(SimpleHTTPRequestHandler):
                 self._json_error(400, "Invalid sprite name")
                 return
             result, status_code = start_sprite(sprite_name)
+            if status_code == 200 and prewake.PREWAKE_ENABLED:
+                get_prewaker().record_use(sprite_name)
+            sprite_cache.invalidate()
+            fleet_cache.invalidate()
             self._json_response(result, status=status_code)
+        elif self.path == "/api/checkpoint":
+            self._json_response(checkpoint.get_checkpointer(CHECKPOINT_DIR).snapshot("manual"))
+        elif self.path == "/api/checkpoint/restore":
+            result = checkpoint.get_checkpointer(CHECKPOINT_DIR).restore()
+            self._json_response(result, status=500 if "error" in result else 200)
         elif self.path == "/api/sprites/create":
             if not get_token("sprite_token", "SPRITE_TOKEN"):
                 self._json_error(503, "SPRITE_TOKEN not configured")
@@ -355,14 +550,19 @@ class DashboardHandler(SimpleHTTPRequestHandler):
                 self._json_error(400, "Name must be lowercase alphanumeric/hyphens, 1-63 chars")
                 return
             result, status_code = create_sprite(name)
+            sprite_cache.invalidate()
+            fleet_cache.invalidate()
             self._json_response(result, status=status_code)
         else:
             self.send_error(404, "Not Found")
 
     def do_PUT(self):
-        if not self._check_auth():
+        if not self._check_auth() or not self._admit():
             return
-        if self.path == "/api/settings/tokens":
+        path = self.path.split("?")[0]
+        if path.startswith("/api/files/"):
+            self._files_put(path[len("/api/files"):])
+        elif self.path == "/api/settings/tokens":
             length = int(self.headers.get("Content-Length", 0))
             raw = self.rfile.read(length).decode() if length else "{}"
             try:
@@ -377,6 +577,8 @@ class DashboardHandler(SimpleHTTPRequestHandler):
                     updates[key] = data[key]
             if updates:
                 token_store.set_many(updates)
+                sprite_cache.invalidate()
+                fleet_cache.invalidate()
             self._json_response({
                 "sprite_token": get_token_status("sprite_token", "SPRITE_TOKEN"),
                 "anthropic_key": get_token_status("anthropic_key", "ANTHROPIC_API_KEY"),
@@ -385,7 +587,7 @@ class DashboardHandler(SimpleHTTPRequestHandler):
             self.send_error(404, "Not Found")
 
     def do_DELETE(self):
-        if not self._check_auth():
+        if not self._check_auth() or not self._admit():
             return
         # DELETE /api/sprites/<name>
         parts = self.path.strip("/").split("/")
@@ -395,16 +597,206 @@ class DashboardHandler(SimpleHTTPRequestHandler):
                 self._json_error(400, "Invalid sprite name")
                 return
             result, status_code = destroy_sprite(name)
+            sprite_cache.invalidate()
+            fleet_cache.invalidate()
             self._json_response(result, status=status_code)
         else:
             self.send_error(404, "Not Found")
 
-    def _json_response(self, data, status=200):
+    def _search_terminal(self, query):
+        """Search indexed terminal output: ?q=&sprite=&limit=&since=&until= (ms)."""
+        q = query.get("q", "")
+        if not q.strip():
+            self._json_error(400, "q is required")
+            return
+        try:
+            limit = min(int(query.get("limit", 100)), 1000)
+            since = int(query["since"]) if query.get("since") else None
+            until = int(query["until"]) if query.get("until") else None
+        except ValueError:
+            self._json_error(400, "limit/since/until must be integers")
+            return
+        key = None
+        if query.get("sprite"):
+            key = search_index.index_key(query["sprite"], terminal_ws.TMUX_SESSION)
+        started = time.monotonic()
+        results = search_index.search(SEARCH_DIR, q, key=key, limit=limit,
+                                      since=since, until=until)
+        self._json_response({
+            "query": q,
+            "enabled": search_index.SEARCH_ENABLED,
+            "results": results,
+            "took_ms": round((time.monotonic() - started) * 1000, 1),
+        })
+
+    def _files_get(self, rel_path, query):
+        """Directory listing (?offset=&limit=) or file download (Range aware)."""
+        try:
+            target = files.resolve(rel_path)
+            if target.is_dir():
+                try:
+                    offset = max(0, int(query.get("offset", 0)))
+                    limit = int(query.get("limit", files.LIST_LIMIT))
+                except ValueError:
+                    self._json_error(400, "offset/limit must be integers")
+                    return
+                self._json_response(files.list_dir(target, offset, limit))
+            else:
+                files.send_file(self, target)
+        except files.FileError as e:
+            self._json_response(dict({"error": str(e)}, **e.extra), status=e.status)
+        except PermissionError:
+            self._json_error(403, "Permission denied")
+
+    def _files_put(self, rel_path):
+        """Streaming upload; resumable with Content-Range."""
+        try:
+            target = files.resolve(rel_path, must_exist=False)
+            status, body = files.receive_file(self, target)
+        except files.FileError as e:
+            self.close_connection = True
+            self._json_response(dict({"error": str(e)}, **e.extra), status=e.status)
+            return
+        except PermissionError:
+            self.close_connection = True
+            self._json_error(403, "Permission denied")
+            return
+        self._json_response(body, status=status)
+
+    def _debug_allowed(self):
+        """Debug endpoints expose stacks and session details; never without auth."""
+        if self.identity == "no-auth-configured":
+            self._json_error(403, "Debug endpoints need authentication (set DASHBOARD_TOKEN or CF_POLICY_AUD)")
+            return False
+        return True
+
+    def _debug_profile(self, query):
+        """Sample all threads for ?seconds= and return collapsed stacks (flamegraph input)."""
+        if not self._debug_allowed():
+            return
+        try:
+            seconds = float(query.get("seconds", profiler.DEFAULT_SECONDS))
+            interval_ms = float(query.get("interval_ms", profiler.DEFAULT_INTERVAL_MS))
+        except ValueError:
+            self._json_error(400, "seconds/interval_ms must be numbers")
+            return
+        try:
+            text, stats = profiler.profile(seconds, interval_ms)
+        except profiler.ProfilerBusy as e:
+            self._json_response({"error": str(e)}, status=409, headers={"Retry-After": "5"})
+            return
+        body = text.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("X-Profile-Samples", str(stats["samples"]))
+        self.send_header("X-Profile-Seconds", str(stats["seconds"]))
+        self.send_header("X-Profile-Thread-Cpu", json.dumps(stats["thread_cpu_s"]))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _debug_threads(self):
+        """Per-thread state plus the live terminal session inventory."""
+        if not self._debug_allowed():
+            return
+        data = {
+            "pid": os.getpid(),
+            "threads": profiler.threads(),
+            "terminals": profiler.terminal_sessions(keepalive.registry),
+            "log_streams": logtail.stream_count(),
+        }
+        if isinstance(self.server, admission.BoundedHTTPServer):
+            data["http"] = self.server.stats()
+        self._json_response(data)
+
+    def _logs(self, query):
+        """List log sources, or follow one over a WebSocket (see logtail.py)."""
+        if (self.headers.get("Upgrade", "")).lower() != "websocket":
+            self._json_response(logtail.list_sources())
+            return
+        try:
+            stream = logtail.open_stream(query)
+        except logtail.LogError as e:
+            self._json_error(e.status, str(e))
+            return
+        # A stream holds a worker thread for as long as a terminal does
+        refusal = admission.controller.acquire_terminal(self.identity)
+        if refusal:
+            stream.follower.close()
+            self._refuse(refusal)
+            return
+        try:
+            sock = terminal_ws.ws_handshake(self)
+            if sock:
+                stream.run(sock)
+            else:
+                stream.follower.close()
+        finally:
+            admission.controller.release_terminal(self.identity)
+
+    def _metrics_history(self, query):
+        """Resource history: ?resolution=1s|1m|1h&session=<name>&since=<unix seconds>."""
+        try:
+            since = float(query["since"]) if query.get("since") else None
+            data = sampler.sampler.history(query.get("resolution", "1s"),
+                                           name=query.get("session") or None, since=since)
+        except ValueError as e:
+            self._json_error(400, str(e))
+            return
+        self._json_response(data)
+
+    def _session_query(self, kind, query):
+        """recent?limit=N, idle?seconds=N, activity?since=T, events?session=&since=T&limit=N."""
+        try:
+            since = float(query["since"]) if query.get("since") else None
+            if kind == "recent":
+                result = store.recent(int(query.get("limit", 20)))
+            elif kind == "idle":
+                result = store.idle(float(query.get("seconds", 3600)))
+            elif kind == "activity":
+                result = store.client_activity(since=since)
+            elif kind == "events":
+                limit = int(query["limit"]) if query.get("limit") else None
+                result = store.events(name=query.get("session") or None, since=since, limit=limit)
+            else:
+                self._json_error(404, "Unknown session query")
+                return
+        except ValueError:
+            self._json_error(400, "limit, seconds and since must be numbers")
+            return
+        self._json_response({"store": session.SESSION_STORE, kind: result})
+
+    def _send_recording(self, rec_id, query):
+        """Stream an asciicast recording, optionally seeking to ?start=&end= (seconds)."""
+        rec_path = recorder.recording_dir(RECORDINGS_DIR, rec_id)
+        if rec_path is None:
+            self._json_error(404, "Recording not found")
+            return
+        try:
+            start = float(query.get("start", 0) or 0)
+            end = float(query["end"]) if query.get("end") else None
+        except ValueError:
+            self._json_error(400, "start/end must be numbers (seconds)")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-asciicast")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            for line in recorder.read_recording(rec_path, start=max(start, 0.0), end=end):
+                self.wfile.write(line)
+        except (BrokenPipeError, ConnectionError):
+            pass
+
+    def _json_response(self, data, status=200, headers=None):
         body = json.dumps(data).encode()
         self.send_response(status)
         self.send_header("Content-Type", "application/json")
         self.send_header("Content-Length", len(body))
         self.send_header("Cache-Control", "no-cache")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
         self.wfile.write(body)
 
@@ -416,14 +808,67 @@ class DashboardHandler(SimpleHTTPRequestHandler):
         pass
 
 
+def drain(server, timeout):
+    """Wait for in-flight requests and terminals to finish; reap what is left after *timeout*."""
+    logtail.close_all()     # viewers just reconnect to another worker
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = server.stats()
+        if not stats["busy"] and not stats["queued"]:
+            return
+        time.sleep(0.5)
+    for session in keepalive.registry.sessions():
+        session.reap("drain")
+    time.sleep(2)
+
+
 def main():
-    server = ThreadingHTTPServer(("0.0.0.0", PORT), DashboardHandler)
-    print(f"Dashboard listening on http://0.0.0.0:{PORT}")
+    if fastboot.is_master():
+        prefork.Master(PORT, prefork.WORKERS, os.path.abspath(__file__), fastboot.listener).run()
+        return
+
+    # fastboot.start() already holds the listening socket
+    server = admission.BoundedHTTPServer(("0.0.0.0", PORT), DashboardHandler,
+                                         bind_and_activate=False)
+    server.socket.close()
+    server.socket = fastboot.listener
+    server.server_address = fastboot.listener.getsockname()
+    fastboot.handoff(server)
+    sampler.sampler.start()
+    checkpoint.get_checkpointer(CHECKPOINT_DIR).start()
+    if prewake.PREWAKE_ENABLED:
+        get_prewaker().start()
+    is_worker = bool(os.environ.get("DASHBOARD_WORKER_ID"))
+    if is_worker:
+        admission.controller.share_terminals(DATA_DIR / "admission" / "terminals.json")
+        print(f"Worker {os.environ['DASHBOARD_WORKER_ID']} (pid {os.getpid()}) serving")
+    else:
+        print(f"Dashboard listening on http://0.0.0.0:{server.server_address[1]}")
+        # Only the prefork master rolls workers on SIGHUP; here its default
+        # action would kill the dashboard without a drain or checkpoint
+        signal.signal(signal.SIGHUP, lambda signum, frame: print(
+            "SIGHUP ignored: rolling restarts need DASHBOARD_WORKERS > 1"))
+
+    # SIGTERM drains: stop accepting, let requests and terminals finish
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
     try:
         server.serve_forever()
     except KeyboardInterrupt:
         print("\nShutting down.")
         server.shutdown()
+        if search_index.SEARCH_ENABLED:
+            search_index.shutdown()
+        return
+    server.socket.close()
+    # Sleep or shutdown may take tmux with it
+    checkpoint.get_checkpointer(CHECKPOINT_DIR).snapshot("shutdown")
+    # A worker drains while its replacement takes new connections.  A single
+    # process has no replacement, so waiting would only delay the restart
+    # (and outlast systemd's stop timeout): close terminals right away.
+    drain(server, prefork.DRAIN_TIMEOUT if is_worker else 0)
+    # Terminals are closed now: write out what the search index still buffers
+    if search_index.SEARCH_ENABLED:
+        search_index.shutdown()
 
 
 if __name__ == "__main__":
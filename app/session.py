@@ -1,18 +1,45 @@
 """
 Session state persistence — tracks workspace sessions across sleep/wake.
 
-Backed by a single JSON file with fcntl file locking for thread safety.
+Backed by a single JSON file.  Read-modify-write cycles hold an fcntl lock
+on a sidecar .lock file and writes replace the file atomically, so
+threads and dashboard worker processes can share it.
+
+SESSION_STORE=sqlite selects the SQLite backend in session_db.py instead,
+which keeps every access as an event rather than only the latest one.
+Both offer the same interface; open_store() picks one.
 """
 
 import fcntl
 import json
+import os
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from pathlib import Path
 
+SESSION_STORE = os.environ.get("SESSION_STORE", "json").strip().lower()
+
+
+def open_store(data_dir, engine=None):
+    """The session store for *data_dir* using *engine* (default SESSION_STORE)."""
+    engine = engine or SESSION_STORE
+    data_dir = Path(data_dir)
+    if engine == "sqlite":
+        from session_db import SqliteSessionStore
+        return SqliteSessionStore(data_dir / "sessions.db", legacy_path=data_dir / "state.json")
+    if engine != "json":
+        raise ValueError(f"SESSION_STORE must be 'json' or 'sqlite', not {engine!r}")
+    return SessionStore(data_dir / "state.json")
+
+
+def _epoch(iso):
+    return datetime.fromisoformat(iso).timestamp()
+
 
 class SessionStore:
     def __init__(self, path):
         self._path = Path(path)
+        self._lock_path = self._path.with_name(self._path.name + ".lock")
         self._path.parent.mkdir(parents=True, exist_ok=True)
 
     def _read(self):
@@ -26,14 +53,24 @@ class SessionStore:
                 fcntl.flock(f, fcntl.LOCK_UN)
 
     def _write(self, data):
+        """Replace the file atomically so readers never see a partial write."""
         self._path.parent.mkdir(parents=True, exist_ok=True)
-        with open(self._path, "w") as f:
-            fcntl.flock(f, fcntl.LOCK_EX)
+        tmp = self._path.with_name(f".{self._path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=2)
+            f.write("\n")
+        os.replace(tmp, self._path)
+
+    @contextmanager
+    def _locked(self):
+        """Hold the store's lock across a read-modify-write (shared by all workers)."""
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self._lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
             try:
-                json.dump(data, f, indent=2)
-                f.write("\n")
+                yield
             finally:
-                fcntl.flock(f, fcntl.LOCK_UN)
+                fcntl.flock(lock, fcntl.LOCK_UN)
 
     def list(self):
         return self._read()["sessions"]
@@ -42,51 +79,99 @@ class SessionStore:
         return self._read()["sessions"].get(name)
 
     def touch(self, name, client="dashboard"):
-        data = self._read()
-        now = datetime.now(timezone.utc).isoformat()
-        session = data["sessions"].get(name)
-        if session is None:
-            session = {
-                "name": name,
-                "created_at": now,
-                "last_accessed_at": now,
-                "last_client": client,
-                "state": "active",
-            }
-        else:
-            session["last_accessed_at"] = now
-            session["last_client"] = client
-            session["state"] = "active"
-        data["sessions"][name] = session
-        self._write(data)
-        return session
-
-    def delete(self, name):
-        data = self._read()
-        data["sessions"].pop(name, None)
-        self._write(data)
-
-    def sync(self, tmux_sessions):
-        live_names = {s["name"] for s in tmux_sessions}
-        data = self._read()
-        now = datetime.now(timezone.utc).isoformat()
-
-        # Create entries for tmux sessions not yet tracked
-        for s in tmux_sessions:
-            if s["name"] not in data["sessions"]:
-                data["sessions"][s["name"]] = {
-                    "name": s["name"],
+        with self._locked():
+            data = self._read()
+            now = datetime.now(timezone.utc).isoformat()
+            session = data["sessions"].get(name)
+            if session is None:
+                session = {
+                    "name": name,
                     "created_at": now,
                     "last_accessed_at": now,
-                    "last_client": "terminal",
+                    "last_client": client,
                     "state": "active",
                 }
             else:
-                data["sessions"][s["name"]]["state"] = "active"
+                session["last_accessed_at"] = now
+                session["last_client"] = client
+                session["state"] = "active"
+            data["sessions"][name] = session
+            self._write(data)
+            return session
+
+    def delete(self, name):
+        with self._locked():
+            data = self._read()
+            data["sessions"].pop(name, None)
+            self._write(data)
+
+    def sync(self, tmux_sessions):
+        with self._locked():
+            live_names = {s["name"] for s in tmux_sessions}
+            data = self._read()
+            now = datetime.now(timezone.utc).isoformat()
+
+            # Create entries for tmux sessions not yet tracked
+            for s in tmux_sessions:
+                if s["name"] not in data["sessions"]:
+                    data["sessions"][s["name"]] = {
+                        "name": s["name"],
+                        "created_at": now,
+                        "last_accessed_at": now,
+                        "last_client": "terminal",
+                        "state": "active",
+                    }
+                else:
+                    data["sessions"][s["name"]]["state"] = "active"
+
+            # Mark tracked sessions idle if their tmux session is gone
+            for name, session in data["sessions"].items():
+                if name not in live_names:
+                    session["state"] = "idle"
+
+            self._write(data)
+
+    # -----------------------------------------------------------------------
+    # Queries
+    #
+    # Only the latest access of each session is kept, so access history is
+    # one event per session here; the SQLite store answers from every access.
+    # -----------------------------------------------------------------------
+
+    def recent(self, limit=20):
+        """Most recently accessed sessions, newest first."""
+        sessions = sorted(self.list().values(), key=lambda s: _epoch(s["last_accessed_at"]), reverse=True)
+        return sessions[:limit]
+
+    def idle(self, seconds):
+        """Sessions not accessed for more than *seconds*, longest idle first."""
+        cutoff = datetime.now(timezone.utc).timestamp() - seconds
+        sessions = [s for s in self.list().values() if _epoch(s["last_accessed_at"]) < cutoff]
+        return sorted(sessions, key=lambda s: _epoch(s["last_accessed_at"]))
 
-        # Mark tracked sessions idle if their tmux session is gone
-        for name, session in data["sessions"].items():
-            if name not in live_names:
-                session["state"] = "idle"
+    def client_activity(self, since=None):
+        """Per-client accesses, distinct sessions and last access since *since* (unix seconds)."""
+        clients = {}
+        for s in self.list().values():
+            at = _epoch(s["last_accessed_at"])
+            if since is not None and at < since:
+                continue
+            entry = clients.setdefault(s["last_client"], {
+                "client": s["last_client"], "accesses": 0, "sessions": 0, "last_access": None,
+            })
+            entry["accesses"] += 1
+            entry["sessions"] += 1
+            if entry["last_access"] is None or at > _epoch(entry["last_access"]):
+                entry["last_access"] = s["last_accessed_at"]
+        return sorted(clients.values(), key=lambda c: -c["accesses"])
 
-        self._write(data)
+    def events(self, name=None, since=None, limit=None):
+        """Access events {session, client, at} oldest first, optionally for one session / since *since*."""
+        out = [
+            {"session": s["name"], "client": s["last_client"], "at": s["last_accessed_at"]}
+            for s in self.list().values()
+            if (name is None or s["name"] == name)
+            and (since is None or _epoch(s["last_accessed_at"]) >= since)
+        ]
+        out.sort(key=lambda e: _epoch(e["at"]))
+        return out[-limit:] if limit else out
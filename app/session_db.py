@@ -0,0 +1,229 @@
+"""
+SQLite session store — SESSION_STORE=sqlite.
+
+Same interface as session.SessionStore, backed by one SQLite database in
+WAL mode: readers never block the writer and vice versa, and writers in
+different threads or worker processes queue on SQLite's own lock (with a
+busy timeout) instead of rewriting a whole JSON document per change.
+
+    sessions       one row per session, indexed by last access and state
+    access_events  append-only, one row per touch(): (session, client, at)
+
+Every touch() is a single transaction that updates the session row and
+appends its event, so history and current state never disagree.  Events
+older than SESSION_EVENT_RETENTION_DAYS are pruned when the store opens.
+
+Timestamps are stored as unix seconds and returned in the same ISO 8601
+form the JSON store uses.  On first open an existing state.json is
+imported, so switching engines keeps the session list.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+SESSION_EVENT_RETENTION_DAYS = float(os.environ.get("SESSION_EVENT_RETENTION_DAYS", 180))
+BUSY_TIMEOUT = 10.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    name              TEXT PRIMARY KEY,
+    created_at        REAL NOT NULL,
+    last_accessed_at  REAL NOT NULL,
+    last_client       TEXT NOT NULL,
+    state             TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_accessed_at);
+CREATE INDEX IF NOT EXISTS sessions_state ON sessions (state, last_accessed_at);
+
+CREATE TABLE IF NOT EXISTS access_events (
+    id       INTEGER PRIMARY KEY,
+    session  TEXT NOT NULL,
+    client   TEXT NOT NULL,
+    at       REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS access_events_at ON access_events (at);
+CREATE INDEX IF NOT EXISTS access_events_session ON access_events (session, at);
+CREATE INDEX IF NOT EXISTS access_events_client ON access_events (client, at);
+"""
+
+_COLUMNS = "name, created_at, last_accessed_at, last_client, state"
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+def _row(row):
+    name, created, accessed, client, state = row
+    return {
+        "name": name,
+        "created_at": _iso(created),
+        "last_accessed_at": _iso(accessed),
+        "last_client": client,
+        "state": state,
+    }
+
+
+class SqliteSessionStore:
+    def __init__(self, path, legacy_path=None):
+        self._path = Path(path)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._db().executescript(_SCHEMA)    # idempotent; runs outside a transaction
+        with self._transaction() as db:
+            empty = db.execute("SELECT NOT EXISTS (SELECT 1 FROM sessions)").fetchone()[0]
+            if empty and legacy_path is not None:
+                self._import_json(db, Path(legacy_path))
+            if SESSION_EVENT_RETENTION_DAYS > 0:
+                db.execute("DELETE FROM access_events WHERE at < ?",
+                           (time.time() - SESSION_EVENT_RETENTION_DAYS * 86400,))
+
+    # -----------------------------------------------------------------------
+    # Connections
+    # -----------------------------------------------------------------------
+
+    def _db(self):
+        """This thread's connection (connections are not shared across threads or forks)."""
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self._path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                                 check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def _transaction(self):
+        return _Transaction(self._db())
+
+    @staticmethod
+    def _import_json(db, legacy_path):
+        try:
+            with open(legacy_path) as f:
+                sessions = json.load(f).get("sessions", {})
+        except (OSError, ValueError):
+            return
+        for s in sessions.values():
+            try:
+                created = datetime.fromisoformat(s["created_at"]).timestamp()
+                accessed = datetime.fromisoformat(s["last_accessed_at"]).timestamp()
+            except (KeyError, TypeError, ValueError):
+                continue
+            client = s.get("last_client", "dashboard")
+            db.execute(f"INSERT OR IGNORE INTO sessions ({_COLUMNS}) VALUES (?, ?, ?, ?, ?)",
+                       (s["name"], created, accessed, client, s.get("state", "idle")))
+            db.execute("INSERT INTO access_events (session, client, at) VALUES (?, ?, ?)",
+                       (s["name"], client, accessed))
+
+    # -----------------------------------------------------------------------
+    # SessionStore interface
+    # -----------------------------------------------------------------------
+
+    def list(self):
+        rows = self._db().execute(f"SELECT {_COLUMNS} FROM sessions ORDER BY name")
+        return {row[0]: _row(row) for row in rows}
+
+    def get(self, name):
+        row = self._db().execute(f"SELECT {_COLUMNS} FROM sessions WHERE name = ?", (name,)).fetchone()
+        return _row(row) if row else None
+
+    def touch(self, name, client="dashboard"):
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                f"INSERT INTO sessions ({_COLUMNS}) VALUES (?, ?, ?, ?, 'active') "
+                "ON CONFLICT (name) DO UPDATE SET last_accessed_at = excluded.last_accessed_at, "
+                "last_client = excluded.last_client, state = 'active'",
+                (name, now, now, client),
+            )
+            db.execute("INSERT INTO access_events (session, client, at) VALUES (?, ?, ?)",
+                       (name, client, now))
+            row = db.execute(f"SELECT {_COLUMNS} FROM sessions WHERE name = ?", (name,)).fetchone()
+        return _row(row)
+
+    def delete(self, name):
+        # Access history is kept: it describes when the workspace was used,
+        # not just this session
+        with self._transaction() as db:
+            db.execute("DELETE FROM sessions WHERE name = ?", (name,))
+
+    def sync(self, tmux_sessions):
+        live = [s["name"] for s in tmux_sessions]
+        now = time.time()
+        with self._transaction() as db:
+            db.executemany(
+                f"INSERT INTO sessions ({_COLUMNS}) VALUES (?, ?, ?, 'terminal', 'active') "
+                "ON CONFLICT (name) DO UPDATE SET state = 'active' WHERE state != 'active'",
+                [(name, now, now) for name in live],
+            )
+            placeholders = ",".join("?" * len(live))
+            db.execute(
+                f"UPDATE sessions SET state = 'idle' WHERE state != 'idle'"
+                + (f" AND name NOT IN ({placeholders})" if live else ""),
+                live,
+            )
+
+    # -----------------------------------------------------------------------
+    # Queries
+    # -----------------------------------------------------------------------
+
+    def recent(self, limit=20):
+        """Most recently accessed sessions, newest first."""
+        rows = self._db().execute(
+            f"SELECT {_COLUMNS} FROM sessions ORDER BY last_accessed_at DESC LIMIT ?", (limit,))
+        return [_row(row) for row in rows]
+
+    def idle(self, seconds):
+        """Sessions not accessed for more than *seconds*, longest idle first."""
+        rows = self._db().execute(
+            f"SELECT {_COLUMNS} FROM sessions WHERE last_accessed_at < ? ORDER BY last_accessed_at",
+            (time.time() - seconds,))
+        return [_row(row) for row in rows]
+
+    def client_activity(self, since=None):
+        """Per-client accesses, distinct sessions and last access since *since* (unix seconds)."""
+        rows = self._db().execute(
+            "SELECT client, COUNT(*), COUNT(DISTINCT session), MAX(at) FROM access_events "
+            "WHERE at >= ? GROUP BY client ORDER BY COUNT(*) DESC",
+            (since if since is not None else 0,))
+        return [
+            {"client": client, "accesses": accesses, "sessions": sessions, "last_access": _iso(last)}
+            for client, accesses, sessions, last in rows
+        ]
+
+    def events(self, name=None, since=None, limit=None):
+        """Access events {session, client, at} oldest first, optionally for one session / since *since*."""
+        where, params = ["at >= ?"], [since if since is not None else 0]
+        if name is not None:
+            where.append("session = ?")
+            params.append(name)
+        sql = f"SELECT session, client, at FROM access_events WHERE {' AND '.join(where)}"
+        if limit:
+            # Newest *limit*, returned oldest first
+            sql = f"SELECT * FROM ({sql} ORDER BY at DESC LIMIT ?) ORDER BY at"
+            params.append(limit)
+        else:
+            sql += " ORDER BY at"
+        return [{"session": s, "client": c, "at": _iso(at)} for s, c, at in self._db().execute(sql, params)]
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK: takes the write lock up front so
+    concurrent read-modify-writes queue instead of failing to upgrade."""
+
+    def __init__(self, db):
+        self._db = db
+
+    def __enter__(self):
+        self._db.execute("BEGIN IMMEDIATE")
+        return self._db
+
+    def __exit__(self, exc_type, exc, tb):
+        self._db.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
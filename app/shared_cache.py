@@ -0,0 +1,69 @@
+"""
+Small file-backed TTL cache shared by every dashboard worker process.
+
+Used for upstream lookups (the sprite list) that every open tab polls: one
+worker refreshes the entry while holding an fcntl lock and the others wait
+and read its result, so N workers cost the Sprites API one call per TTL
+instead of N.
+"""
+
+import fcntl
+import json
+import os
+import time
+from pathlib import Path
+
+
+class SharedCache:
+    def __init__(self, path, ttl):
+        self._path = Path(path)
+        self._lock_path = self._path.with_name(self._path.name + ".lock")
+        self.ttl = ttl
+
+    def _load(self):
+        try:
+            with open(self._path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get("stored_at", 0) > self.ttl:
+            return None
+        return entry.get("value")
+
+    def _store(self, value):
+        tmp = self._path.with_name(f".{self._path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"stored_at": time.time(), "value": value}, f)
+        os.replace(tmp, self._path)
+
+    def get(self, compute, cacheable=lambda value: True):
+        """
+        Return the cached value, or compute(), store and return it.
+
+        Only one process computes at a time; results for which
+        cacheable(value) is false are returned but not stored.
+        """
+        if self.ttl <= 0:
+            return compute()
+        value = self._load()
+        if value is not None:
+            return value
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self._lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                value = self._load()   # another worker may have refreshed it
+                if value is not None:
+                    return value
+                value = compute()
+                if cacheable(value):
+                    self._store(value)
+                return value
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def invalidate(self):
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
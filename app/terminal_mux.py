@@ -0,0 +1,428 @@
+"""
+Multiplexed terminals over one WebSocket (/api/terminal/mux).
+
+Each logical terminal is a channel with its own PTY (one per sprite or
+tmux window).  Every WebSocket message is a binary frame:
+
+    u8 type | u16 channel | payload          (network byte order)
+
+Client -> server:
+    OPEN    0x01  JSON {"sprite": str|null, "cols": int, "rows": int}
+    DATA    0x02  input bytes for the channel's PTY
+    RESIZE  0x03  u16 cols, u16 rows
+    CLOSE   0x04  (empty)
+    ACK     0x05  u32 bytes of output the client has consumed
+
+Server -> client:
+    DATA    0x02  PTY output
+    CLOSE   0x04  utf-8 reason (empty when the process exited)
+    FLOW    0x07  u8 1 = pause input, 0 = resume
+
+Output is credit-based: a channel may have at most CHANNEL_WINDOW bytes
+sent but not yet ACKed, and a channel out of credit stops reading its
+PTY, so a slow terminal pushes back on its own process only.  One IO
+thread selects over every PTY and sends in round-robin quanta of at most
+SEND_QUANTUM bytes per channel, so a noisy channel cannot starve the rest.
+Input uses the same queue/water-mark scheme as TerminalSession.
+
+With TERMINAL_FRAME_SKIP_BYTES set, a channel keeps reading its PTY while
+out of credit and queues output in a FrameSkipper; once the backlog passes
+the threshold it is dropped and the next credit is spent on a screen frame.
+"""
+
+import collections
+import json
+import os
+import select
+import socket
+import struct
+import threading
+import time
+
+from admission import controller as admission
+from keepalive import registry
+from screen import FrameSkipper
+from terminal_ws import (
+    build_command, spawn_pty, resize_pty, stop_pty,
+    ws_decode_frame, ws_encode_frame,
+    FRAME_SKIP_BYTES, INPUT_HIGH_WATER, INPUT_LOW_WATER, INPUT_HARD_LIMIT, PTY_WRITE_CHUNK,
+)
+
+MUX_OPEN = 0x01
+MUX_DATA = 0x02
+MUX_RESIZE = 0x03
+MUX_CLOSE = 0x04
+MUX_ACK = 0x05
+MUX_FLOW = 0x07
+
+CHANNEL_WINDOW = 256 * 1024
+SEND_QUANTUM = 16 * 1024
+MAX_CHANNELS = 16
+
+_HEADER = struct.Struct("!BH")
+
+
+def _frame(kind, channel, payload=b""):
+    return ws_encode_frame(_HEADER.pack(kind, channel) + payload, opcode=0x02)
+
+
+class _Channel:
+    def __init__(self, cid, sprite_name, master_fd, proc, taps, skipper=None):
+        self.id = cid
+        self.sprite_name = sprite_name
+        self.master_fd = master_fd
+        self.proc = proc
+        self.taps = taps
+        self.out = bytearray()
+        self.skipper = skipper      # replaces self.out in frame-skipping mode
+        self.credit = CHANNEL_WINDOW
+        self.inq = collections.deque()
+        self.inq_bytes = 0
+        self.paused = False
+        self.eof = False
+        self.close_request = None   # (notify, reason), honoured by the IO thread
+
+    def has_output(self):
+        if self.skipper:
+            return self.skipper.pending()
+        return bool(self.out)
+
+
+class MuxSession:
+    """
+    Bridge one WebSocket to many PTY channels.
+
+    *tap_factory(sprite_name)* returns the taps (recorder, search index...)
+    for a newly opened channel, as for TerminalSession.  Every channel is
+    a PTY and takes a terminal slot from admission control for *identity*.
+    """
+
+    def __init__(self, sock, tap_factory=None, identity=None):
+        self.sock = sock
+        self.tap_factory = tap_factory or (lambda sprite_name: [])
+        self.identity = identity
+        self.channels = {}
+        self.last_input = time.monotonic()
+        self.reap_reason = None
+        self._alive = True
+        self._lock = threading.Lock()       # guards self.channels and per-channel queues
+        self._send_lock = threading.Lock()
+        self._rr = collections.deque()      # round-robin order of channel ids
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+
+    @property
+    def sprite_name(self):
+        names = sorted({c.sprite_name or "local" for c in list(self.channels.values())})
+        return "mux:" + ",".join(names)
+
+    def run(self):
+        registry.register(self)
+        reader = threading.Thread(target=self._read_ws, daemon=True)
+        reader.start()
+        try:
+            self._io_loop()
+        finally:
+            self._alive = False
+            registry.unregister(self)
+            for cid in list(self.channels):
+                self._close_channel(cid, notify=False)
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            reader.join(timeout=2)
+            for fd in (self._wake_r, self._wake_w):
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+
+    # -- keepalive interface -------------------------------------------------
+
+    def ping(self, payload):
+        if not self._send_lock.acquire(blocking=False):
+            return False
+        try:
+            frame = ws_encode_frame(payload, opcode=0x09)
+            sent = self.sock.send(frame, socket.MSG_DONTWAIT)
+        except (BlockingIOError, OSError):
+            return False
+        finally:
+            self._send_lock.release()
+        if sent != len(frame):
+            self.reap("send_error")
+            return False
+        return True
+
+    def reap(self, reason):
+        if self.reap_reason is None:
+            self.reap_reason = reason
+        self._alive = False
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._wake()
+
+    # -- helpers ---------------------------------------------------------------
+
+    def _send(self, frame):
+        with self._send_lock:
+            self.sock.sendall(frame)
+
+    def _wake(self):
+        try:
+            os.write(self._wake_w, b"\0")
+        except OSError:
+            pass
+
+    # -- WebSocket reader --------------------------------------------------------
+
+    def _read_ws(self):
+        try:
+            while self._alive:
+                opcode, payload = ws_decode_frame(self.sock)
+                if opcode == 0x08:
+                    break
+                if opcode == 0x09:
+                    self._send(ws_encode_frame(payload, opcode=0x0A))
+                    continue
+                if opcode == 0x0A:
+                    registry.on_pong(self, payload)
+                    continue
+                if opcode != 0x02 or len(payload) < _HEADER.size:
+                    continue
+                kind, cid = _HEADER.unpack_from(payload)
+                body = payload[_HEADER.size:]
+                if kind == MUX_DATA:
+                    self._enqueue_input(cid, body)
+                elif kind == MUX_ACK and len(body) >= 4:
+                    with self._lock:
+                        chan = self.channels.get(cid)
+                        if chan:
+                            chan.credit = min(CHANNEL_WINDOW, chan.credit + struct.unpack("!I", body[:4])[0])
+                    self._wake()
+                elif kind == MUX_RESIZE and len(body) >= 4:
+                    cols, rows = struct.unpack("!HH", body[:4])
+                    chan = self.channels.get(cid)
+                    if chan:
+                        resize_pty(chan.master_fd, chan.proc, cols, rows)
+                        if chan.skipper:
+                            chan.skipper.resize(cols, rows)
+                        for tap in chan.taps:
+                            tap.resize(cols, rows)
+                elif kind == MUX_OPEN:
+                    self._open_channel(cid, body)
+                elif kind == MUX_CLOSE:
+                    self._request_close(cid, notify=False)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self._alive = False
+            self._wake()
+
+    def _open_channel(self, cid, body):
+        try:
+            opts = json.loads(body.decode() or "{}")
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            opts = {}
+        if cid in self.channels:
+            self._send(_frame(MUX_CLOSE, cid, b"channel already open"))
+            return
+        if len(self.channels) >= MAX_CHANNELS:
+            self._send(_frame(MUX_CLOSE, cid, b"too many channels"))
+            return
+        refusal = admission.acquire_terminal(self.identity)
+        if refusal:
+            self._send(_frame(MUX_CLOSE, cid, refusal.message.encode()))
+            return
+        sprite_name = opts.get("sprite") or None
+        cmd, error = build_command(sprite_name)
+        if error:
+            admission.release_terminal(self.identity)
+            self._send(_frame(MUX_CLOSE, cid, error.encode()))
+            return
+        try:
+            master_fd, proc = spawn_pty(cmd)
+        except OSError as e:
+            admission.release_terminal(self.identity)
+            self._send(_frame(MUX_CLOSE, cid, str(e).encode()))
+            return
+        cols, rows = opts.get("cols") or 80, opts.get("rows") or 24
+        if opts.get("cols") and opts.get("rows"):
+            resize_pty(master_fd, proc, cols, rows)
+        skipper = FrameSkipper(cols, rows, threshold=FRAME_SKIP_BYTES) if FRAME_SKIP_BYTES else None
+        chan = _Channel(cid, sprite_name, master_fd, proc, list(self.tap_factory(sprite_name)), skipper)
+        with self._lock:
+            self.channels[cid] = chan
+            self._rr.append(cid)
+        self._wake()
+
+    def _request_close(self, cid, notify=True, reason=b""):
+        """Ask the IO thread to close *cid* (it owns the PTY fds)."""
+        with self._lock:
+            chan = self.channels.get(cid)
+            if chan and chan.close_request is None:
+                chan.close_request = (notify, reason)
+        self._wake()
+
+    def _close_channel(self, cid, notify=True, reason=b""):
+        with self._lock:
+            chan = self.channels.pop(cid, None)
+            if chan is None:
+                return
+            try:
+                self._rr.remove(cid)
+            except ValueError:
+                pass
+        for tap in chan.taps:
+            try:
+                tap.close()
+            except Exception:
+                pass
+        stop_pty(chan.master_fd, chan.proc)
+        admission.release_terminal(self.identity)
+        if notify:
+            try:
+                self._send(_frame(MUX_CLOSE, cid, reason))
+            except OSError:
+                pass
+
+    def _enqueue_input(self, cid, data):
+        if not data:
+            return
+        self.last_input = time.monotonic()
+        flow = None
+        overflow = False
+        with self._lock:
+            chan = self.channels.get(cid)
+            if chan is None:
+                return
+            if chan.inq_bytes + len(data) > INPUT_HARD_LIMIT:
+                overflow = True
+            else:
+                chan.inq.append(data)
+                chan.inq_bytes += len(data)
+                if not chan.paused and chan.inq_bytes >= INPUT_HIGH_WATER:
+                    chan.paused = True
+                    flow = b"\x01"
+        if overflow:
+            # Blocking here would stall every channel; drop the offender instead
+            self._request_close(cid, reason=b"input overflow")
+            return
+        if flow:
+            self._send(_frame(MUX_FLOW, cid, flow))
+        self._wake()
+
+    # -- IO thread -----------------------------------------------------------------
+
+    def _io_loop(self):
+        while self._alive:
+            with self._lock:
+                closing = [(c.id, c.close_request) for c in self.channels.values() if c.close_request]
+            for cid, (notify, reason) in closing:
+                self._close_channel(cid, notify=notify, reason=reason)
+            with self._lock:
+                chans = list(self.channels.values())
+            rlist = [self._wake_r]
+            wlist = []
+            sendable = False
+            for chan in chans:
+                if not chan.eof and (chan.skipper or len(chan.out) < CHANNEL_WINDOW):
+                    rlist.append(chan.master_fd)
+                if chan.inq:
+                    wlist.append(chan.master_fd)
+                if chan.credit > 0 and chan.has_output():
+                    sendable = True
+            r, w, _ = select.select(rlist, wlist, [], 0 if sendable else 0.5)
+            if self._wake_r in r:
+                try:
+                    os.read(self._wake_r, 4096)
+                except BlockingIOError:
+                    pass
+            by_fd = {chan.master_fd: chan for chan in chans}
+            for fd in w:
+                chan = by_fd.get(fd)
+                if chan:
+                    self._drain_input(chan)
+            for fd in r:
+                chan = by_fd.get(fd)
+                if chan is None:
+                    continue
+                try:
+                    data = os.read(fd, 16384)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    data = b""
+                if not data:
+                    chan.eof = True
+                    continue
+                for tap in chan.taps:
+                    tap.write(data)
+                if chan.skipper:
+                    chan.skipper.push(data)
+                else:
+                    chan.out += data
+            for chan in chans:
+                if not chan.eof and chan.proc.poll() is not None and not chan.has_output():
+                    chan.eof = True
+            try:
+                self._send_round()
+            except OSError:
+                break
+
+    def _send_round(self):
+        """Send at most one quantum per channel, rotating the starting channel."""
+        with self._lock:
+            order = list(self._rr)
+            if self._rr:
+                self._rr.rotate(-1)
+        for cid in order:
+            chan = self.channels.get(cid)
+            if chan is None:
+                continue
+            if chan.skipper and chan.credit > 0:
+                # A screen frame is sent whole and may overdraw the credit
+                chunk = chan.skipper.pull(min(SEND_QUANTUM, chan.credit))
+                if chunk:
+                    chan.credit -= len(chunk)
+                    self._send(_frame(MUX_DATA, cid, chunk))
+            elif chan.out and chan.credit > 0:
+                n = min(SEND_QUANTUM, chan.credit, len(chan.out))
+                chunk = bytes(chan.out[:n])
+                del chan.out[:n]
+                chan.credit -= n
+                self._send(_frame(MUX_DATA, cid, chunk))
+            if chan.eof and not chan.has_output():
+                self._close_channel(cid)
+
+    def _drain_input(self, chan):
+        resume = False
+        with self._lock:
+            while chan.inq:
+                chunk = chan.inq[0]
+                try:
+                    n = os.write(chan.master_fd, chunk[:PTY_WRITE_CHUNK])
+                except BlockingIOError:
+                    break
+                except OSError:
+                    chan.inq.clear()
+                    chan.inq_bytes = 0
+                    break
+                chan.inq_bytes -= n
+                if n < len(chunk):
+                    chan.inq[0] = chunk[n:]
+                else:
+                    chan.inq.popleft()
+            if chan.paused and chan.inq_bytes <= INPUT_LOW_WATER:
+                chan.paused = False
+                resume = True
+        if resume:
+            self._send(_frame(MUX_FLOW, chan.id, b"\x00"))
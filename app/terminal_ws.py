@@ -14,6 +14,7 @@ specified sprite — same transport as `cs attach`.
 """
 
 import base64
+import collections
 import fcntl
 import hashlib
 import json
@@ -22,16 +23,45 @@ import pty
 import select
 import shutil
 import signal
+import socket
 import struct
 import subprocess
 import termios
 import threading
+import time
+
+from keepalive import registry
+from screen import FrameSkipper
 
 # RFC 6455 Section 4.2.2
 _WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
 
 TMUX_SESSION = os.environ.get("TMUX_SESSION_NAME", "workspace")
 
+# Input queue limits (bytes).  Past HIGH_WATER a protocol-2 client is told
+# to pause; it resumes below LOW_WATER.  Past HARD_LIMIT the WebSocket
+# reader itself waits, pushing back on the client through TCP.
+INPUT_HIGH_WATER = 256 * 1024
+INPUT_LOW_WATER = 64 * 1024
+INPUT_HARD_LIMIT = 1024 * 1024
+PTY_WRITE_CHUNK = 4096
+
+# Protocol 2 (/api/terminal?proto=2).  Client -> server frames are binary,
+# prefixed with a type byte so keystrokes are never parsed:
+#   0x00 <bytes>        input for the PTY
+#   0x01 <u16 cols><u16 rows>  resize (network byte order)
+#   0x02 <bytes>        ping; answered with {"type": "pong", "data": <hex>}
+# Server -> client binary frames are raw PTY output; text frames are JSON
+# control messages, e.g. {"type": "flow", "paused": true}.
+MSG_INPUT = 0x00
+MSG_RESIZE = 0x01
+MSG_PING = 0x02
+
+# Frame skipping for slow viewers (0 disables).  Once more than this many
+# bytes of output are waiting to be sent, the backlog is dropped and the
+# viewer is brought up to date with a screen snapshot instead (see screen.py).
+FRAME_SKIP_BYTES = int(os.environ.get("TERMINAL_FRAME_SKIP_BYTES", 0))
+
 
 # ---------------------------------------------------------------------------
 # WebSocket frame helpers
@@ -63,6 +93,7 @@ def ws_handshake(handler):
         "\r\n"
     )
     sock.sendall(response.encode("ascii"))
+    # Also clears the handler's request timeout: a terminal may be idle for hours
     sock.setblocking(True)
 
     handler.close_connection = True
@@ -71,13 +102,15 @@ def ws_handshake(handler):
 
 def _recv_exact(sock, n):
     """Read exactly *n* bytes from *sock*."""
-    buf = b""
-    while len(buf) < n:
-        chunk = sock.recv(n - len(buf))
-        if not chunk:
+    buf = bytearray(n)
+    view = memoryview(buf)
+    pos = 0
+    while pos < n:
+        got = sock.recv_into(view[pos:])
+        if not got:
             raise ConnectionError("WebSocket closed")
-        buf += chunk
-    return buf
+        pos += got
+    return bytes(buf)
 
 
 def ws_decode_frame(sock):
@@ -98,8 +131,10 @@ def ws_decode_frame(sock):
     mask_key = _recv_exact(sock, 4) if masked else None
     payload = _recv_exact(sock, length)
 
-    if mask_key:
-        payload = bytes(b ^ mask_key[i % 4] for i, b in enumerate(payload))
+    if mask_key and payload:
+        # XOR the whole payload as one big integer rather than byte by byte
+        mask = (mask_key * (length // 4 + 1))[:length]
+        payload = (int.from_bytes(payload, "big") ^ int.from_bytes(mask, "big")).to_bytes(length, "big")
 
     return opcode, payload
 
@@ -256,6 +291,68 @@ def build_command(sprite_name=None):
     return cmd, None
 
 
+# ---------------------------------------------------------------------------
+# PTY helpers
+# ---------------------------------------------------------------------------
+
+def spawn_pty(cmd):
+    """Start *cmd* on a new PTY.  Returns (non-blocking master_fd, Popen)."""
+    master_fd, slave_fd = pty.openpty()
+    try:
+        proc = subprocess.Popen(
+            cmd,
+            stdin=slave_fd,
+            stdout=slave_fd,
+            stderr=slave_fd,
+            start_new_session=True,
+            env=_build_env(),
+            close_fds=True,
+        )
+    except OSError:
+        os.close(master_fd)
+        raise
+    finally:
+        os.close(slave_fd)
+    os.set_blocking(master_fd, False)
+    return master_fd, proc
+
+
+def resize_pty(master_fd, proc, cols, rows):
+    """Send TIOCSWINSZ to the PTY and SIGWINCH to its process."""
+    try:
+        winsize = struct.pack("HHHH", int(rows), int(cols), 0, 0)
+        fcntl.ioctl(master_fd, termios.TIOCSWINSZ, winsize)
+        if proc and proc.poll() is None:
+            proc.send_signal(signal.SIGWINCH)
+    except (OSError, ProcessLookupError, ValueError):
+        pass
+
+
+def stop_pty(master_fd, proc):
+    """Terminate the client process (tmux client or sprite exec) and close the PTY.
+
+    The remote tmux session is left running for reconnect.
+    """
+    if proc:
+        try:
+            proc.terminate()
+        except OSError:
+            pass
+        try:
+            proc.wait(timeout=3)
+        except subprocess.TimeoutExpired:
+            try:
+                proc.kill()
+                proc.wait(timeout=1)
+            except OSError:
+                pass
+    if master_fd is not None:
+        try:
+            os.close(master_fd)
+        except OSError:
+            pass
+
+
 # ---------------------------------------------------------------------------
 # PTY Terminal Session
 # ---------------------------------------------------------------------------
@@ -269,14 +366,45 @@ class TerminalSession:
 
     Every browser tab sees the same tmux session. Disconnecting a tab
     just detaches — the session and any running commands persist.
+
+    *tap_factory(sprite_name)* returns optional observers (e.g.
+    recorder.Recorder) fed every chunk of PTY output via write(data),
+    resizes via resize(cols, rows), and closed with the session.  It is
+    called only once the PTY is up.  Taps must not block.
+
+    Input from the browser is queued and written to the (non-blocking) PTY
+    by the PTY thread in chunks, so a large paste into a program that is
+    not reading stdin never stalls the WebSocket reader.  With protocol 2
+    the queue's high/low water marks are signalled to the browser as
+    flow-control messages (see "Protocol 2" at the top of this module).
+
+    With TERMINAL_FRAME_SKIP_BYTES set, output goes through a FrameSkipper
+    drained by a separate sender thread, so the PTY thread never blocks in
+    sendall and a viewer that falls behind gets a screen frame instead of
+    the whole backlog.
     """
 
-    def __init__(self, sock, sprite_name=None):
+    def __init__(self, sock, sprite_name=None, tap_factory=None, protocol=1):
         self.sock = sock
         self.sprite_name = sprite_name
         self.master_fd = None
         self.proc = None
+        self.tap_factory = tap_factory or (lambda sprite_name: [])
+        self.taps = []
+        self.protocol = protocol
         self._alive = True
+        self._send_lock = threading.Lock()
+        self._input = collections.deque()
+        self._input_bytes = 0
+        self._input_paused = False
+        self._input_cond = threading.Condition()
+        self._wake_r = self._wake_w = None
+        self._wake_lock = threading.Lock()
+        self._threads = []
+        self.last_input = time.monotonic()
+        self.reap_reason = None
+        self._skipper = FrameSkipper(threshold=FRAME_SKIP_BYTES) if FRAME_SKIP_BYTES else None
+        self._out_cond = threading.Condition()
 
     def run(self):
         """Spawn terminal command in a PTY, bridge to WebSocket."""
@@ -294,60 +422,189 @@ class TerminalSession:
                 pass
             return
 
-        self.master_fd, slave_fd = pty.openpty()
-        env = _build_env()
-
         try:
-            self.proc = subprocess.Popen(
-                cmd,
-                stdin=slave_fd,
-                stdout=slave_fd,
-                stderr=slave_fd,
-                start_new_session=True,
-                env=env,
-                close_fds=True,
-            )
-        finally:
-            os.close(slave_fd)
+            self.master_fd, self.proc = spawn_pty(cmd)
+            self._wake_r, self._wake_w = os.pipe()
+            os.set_blocking(self._wake_r, False)
+            os.set_blocking(self._wake_w, False)
+            self.taps = list(self.tap_factory(self.sprite_name))
 
-        try:
-            self._bridge()
+            registry.register(self)
+            try:
+                self._bridge()
+            finally:
+                registry.unregister(self)
         finally:
             self._cleanup()
 
     def _bridge(self):
         """Two-thread bridge: PTY->WS and WS->PTY."""
-        writer_thread = threading.Thread(
-            target=self._ws_to_pty, daemon=True
-        )
-        writer_thread.start()
+        self._threads = [threading.Thread(target=self._ws_to_pty, daemon=True)]
+        if self._skipper:
+            self._threads.append(threading.Thread(target=self._send_output, daemon=True))
+        for t in self._threads:
+            t.start()
         self._pty_to_ws()
-        writer_thread.join(timeout=2)
+        for t in self._threads:
+            t.join(timeout=2)
+
+    def _wake(self):
+        """Wake the PTY thread's select().  A no-op once _cleanup() has closed the pipe."""
+        with self._wake_lock:
+            if self._wake_w is None:
+                return
+            try:
+                os.write(self._wake_w, b"\0")
+            except OSError:
+                pass    # BlockingIOError: a wakeup is already pending
+
+    def _send(self, frame):
+        """Send a complete frame; serialized so frames from both threads never interleave."""
+        with self._send_lock:
+            self.sock.sendall(frame)
+
+    def ping(self, payload):
+        """Send a WebSocket ping without blocking.  False if it could not be sent whole."""
+        if not self._send_lock.acquire(blocking=False):
+            return False  # another thread is mid-send (possibly stuck)
+        try:
+            frame = ws_encode_frame(payload, opcode=0x09)
+            sent = self.sock.send(frame, socket.MSG_DONTWAIT)
+        except (BlockingIOError, OSError):
+            return False
+        finally:
+            self._send_lock.release()
+        if sent != len(frame):
+            # Framing is now broken; nothing more can be sent on this socket
+            self.reap("send_error")
+            return False
+        return True
+
+    def reap(self, reason):
+        """Tear the session down from another thread (keepalive/idle reaper)."""
+        if self.reap_reason is None:
+            self.reap_reason = reason
+        self._alive = False
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._wake()
+
+    def _send_control(self, msg):
+        """Send a JSON control message to a protocol-2 client as a text frame."""
+        if self.protocol >= 2:
+            self._send(ws_encode_frame(json.dumps(msg).encode(), opcode=0x01))
 
     def _pty_to_ws(self):
-        """Forward PTY output to WebSocket."""
+        """Forward PTY output to WebSocket and drain queued input into the PTY."""
         try:
             while self._alive:
-                r, _, _ = select.select([self.master_fd], [], [], 0.5)
-                if not r:
+                wlist = [self.master_fd] if self._input else []
+                r, w, _ = select.select([self.master_fd, self._wake_r], wlist, [], 0.5)
+                if not r and not w:
                     if self.proc and self.proc.poll() is not None:
                         break
                     continue
+                if self._wake_r in r:
+                    try:
+                        os.read(self._wake_r, 4096)
+                    except BlockingIOError:
+                        pass
+                if w and not self._drain_input():
+                    break
+                if self.master_fd not in r:
+                    continue
                 try:
                     data = os.read(self.master_fd, 16384)
+                except BlockingIOError:
+                    continue
                 except OSError:
                     break
                 if not data:
                     break
+                for tap in self.taps:
+                    tap.write(data)
+                if self._skipper:
+                    self._skipper.push(data)
+                    with self._out_cond:
+                        self._out_cond.notify()
+                    continue
                 try:
-                    self.sock.sendall(ws_encode_frame(data, opcode=0x02))
+                    self._send(ws_encode_frame(data, opcode=0x02))
                 except (BrokenPipeError, ConnectionError, OSError):
                     break
         finally:
             self._alive = False
+            with self._input_cond:
+                self._input_cond.notify_all()
+            with self._out_cond:
+                self._out_cond.notify_all()
+
+    def _send_output(self):
+        """Sender thread for frame-skipping mode: drain the FrameSkipper to the WebSocket."""
+        try:
+            while self._alive:
+                with self._out_cond:
+                    if not self._skipper.pending():
+                        self._out_cond.wait(0.5)
+                        continue
+                data = self._skipper.pull()
+                if data:
+                    self._send(ws_encode_frame(data, opcode=0x02))
+        except (BrokenPipeError, ConnectionError, OSError):
+            pass
+        finally:
+            self._alive = False
+            self._wake()
+
+    def _drain_input(self):
+        """Write queued input to the PTY in chunks until it would block.  False on PTY error."""
+        resume = False
+        with self._input_cond:
+            while self._input:
+                chunk = self._input[0]
+                try:
+                    n = os.write(self.master_fd, chunk[:PTY_WRITE_CHUNK])
+                except BlockingIOError:
+                    break
+                except OSError:
+                    return False
+                self._input_bytes -= n
+                if n < len(chunk):
+                    self._input[0] = chunk[n:]
+                else:
+                    self._input.popleft()
+            if self._input_paused and self._input_bytes <= INPUT_LOW_WATER:
+                self._input_paused = False
+                resume = True
+            self._input_cond.notify_all()
+        if resume:
+            try:
+                self._send_control({"type": "flow", "paused": False})
+            except OSError:
+                pass
+        return True
+
+    def _enqueue_input(self, data):
+        """Queue keystrokes for the PTY thread; block only past the hard limit."""
+        if not data:
+            return
+        self.last_input = time.monotonic()
+        pause = False
+        with self._input_cond:
+            while self._alive and self._input_bytes >= INPUT_HARD_LIMIT:
+                self._input_cond.wait(0.5)
+            self._input.append(data)
+            self._input_bytes += len(data)
+            if not self._input_paused and self._input_bytes >= INPUT_HIGH_WATER:
+                self._input_paused = pause = True
+        self._wake()
+        if pause:
+            self._send_control({"type": "flow", "paused": True})
 
     def _ws_to_pty(self):
-        """Forward WebSocket input to PTY, handle resize messages."""
+        """Read WebSocket frames: queue input for the PTY, handle control messages."""
         try:
             while self._alive:
                 opcode, payload = ws_decode_frame(self.sock)
@@ -356,10 +613,18 @@ class TerminalSession:
                     break
                 if opcode == 0x09:  # ping -> pong
                     try:
-                        self.sock.sendall(ws_encode_frame(payload, opcode=0x0A))
+                        self._send(ws_encode_frame(payload, opcode=0x0A))
                     except OSError:
                         pass
                     continue
+                if opcode == 0x0A:  # pong for a keepalive ping
+                    registry.on_pong(self, payload)
+                    continue
+
+                if self.protocol >= 2:
+                    if opcode == 0x02 and payload:
+                        self._handle_v2(payload)
+                    continue
 
                 if opcode in (0x01, 0x02):
                     if opcode == 0x01:
@@ -368,29 +633,35 @@ class TerminalSession:
                             if msg.get("type") == "resize":
                                 self._resize(msg.get("cols", 80), msg.get("rows", 24))
                                 continue
-                        except (json.JSONDecodeError, UnicodeDecodeError):
+                        except (json.JSONDecodeError, UnicodeDecodeError, AttributeError):
                             pass
-
-                    try:
-                        os.write(self.master_fd, payload)
-                    except OSError:
-                        break
+                    self._enqueue_input(payload)
         except (ConnectionError, OSError):
             pass
         finally:
             self._alive = False
+            self._wake()
+
+    def _handle_v2(self, payload):
+        """Dispatch one protocol-2 binary frame by its type byte."""
+        kind = payload[0]
+        if kind == MSG_INPUT:
+            self._enqueue_input(payload[1:])
+        elif kind == MSG_RESIZE and len(payload) >= 5:
+            cols, rows = struct.unpack("!HH", payload[1:5])
+            self._resize(cols, rows)
+        elif kind == MSG_PING:
+            self._send_control({"type": "pong", "data": payload[1:].hex()})
 
     def _resize(self, cols, rows):
         """Send TIOCSWINSZ to the PTY."""
         if self.master_fd is None:
             return
-        try:
-            winsize = struct.pack("HHHH", int(rows), int(cols), 0, 0)
-            fcntl.ioctl(self.master_fd, termios.TIOCSWINSZ, winsize)
-            if self.proc and self.proc.poll() is None:
-                self.proc.send_signal(signal.SIGWINCH)
-        except (OSError, ProcessLookupError):
-            pass
+        resize_pty(self.master_fd, self.proc, cols, rows)
+        if self._skipper:
+            self._skipper.resize(cols, rows)
+        for tap in self.taps:
+            tap.resize(cols, rows)
 
     def _cleanup(self):
         """Clean up the client process and PTY.
@@ -400,27 +671,34 @@ class TerminalSession:
         """
         self._alive = False
 
-        if self.proc:
+        for tap in self.taps:
             try:
-                self.proc.terminate()
-            except OSError:
+                tap.close()
+            except Exception:
                 pass
-            try:
-                self.proc.wait(timeout=3)
-            except subprocess.TimeoutExpired:
-                try:
-                    self.proc.kill()
-                    self.proc.wait(timeout=1)
-                except OSError:
-                    pass
-            self.proc = None
+        self.taps = []
 
-        if self.master_fd is not None:
-            try:
-                os.close(self.master_fd)
-            except OSError:
-                pass
-            self.master_fd = None
+        stop_pty(self.master_fd, self.proc)
+        self.master_fd = self.proc = None
+
+        # Unblock the reader thread, and let both helper threads finish
+        # before the wake pipe goes (its fds could otherwise be reused)
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        with self._out_cond:
+            self._out_cond.notify_all()
+        for t in self._threads:
+            t.join(timeout=2)
+        with self._wake_lock:
+            for fd in (self._wake_r, self._wake_w):
+                if fd is not None:
+                    try:
+                        os.close(fd)
+                    except OSError:
+                        pass
+            self._wake_r = self._wake_w = None
 
         try:
             self.sock.close()
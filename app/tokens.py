@@ -7,12 +7,15 @@ and can be overridden by environment variables at runtime.
 
 import fcntl
 import json
+import os
+from contextlib import contextmanager
 from pathlib import Path
 
 
 class TokenStore:
     def __init__(self, path):
         self._path = Path(path)
+        self._lock_path = self._path.with_name(self._path.name + ".lock")
         self._path.parent.mkdir(parents=True, exist_ok=True)
 
     def _read(self):
@@ -26,27 +29,39 @@ class TokenStore:
                 fcntl.flock(f, fcntl.LOCK_UN)
 
     def _write(self, data):
+        """Replace the file atomically so readers never see a partial write."""
         self._path.parent.mkdir(parents=True, exist_ok=True)
-        with open(self._path, "w") as f:
-            fcntl.flock(f, fcntl.LOCK_EX)
+        tmp = self._path.with_name(f".{self._path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=2)
+            f.write("\n")
+        os.replace(tmp, self._path)
+
+    @contextmanager
+    def _locked(self):
+        """Hold the store's lock across a read-modify-write (shared by all workers)."""
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self._lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
             try:
-                json.dump(data, f, indent=2)
-                f.write("\n")
+                yield
             finally:
-                fcntl.flock(f, fcntl.LOCK_UN)
+                fcntl.flock(lock, fcntl.LOCK_UN)
 
     def get(self, key):
         return self._read().get(key, "")
 
     def set(self, key, value):
-        data = self._read()
-        data[key] = value
-        self._write(data)
+        with self._locked():
+            data = self._read()
+            data[key] = value
+            self._write(data)
 
     def get_all(self):
         return self._read()
 
     def set_many(self, updates):
-        data = self._read()
-        data.update(updates)
-        self._write(data)
+        with self._locked():
+            data = self._read()
+            data.update(updates)
+            self._write(data)
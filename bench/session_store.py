@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Session store benchmark: JSON file vs SQLite (SESSION_STORE=json|sqlite).
+
+Fills each store with --sessions sessions, then measures:
+
+  touch          touch() latency from one thread (p50/p99, ops/s)
+  touch-procs    touch() throughput with --procs processes writing at once
+  get / list     single-session read and full listing
+  recent / idle  recent(20) and idle(1 hour)
+  activity       client_activity() over everything
+  sync           sync() with 8 live tmux sessions (every /api/status does this)
+
+Output is JSON on stdout; a summary line per measurement goes to stderr.
+
+Usage: python3 bench/session_store.py [--sessions 10000] [--touches 300] [--procs 4]
+"""
+
+import argparse
+import json
+import multiprocessing
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+import session  # noqa: E402
+
+CLIENTS = ("dashboard", "terminal", "cli", "mobile")
+
+
+def timed(fn, repeat):
+    """Per-call latencies of *repeat* calls of fn(i), in ms."""
+    out = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        fn(i)
+        out.append((time.perf_counter() - started) * 1000)
+    return out
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    return {
+        "calls": len(latencies),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 3),
+        "ops_per_s": round(len(latencies) / (sum(latencies) / 1000), 1),
+    }
+
+
+def fill(engine, directory, sessions, rng):
+    """Create the store with *sessions* sessions the way the engine would hold them after use."""
+    store = session.open_store(directory, engine)
+    now = time.time()
+    names = [f"session-{i}" for i in range(sessions)]
+    if engine == "json":
+        data = {"version": 1, "sessions": {}}
+        for name in names:
+            at = session.datetime.fromtimestamp(now - rng.uniform(0, 30 * 86400), session.timezone.utc).isoformat()
+            data["sessions"][name] = {"name": name, "created_at": at, "last_accessed_at": at,
+                                      "last_client": rng.choice(CLIENTS), "state": "idle"}
+        with store._locked():
+            store._write(data)
+    else:
+        with store._transaction() as db:
+            for name in names:
+                client = rng.choice(CLIENTS)
+                events = sorted(now - rng.uniform(0, 30 * 86400) for _ in range(rng.randint(1, 10)))
+                db.execute("INSERT INTO sessions (name, created_at, last_accessed_at, last_client, state) "
+                           "VALUES (?, ?, ?, ?, 'idle')", (name, events[0], events[-1], client))
+                db.executemany("INSERT INTO access_events (session, client, at) VALUES (?, ?, ?)",
+                               [(name, client, at) for at in events])
+    return store, names
+
+
+def _touch_worker(args):
+    engine, directory, names, touches, seed = args
+    store = session.open_store(directory, engine)
+    rng = random.Random(seed)
+    for _ in range(touches):
+        store.touch(rng.choice(names), rng.choice(CLIENTS))
+    return touches
+
+
+def run_engine(engine, args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory(prefix=f"session-bench-{engine}-") as directory:
+        started = time.perf_counter()
+        store, names = fill(engine, directory, args.sessions, rng)
+        result = {"fill_s": round(time.perf_counter() - started, 2)}
+
+        result["touch"] = summarize(timed(lambda i: store.touch(rng.choice(names), rng.choice(CLIENTS)),
+                                          args.touches))
+        per_proc = max(1, args.touches // args.procs)
+        started = time.perf_counter()
+        with multiprocessing.Pool(args.procs) as pool:
+            done = sum(pool.map(_touch_worker, [(engine, directory, names, per_proc, args.seed + p)
+                                                for p in range(args.procs)]))
+        elapsed = time.perf_counter() - started
+        result["touch-procs"] = {"procs": args.procs, "calls": done, "ops_per_s": round(done / elapsed, 1)}
+
+        result["get"] = summarize(timed(lambda i: store.get(rng.choice(names)), args.touches))
+        result["list"] = summarize(timed(lambda i: store.list(), 20))
+        result["recent"] = summarize(timed(lambda i: store.recent(20), 50))
+        result["idle"] = summarize(timed(lambda i: store.idle(3600), 50))
+        result["activity"] = summarize(timed(lambda i: store.client_activity(), 20))
+        live = [{"name": name} for name in names[:8]]
+        result["sync"] = summarize(timed(lambda i: store.sync(live), 50))
+
+        files = [p for p in Path(directory).iterdir() if p.is_file()]
+        result["disk_bytes"] = sum(p.stat().st_size for p in files)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--touches", type=int, default=300)
+    parser.add_argument("--procs", type=int, default=4)
+    parser.add_argument("--engines", default="json,sqlite")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    results = {}
+    for engine in [e.strip() for e in args.engines.split(",") if e.strip()]:
+        results[engine] = run_engine(engine, args)
+        for name, m in results[engine].items():
+            if isinstance(m, dict):
+                p50 = f"p50 {m['p50_ms']:>8.3f} ms  " if "p50_ms" in m else " " * 21
+                print(f"{engine:<7} {name:<12} {p50}{m['ops_per_s']:>10.1f} ops/s", file=sys.stderr)
+    json.dump({"config": vars(args), "results": results}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the `sprite` CLI, for benchmarking cs without a sprite.
+
+Linked (or copied) as `sprite` into a directory early on PATH, it runs
+`sprite exec -s <name> -- <cmd...>` as a local process whose HOME and
+working directory are SPRITE_SHIM_ROOT/<name>/home, with stdin and stdout
+passed through a shaped link:
+
+  SPRITE_SHIM_BANDWIDTH   bytes/s each way, with k/M/G suffixes (0 = unlimited)
+  SPRITE_SHIM_RTT_MS      round-trip time; each exec waits one RTT before the
+                          command starts and half of one after its output ends
+  SPRITE_SHIM_LOG         append one JSON line per exec: sprite, command,
+                          bytes_up (stdin), bytes_down (stdout), wall_ms, exit
+
+`sprite api /v1/sprites` lists the directories under SPRITE_SHIM_ROOT as
+running sprites; other subcommands are not supported.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+CHUNK = 64 * 1024
+_SUFFIXES = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+
+
+def parse_size(value):
+    value = (value or "0").strip().lower().rstrip("b")
+    if value and value[-1] in _SUFFIXES:
+        return int(float(value[:-1]) * _SUFFIXES[value[-1]])
+    return int(float(value or 0))
+
+
+ROOT = os.path.abspath(os.environ.get("SPRITE_SHIM_ROOT", "/tmp/sprite-shim"))
+BANDWIDTH = parse_size(os.environ.get("SPRITE_SHIM_BANDWIDTH", "0"))
+RTT = float(os.environ.get("SPRITE_SHIM_RTT_MS", 0)) / 1000
+LOG = os.environ.get("SPRITE_SHIM_LOG")
+
+
+def pump(src_fd, dst_fd, counter, key):
+    """Copy src -> dst at no more than BANDWIDTH bytes/s, counting bytes; closes dst."""
+    started = time.monotonic()
+    moved = 0
+    try:
+        while True:
+            data = os.read(src_fd, CHUNK)
+            if not data:
+                break
+            if BANDWIDTH:
+                delay = started + (moved + len(data)) / BANDWIDTH - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            view = memoryview(data)
+            while view:
+                n = os.write(dst_fd, view)
+                view = view[n:]
+            moved += len(data)
+    except (BrokenPipeError, OSError):
+        pass    # the other side went away; the byte count is what got through
+    finally:
+        counter[key] = moved
+        try:
+            os.close(dst_fd)
+        except OSError:
+            pass
+
+
+def cmd_exec(argv):
+    sprite = None
+    while argv and argv[0] != "--":
+        opt = argv.pop(0)
+        if opt in ("-s", "--sprite") and argv:
+            sprite = argv.pop(0)
+        elif opt in ("-o", "--org") and argv:
+            argv.pop(0)
+        elif opt.startswith("-"):
+            continue    # -tty and friends
+        else:
+            argv.insert(0, opt)
+            break
+    if argv and argv[0] == "--":
+        argv.pop(0)
+    if not sprite or not argv:
+        print("usage: sprite exec -s <name> -- <command...>", file=sys.stderr)
+        return 2
+
+    home = os.path.join(ROOT, sprite, "home")
+    os.makedirs(home, exist_ok=True)
+    env = dict(os.environ, HOME=home, PWD=home)
+    started = time.monotonic()
+    time.sleep(RTT)
+
+    proc = subprocess.Popen(argv, cwd=home, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    counter = {}
+    threads = [
+        threading.Thread(target=pump, args=(sys.stdin.fileno(), os.dup(proc.stdin.fileno()), counter, "up")),
+        threading.Thread(target=pump, args=(proc.stdout.fileno(), os.dup(sys.stdout.fileno()), counter, "down")),
+    ]
+    proc.stdin.close()
+    for t in threads:
+        t.daemon = True
+        t.start()
+    threads[1].join()
+    code = proc.wait()
+    threads[0].join(timeout=0.1)    # stdin may stay open after the command exits
+    time.sleep(RTT / 2)
+
+    if LOG:
+        with open(LOG, "a") as f:
+            f.write(json.dumps({
+                "sprite": sprite,
+                "command": argv[:3],
+                "bytes_up": counter.get("up", 0),
+                "bytes_down": counter.get("down", 0),
+                "wall_ms": round((time.monotonic() - started) * 1000, 1),
+                "exit": code,
+            }) + "\n")
+    return code
+
+
+def cmd_api(argv):
+    path = next((a for a in argv if a.startswith("/")), "")
+    if path.rstrip("/") != "/v1/sprites":
+        print(f"sprite shim: unsupported api path {path!r}", file=sys.stderr)
+        return 1
+    names = sorted(os.listdir(ROOT)) if os.path.isdir(ROOT) else []
+    print(json.dumps({"sprites": [{"name": n, "status": "running"} for n in names]}))
+    return 0
+
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        print("usage: sprite <exec|api> ...", file=sys.stderr)
+        return 2
+    if args[0] == "exec":
+        return cmd_exec(args[1:])
+    if args[0] == "api":
+        return cmd_api(args[1:])
+    print(f"sprite shim: '{args[0]}' is not supported", file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
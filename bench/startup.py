@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Dashboard startup benchmark.
+
+Starts app/server.py repeatedly on a free port and measures, from process
+start:
+
+  listen   first successful TCP connect
+  health   first 200 from GET /health
+  api      first 200 from GET /api/config (full server up)
+
+once with the fast-start responder (default) and once with
+DASHBOARD_FAST_START=0, then reports how long importing the server module
+takes and which of its imports are the most expensive (python -X importtime).
+
+Usage: python3 bench/startup.py [--runs N]
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+SERVER = APP_DIR / "server.py"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def http_get(port, path):
+    """Return the status code of GET *path*, or None if not connectable yet."""
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=5) as s:
+            s.sendall(f"GET {path} HTTP/1.0\r\nHost: localhost\r\n\r\n".encode())
+            line = s.makefile("rb").readline()
+    except OSError:
+        return None
+    parts = line.split()
+    return int(parts[1]) if len(parts) >= 2 else None
+
+
+def connectable(port):
+    try:
+        socket.create_connection(("127.0.0.1", port), timeout=1).close()
+        return True
+    except OSError:
+        return False
+
+
+def wait_for(check, started, timeout=10.0):
+    while time.perf_counter() - started < timeout:
+        if check():
+            return (time.perf_counter() - started) * 1000
+        time.sleep(0.0005)
+    return float("nan")
+
+
+def run_once(fast_start):
+    port = free_port()
+    env = dict(os.environ, WEBAPP_PORT=str(port), DASHBOARD_FAST_START="1" if fast_start else "0")
+    env.pop("DASHBOARD_WORKERS", None)
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, str(SERVER)], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        listen = wait_for(lambda: connectable(port), started)
+        health = wait_for(lambda: http_get(port, "/health") == 200, started)
+        api = wait_for(lambda: http_get(port, "/api/config") == 200, started)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return listen, health, api
+
+
+def import_profile(top=10):
+    """Total import time of the server module and its costliest imports (ms)."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=APP_DIR, capture_output=True, text=True,
+    ).stderr
+    rows = []
+    for line in out.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        rows.append((int(cumulative_us), name.rstrip()))
+    total = next((c for c, n in rows if n.strip() == "server"), 0)
+    # Direct imports of server.py are indented by exactly two spaces
+    direct = sorted((r for r in rows if r[1].startswith("   ") and not r[1].startswith("    ")),
+                    reverse=True)
+    return total / 1000, [(n.strip(), c / 1000) for c, n in direct[:top]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'mode':<12} {'listen ms':>10} {'health ms':>10} {'api ms':>10}   (median of {args.runs})")
+    for fast_start in (True, False):
+        results = [run_once(fast_start) for _ in range(args.runs)]
+        medians = [statistics.median(r[i] for r in results) for i in range(3)]
+        label = "fast-start" if fast_start else "plain"
+        print(f"{label:<12} {medians[0]:>10.1f} {medians[1]:>10.1f} {medians[2]:>10.1f}")
+
+    total, direct = import_profile()
+    print(f"\nimport server: {total:.1f} ms (deferred modules load on first use)")
+    for name, ms in direct:
+        print(f"  {name:<24} {ms:>7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
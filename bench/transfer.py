@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+cs transfer benchmark against a local sprite stand-in.
+
+Puts bench/sprite_shim.py on PATH as `sprite` (a temporary directory plays
+the sprite's home, behind a link shaped to --bandwidth and --rtt-ms),
+generates test data and times the cs transfer commands:
+
+  sync-repo       cs sync <repo>            repo-shaped tree of --files files
+  sync-binary     cs sync <assets repo>     one --binary-mb MiB binary, tracked in git
+  cp-push         cs cp <binary> :~/incoming/
+  cp-pull         cs cp :~/incoming/<binary> <dir>
+  pull-repo       cs pull ~/<repo> <dir>
+  context-push    cs context push           --history-lines history.jsonl lines
+                                            plus session transcripts
+  context-pull    cs context pull
+
+Each result reports wall time, bytes sent to and received from the
+"sprite", the number of exec round trips, and whether the data arrived
+intact.  Output is JSON on stdout.
+
+Usage: python3 bench/transfer.py [--bandwidth 20M] [--rtt-ms 40] [--files 2000]
+                                 [--binary-mb 64] [--history-lines 200000]
+                                 [--only NAME[,NAME]] [--keep]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+CS = BENCH_DIR.parent / "cli" / "cs"
+SHIM = BENCH_DIR / "sprite_shim.py"
+SPRITE = "bench"
+
+_EXTENSIONS = (".py", ".ts", ".tsx", ".js", ".go", ".rs", ".md", ".json", ".yaml", ".css", ".html")
+_WORDS = ("def", "return", "const", "import", "from", "self", "value", "config", "request",
+          "handler", "error", "result", "if", "else", "for", "while", "async", "await", "None")
+
+
+# ---------------------------------------------------------------------------
+# Data generation
+# ---------------------------------------------------------------------------
+
+def _git(repo, *args):
+    subprocess.run(["git", "-C", str(repo), *args], check=True, stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL)
+
+
+def _commit_all(repo):
+    _git(repo, "init", "-q")
+    _git(repo, "add", "-A")
+    _git(repo, "-c", "user.name=bench", "-c", "user.email=bench@localhost",
+         "commit", "-q", "-m", "bench data")
+
+
+def make_repo(path, files, rng):
+    """A source tree: nested package directories of text files with a long-tailed size mix."""
+    path.mkdir(parents=True)
+    dirs = [path]
+    for i in range(max(1, files // 12)):
+        parent = rng.choice(dirs)
+        if len(parent.relative_to(path).parts) < 5:
+            d = parent / f"pkg{i}"
+            d.mkdir()
+            dirs.append(d)
+    for i in range(files):
+        size = min(int(rng.lognormvariate(8.0, 1.1)), 512 * 1024)   # median ~3 KB
+        words = []
+        length = 0
+        while length < size:
+            line = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(2, 12)))
+            words.append("    " * rng.randint(0, 3) + line)
+            length += len(words[-1]) + 1
+        target = rng.choice(dirs) / f"file{i}{rng.choice(_EXTENSIONS)}"
+        target.write_text("\n".join(words) + "\n")
+    (path / "node_modules").mkdir()
+    (path / "node_modules" / "ignored.js").write_text("ignored\n")
+    (path / ".gitignore").write_text("node_modules/\n")
+    _commit_all(path)
+
+
+def make_binary(path, mib):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        for _ in range(mib):
+            f.write(os.urandom(1024 * 1024))
+
+
+def _encode(path):
+    """Project directory name under ~/.claude/projects (as cs computes it)."""
+    return str(path).replace("/", "-")
+
+
+def make_context(home, project, history_lines, rng):
+    """~/.claude/history.jsonl (half of it for *project*) and session transcripts."""
+    claude = home / ".claude"
+    sessions = claude / "projects" / _encode(project)
+    sessions.mkdir(parents=True)
+    session_ids = [f"{rng.getrandbits(64):016x}" for _ in range(20)]
+    for sid in session_ids:
+        with open(sessions / f"{sid}.jsonl", "w") as f:
+            for n in range(500):
+                f.write(json.dumps({"sessionId": sid, "n": n, "type": "message",
+                                    "text": " ".join(rng.choice(_WORDS) for _ in range(60))}) + "\n")
+    with open(claude / "history.jsonl", "w") as f:
+        for n in range(history_lines):
+            f.write(json.dumps({
+                "display": " ".join(rng.choice(_WORDS) for _ in range(rng.randint(3, 30))),
+                "timestamp": 1700000000000 + n,
+                "projectPath": str(project) if n % 2 else "/elsewhere/other-project",
+                "sessionId": rng.choice(session_ids),
+            }) + "\n")
+
+
+# ---------------------------------------------------------------------------
+# Verification
+# ---------------------------------------------------------------------------
+
+def tree_digest(root, exclude=(".git", "node_modules")):
+    """(file count, digest of relative paths and contents) for a directory or single file."""
+    root = Path(root)
+    if root.is_file():
+        return 1, hashlib.sha256(root.read_bytes()).hexdigest()
+    h = hashlib.sha256()
+    count = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in exclude)
+        for name in sorted(filenames):
+            p = Path(dirpath) / name
+            h.update(str(p.relative_to(root)).encode() + b"\0")
+            with open(p, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+            count += 1
+    return count, h.hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+class Bench:
+    def __init__(self, work, bandwidth, rtt_ms):
+        self.work = work
+        self.local_home = work / "local"
+        self.shim_root = work / "sprites"
+        self.remote_home = self.shim_root / SPRITE / "home"
+        self.log = work / "exec.log"
+        bin_dir = work / "bin"
+        bin_dir.mkdir(parents=True)
+        (bin_dir / "sprite").symlink_to(SHIM)
+        self.remote_home.mkdir(parents=True)
+        self.local_home.mkdir()
+        self.env = dict(
+            os.environ,
+            HOME=str(self.local_home),
+            PATH=f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+            NO_COLOR="1",
+            CS_SPRITE_NAME=SPRITE,
+            SPRITE_SHIM_ROOT=str(self.shim_root),
+            SPRITE_SHIM_BANDWIDTH=str(bandwidth),
+            SPRITE_SHIM_RTT_MS=str(rtt_ms),
+            SPRITE_SHIM_LOG=str(self.log),
+        )
+        self.env.pop("CS_ORG", None)
+
+    def run(self, name, args, cwd=None, verify=None):
+        self.log.unlink(missing_ok=True)
+        started = time.perf_counter()
+        proc = subprocess.run(["bash", str(CS), *args], cwd=cwd or self.local_home, env=self.env,
+                              stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.PIPE, text=True)
+        wall = time.perf_counter() - started
+        execs = []
+        if self.log.exists():
+            execs = [json.loads(line) for line in self.log.read_text().splitlines()]
+        result = {
+            "command": name,
+            "cs": " ".join(["cs", *args]).replace(str(self.work), "$WORK"),
+            "wall_s": round(wall, 3),
+            "bytes_sent": sum(e["bytes_up"] for e in execs),
+            "bytes_received": sum(e["bytes_down"] for e in execs),
+            "round_trips": len(execs),
+            "exec_wall_s": round(sum(e["wall_ms"] for e in execs) / 1000, 3),
+            "exit": proc.returncode,
+        }
+        if verify is not None:
+            try:
+                result["ok"] = proc.returncode == 0 and verify()
+            except OSError:
+                result["ok"] = False
+        if proc.returncode != 0:
+            result["stderr"] = proc.stderr.strip().splitlines()[-3:]
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--bandwidth", default="20M", help="bytes/s each way, k/M/G suffixes (0 = unlimited)")
+    parser.add_argument("--rtt-ms", type=float, default=40)
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--binary-mb", type=int, default=64)
+    parser.add_argument("--history-lines", type=int, default=200000)
+    parser.add_argument("--only", default="", help="comma-separated command names")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", action="store_true", help="keep the work directory")
+    args = parser.parse_args()
+
+    for tool in ("git", "tar", "bash"):
+        if not shutil.which(tool):
+            sys.exit(f"{tool} is required")
+    only = {n.strip() for n in args.only.split(",") if n.strip()}
+    rng = random.Random(args.seed)
+    work = Path(tempfile.mkdtemp(prefix="cs-transfer-"))
+    try:
+        bench = Bench(work, args.bandwidth, args.rtt_ms)
+        projects = bench.local_home / "work"
+        repo = projects / "repo"
+        assets = projects / "assets"
+        binary = assets / "model.bin"
+
+        gen_started = time.perf_counter()
+        make_repo(repo, args.files, rng)
+        make_binary(binary, args.binary_mb)
+        _commit_all(assets)
+        make_context(bench.local_home, repo, args.history_lines, rng)
+        generate_s = time.perf_counter() - gen_started
+
+        remote = bench.remote_home
+        pulled = work / "pulled"
+        cases = [
+            ("sync-repo", ["sync", str(repo), SPRITE], None,
+             lambda: tree_digest(remote / "repo") == tree_digest(repo)),
+            ("sync-binary", ["sync", str(assets), SPRITE], None,
+             lambda: tree_digest(remote / "assets") == tree_digest(assets)),
+            ("cp-push", ["cp", str(binary), ":~/incoming/"], None,
+             lambda: tree_digest(remote / "incoming" / binary.name) == tree_digest(binary)),
+            ("cp-pull", ["cp", f":~/incoming/{binary.name}", str(pulled / "cp")], None,
+             lambda: tree_digest(pulled / "cp" / binary.name) == tree_digest(binary)),
+            ("pull-repo", ["pull", "~/repo", str(pulled / "repo"), SPRITE], None,
+             lambda: tree_digest(pulled / "repo" / "repo") == tree_digest(repo)),
+            ("context-push", ["context", "push", SPRITE], repo,
+             lambda: (remote / ".claude" / "history.jsonl").stat().st_size > 0),
+            ("context-pull", ["context", "pull", SPRITE], repo,
+             lambda: tree_digest(bench.local_home / ".claude" / "projects" / _encode(repo))
+             == tree_digest(remote / ".claude" / "projects" / _encode(remote / "repo"))),
+        ]
+        (pulled / "repo").mkdir(parents=True)
+        results = []
+        for name, cs_args, cwd, verify in cases:
+            if only and name not in only:
+                continue
+            results.append(bench.run(name, cs_args, cwd=cwd, verify=verify))
+            print(f"{name:<14} {results[-1]['wall_s']:>8.2f} s  "
+                  f"{results[-1]['round_trips']:>3} execs", file=sys.stderr)
+
+        json.dump({
+            "config": {
+                "bandwidth": args.bandwidth,
+                "rtt_ms": args.rtt_ms,
+                "files": args.files,
+                "binary_mb": args.binary_mb,
+                "history_lines": args.history_lines,
+                "history_bytes": (bench.local_home / ".claude" / "history.jsonl").stat().st_size,
+                "generate_s": round(generate_s, 2),
+            },
+            "results": results,
+        }, sys.stdout, indent=2)
+        print()
+    finally:
+        if args.keep:
+            print(f"work directory kept: {work}", file=sys.stderr)
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
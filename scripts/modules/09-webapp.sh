@@ -54,6 +54,8 @@ register_sprite_webapp() {
 register_systemd_webapp() {
     local unit_src="${PROJECT_ROOT}/systemd/webapp.service"
     local unit_dst="/etc/systemd/system/webapp.service"
+    local socket_src="${PROJECT_ROOT}/systemd/webapp.socket"
+    local socket_dst="/etc/systemd/system/webapp.socket"
 
     if [[ ! -f "$unit_src" ]]; then
         log_error "Unit file not found: ${unit_src}"
@@ -61,7 +63,15 @@ register_systemd_webapp() {
     fi
 
     cp "$unit_src" "$unit_dst"
+    # Socket activation: systemd holds the port; the server inherits it
+    if [[ -f "$socket_src" ]]; then
+        sed "s/^ListenStream=.*/ListenStream=${WEBAPP_PORT}/" "$socket_src" > "$socket_dst"
+    fi
     systemctl daemon-reload
+    if [[ -f "$socket_dst" ]]; then
+        systemctl enable webapp.socket
+        systemctl start webapp.socket
+    fi
     systemctl enable webapp
     systemctl start webapp
     log_info "Installed and started systemd service: webapp (port ${WEBAPP_PORT})"